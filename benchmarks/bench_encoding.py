@@ -0,0 +1,167 @@
+'''
+    Times the batched clause encoder in satmap.generateAndWriteClauses against the
+    literal-at-a-time reference encoder it replaced, which numbered every variable
+    family densely over all pairs of physical qubits.
+
+    $ python3 benchmarks/bench_encoding.py examples/4mod5-v1_23.qasm --arch tokyo --k 25
+
+    Peak RSS is per process, so compare --mirror settings in separate runs.
+    --cardinality all compares the sizes of the at-most-one encodings:
+
+    $ python3 benchmarks/bench_encoding.py examples/4mod5-v1_23.qasm --arch grid_36 --cardinality all --skip_reference
+'''
+import argparse
+import itertools
+import math
+import os
+import resource
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import architectures
+import program
+import satmap
+from satmap import composeSwaps
+
+
+## Reference (literal-at-a-time) encoder ##
+
+def denseIndex(lit, physNum, logNum, numCnots, swapNum):
+    numX = numCnots * logNum * physNum
+    numP = physNum * physNum * numCnots
+    numS = numCnots * physNum * physNum * swapNum
+    (offset, shape) = {"p" : (0, (physNum, physNum, numCnots)),
+                       "r" : (numP, (physNum, physNum, numCnots)),
+                       "x" : (2*numP, (physNum, logNum, numCnots)),
+                       "s" : (2*numP + numX, (physNum, physNum, swapNum, numCnots)),
+                       "b" : (2*numP + numX + numS, (physNum * physNum, swapNum, numCnots))}[lit[1]]
+    pos = np.ravel_multi_index(lit[2:], shape) + offset + 1
+    return -pos if lit[0] else pos
+
+def writeHardClause(f, top, clause, *dims):
+    f.write(str(top))
+    f.write(" ")
+    for lit in clause:
+        f.write(str(denseIndex(lit, *dims)))
+        f.write(" ")
+    f.write("0\n")
+
+def writeSoftClause(f, clause, *dims):
+    writeHardClause(f, int(clause[0]), clause[1], *dims)
+
+def referenceGenerateAndWriteClauses(logNum, cnots, cm, swapNum, path, calibrationData=None):
+    physNum = len(cm)
+    numCnots = len(cnots)
+    layers = list(range(numCnots))
+    liveLog = range(logNum)
+    top = numCnots * physNum * physNum * swapNum + physNum * physNum * numCnots + 1
+    dims = (physNum, logNum, numCnots, swapNum)
+    with open(path, "w") as f:
+        f.write("p wcnf " + str(42) + " " + str(42) + " " + str(top) + "\n")
+        for k in range(numCnots):
+            for j in liveLog:
+                atLeastOneJ = []
+                for i in range(physNum):
+                    atLeastOneJ.append((False,"x", i,j,k))
+                    for i2 in range(i):
+                        writeHardClause(f, top, [(True, "x", i2, j, k), (True,"x", i,j,k)], *dims)
+                writeHardClause(f, top, atLeastOneJ, *dims)
+        for i in range(physNum):
+            for j in liveLog:
+                for k in range(numCnots):
+                    for j2 in range(j):
+                        writeHardClause(f, top, [(True, "x", i, j2, k), (True,"x",i,j,k)], *dims)
+        for k in range(numCnots):
+            (c,t) = cnots[k]
+            edgeUsed = []
+            for [u,v] in np.argwhere(cm>0):
+                edgeUsed.append((False, "p", u, v, k))
+                edgeUsed.append((False, "r",  u, v, k))
+                for clause in [[(False, "x", u, c, k), (True, "p", u, v, k)], [(False, "x", v, t, k), (True, "p", u, v, k)],
+                               [(False, "x", u, t, k), (True, "r", u, v, k)], [(False, "x", v, c, k), (True, "r", u, v, k)]]:
+                    writeHardClause(f, top, clause, *dims)
+            writeHardClause(f, top, edgeUsed, *dims)
+        allowedSwaps = np.append(np.argwhere(cm>0), [[0,0]], axis=0)
+        for k in layers:
+            for t in range(swapNum):
+                atLeastOne = []
+                for (u,v) in allowedSwaps:
+                    atLeastOne.append((False, "s", u, v, t, k))
+                    writeHardClause(f, top, [(False, "b", 0, t, k), (True,"b", 1, t, k)], *dims)
+                writeHardClause(f, top, atLeastOne, *dims)
+        for swapSeq in itertools.product(allowedSwaps, repeat=swapNum):
+            for k in range(1, len(layers)):
+                swapLits = [(True, "s", u, v, t, layers[k]) for (t, [u,v]) in enumerate(swapSeq)]
+                for i in range(physNum):
+                    for j in liveLog:
+                        writeHardClause(f, top, swapLits + [(False, "x", i, j, k-1), (True, "x", composeSwaps(swapSeq, physNum)[i], j, k)], *dims)
+                        writeHardClause(f, top, swapLits + [(True, "x", i, j, k-1), (False, "x", composeSwaps(swapSeq, physNum)[i], j, k)], *dims)
+        if calibrationData:
+            edges = np.argwhere(cm>0)
+            for k in range(numCnots):
+                for i in range(len(edges)):
+                    [u, v] = edges[i]
+                    success_rate = 1-calibrationData[i]
+                    writeSoftClause(f, (-1000*math.log(success_rate), [(True, "p", u, v, k)]), *dims)
+                    writeSoftClause(f, (-1000*math.log(success_rate), [(True, "r", u, v, k)]), *dims)
+                    for t in range(swapNum):
+                        writeSoftClause(f, (-3000*math.log(success_rate), [(True, "s", u, v, t, k)]), *dims)
+        else:
+            for k in range(numCnots):
+                for t in range(swapNum):
+                    for (u,v) in itertools.product(range(physNum), repeat=2):
+                        if u != v:
+                            writeSoftClause(f, (1, [(True, "s", u, v, t, k)]), *dims)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("prog", help="path to input program file")
+    parser.add_argument("-a", "--arch", default="tokyo", choices=["tokyo", "toronto", "grid_36", "circle_36", "aspen_11_38"], help="name of qc architecture")
+    parser.add_argument("--k", type=int, default=25, help="number of CNOTs in the encoded slice")
+    parser.add_argument("--swaps", type=int, default=1, help="swaps allowed before each CNOT")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs of the batched encoder")
+    parser.add_argument("--mirror", default="lazy", choices=["eager", "lazy", "off"], help="how the hard clause mirror solver is built")
+    parser.add_argument("--swap_encoding", default="sequence", choices=["sequence", "stepwise"], help="swap effect encoding of the batched encoder")
+    parser.add_argument("--cardinality", default="pairwise", choices=satmap.ENCODINGS + ["all"], help="at-most-one encoding of the batched encoder")
+    parser.add_argument("--skip_reference", action="store_true", help="only time the batched encoder")
+    args = parser.parse_args()
+
+    cm = architectures.named(args.arch)
+    prog = program.load(args.prog)
+    cnots = prog.cnots()[:args.k]
+    logNum = prog.logNum
+    with tempfile.TemporaryDirectory() as tmp:
+        batched = os.path.join(tmp, "batched.wcnf")
+        for cardinality in (satmap.ENCODINGS if args.cardinality == "all" else [args.cardinality]):
+            satmap.templateCache.clear()
+            times = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                (mirror, registry) = satmap.generateAndWriteClauses(logNum, cnots, cnots, cm, args.swaps, [], batched, mirror=args.mirror, swapEncoding=args.swap_encoding, cardinality=cardinality)
+                times.append(time.perf_counter() - start)
+                if mirror:
+                    mirror.delete()
+            with open(batched) as f:
+                numClauses = sum(1 for _ in f) - 1
+            print("-- {} --".format(cardinality))
+            print("batched encoder:   {:.3f}s cold, {:.3f}s with cached template (best of {})".format(times[0], min(times[1:], default=math.nan), args.repeat - 1))
+            print("variables:         {}".format(registry.numVars))
+            print("clauses:           {}".format(numClauses))
+            print("wcnf size:         {:.1f} MB".format(os.path.getsize(batched) / 2**20))
+        print("peak RSS:          {:.1f} MB".format(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2**10))
+        if not args.skip_reference:
+            reference = os.path.join(tmp, "reference.wcnf")
+            start = time.perf_counter()
+            referenceGenerateAndWriteClauses(logNum, cnots, cm, args.swaps, reference)
+            referenceTime = time.perf_counter() - start
+            print("reference encoder: {:.3f}s".format(referenceTime))
+            print("speedup:           {:.1f}x".format(referenceTime / times[0]))
+            physNum = len(cm)
+            print("reference vars:    {}".format(len(cnots) * physNum * (2*physNum + logNum + 2*physNum*args.swaps)))
+            print("reference size:    {:.1f} MB".format(os.path.getsize(reference) / 2**20))
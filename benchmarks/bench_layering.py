@@ -0,0 +1,72 @@
+'''
+    Compares per-CNOT and per-layer mapping variables (satmap.solve's layering mode) on the
+    circuit families in qasm_circuits: for each circuit, the number of steps and variables of
+    all chunks' instances, the swaps found, and the wall time of the whole solve.
+
+    $ python3 benchmarks/bench_layering.py --families qaoa_3reg random_circuit --arch tokyo --limit 3 --max_cnots 150
+
+    Each mapped circuit is checked by the verifier; a run that fails or times out is reported
+    as such rather than stopping the benchmark.
+'''
+import argparse
+import contextlib
+import glob
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import architectures
+import program
+import satmap
+
+CIRCUITS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "qasm_circuits")
+
+
+def run(prog, cm, layering, options):
+    start = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            (stats, _) = satmap.transpile(prog, cm, 1, slice_size=options.k, max_sat_time=options.timeout,
+                                          options=satmap.Options(stream=True, layering=layering))
+    except Exception as e:
+        return {"status" : type(e).__name__, "time" : time.perf_counter() - start}
+    registries = stats["registries"]
+    return {"status" : "ok", "time" : time.perf_counter() - start, "cost" : stats["cost"],
+            "steps" : sum(registry.numSteps for registry in registries),
+            "vars" : sum(registry.numVars for registry in registries)}
+
+def describe(result):
+    if result["status"] != "ok":
+        return "{:>8} {:>9} {:>6} {:>7.1f}s".format("-", "-", result["status"][:6], result["time"])
+    return "{:>8} {:>9} {:>6} {:>7.1f}s".format(result["steps"], result["vars"], result["cost"], result["time"])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--families", nargs="+", default=sorted(os.listdir(CIRCUITS)), help="subdirectories of qasm_circuits")
+    parser.add_argument("-a", "--arch", default="tokyo", help="name of qc architecture")
+    parser.add_argument("--k", type=int, default=25, help="CNOTs per chunk")
+    parser.add_argument("-to", "--timeout", type=int, default=120, help="solver budget of each run in seconds")
+    parser.add_argument("--limit", type=int, default=3, help="circuits per family (the smallest ones)")
+    parser.add_argument("--max_cnots", type=int, default=200, help="skip circuits with more CNOTs")
+    args = parser.parse_args()
+
+    cm = architectures.asDevice(architectures.named(args.arch))
+    print("{:<48} {:>5} {:>6} | {:>8} {:>9} {:>6} {:>8} | {:>8} {:>9} {:>6} {:>8}".format(
+        "circuit", "cnots", "layers", "steps", "vars", "swaps", "time", "steps", "vars", "swaps", "time"))
+    for family in args.families:
+        progs = []
+        for path in sorted(glob.glob(os.path.join(CIRCUITS, family, "*.qasm"))):
+            try:
+                prog = program.load(path)
+            except ValueError:
+                continue
+            if prog.logNum <= len(cm) and 0 < len(prog.interactions) <= args.max_cnots:
+                progs.append((len(prog.interactions), path, prog))
+        for (numCnots, path, prog) in sorted(progs, key=lambda entry: entry[:2])[:args.limit]:
+            layers = len(satmap.getLayers(prog.cnots()))
+            (perGate, perLayer) = (run(prog, cm, False, args), run(prog, cm, True, args))
+            print("{:<48} {:>5} {:>6} | {} | {}".format(os.path.join(family, os.path.basename(path))[-48:], numCnots, layers, describe(perGate), describe(perLayer)))
@@ -0,0 +1,52 @@
+'''
+    Times SATMap's start: importing it and loading the requested architecture (and error
+    rates), each in a fresh interpreter as the CLI would. "cold" runs start from an empty
+    architecture cache, "warm" ones reuse the cache the first cold run filled. "all" builds
+    every named architecture, as the CLI did before the registry built only the one asked for.
+
+    $ python3 benchmarks/bench_startup.py --arch tokyo grid_16 aspen_11_38 --err fake_tokyo
+'''
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+
+
+def startup(code, cacheDir):
+    env = dict(os.environ, SATMAP_CACHE=cacheDir, PYTHONWARNINGS="ignore")
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", "import sys; sys.path.insert(0, {!r}); {}".format(SRC, code)], env=env, check=True)
+    return time.perf_counter() - start
+
+def timeStartup(code, repeat, cold):
+    times = []
+    with tempfile.TemporaryDirectory() as warmCache:
+        for _ in range(repeat):
+            if cold:
+                with tempfile.TemporaryDirectory() as cacheDir:
+                    times.append(startup(code, cacheDir))
+            else:
+                times.append(startup(code, warmCache))
+    # the first warm run fills the cache
+    return statistics.median(times if cold else times[1:] or times)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--arch", nargs="+", default=["tokyo", "grid_16", "aspen_11_38"], help="architectures to load")
+    parser.add_argument("--err", help="error rates to load along with each architecture")
+    parser.add_argument("--repeat", type=int, default=5, help="interpreters started per measurement (median reported)")
+    args = parser.parse_args()
+
+    errors = "; architectures.errorRates({!r})".format(args.err) if args.err else ""
+    cases = [("import architectures", "import architectures"), ("import satmap", "import satmap")]
+    cases += [(arch, "import satmap, architectures; satmap.loadArchitecture({!r}){}".format(arch, errors)) for arch in args.arch]
+    cases += [("all", "import satmap, architectures; [architectures.named(name) for name in architectures.ARCHITECTURES]{}".format(errors))]
+    print("{:20} {:>8} {:>8}".format("", "cold", "warm"))
+    for (name, code) in cases:
+        print("{:20} {:7.3f}s {:7.3f}s".format(name, timeStartup(code, args.repeat, True), timeStartup(code, args.repeat + 1, False)))
@@ -1,9 +1,142 @@
 import numpy as np
+import functools
+import hashlib
 import json
+import os
 import random
-from qiskit.test.mock import FakeTokyo
-import networkx as nx
-from networkx.linalg.graphmatrix import adjacency_matrix
+import scipy.sparse
+import scipy.sparse.csgraph
+
+# networkx and qiskit's fake backends are slow to import, so the functions that use them import them when called
+
+# built architectures and error rates are kept here between runs
+CACHE_DIR = os.environ.get("SATMAP_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "satmap"))
+# cached files are keyed on the contents of this file, which defines every architecture and how its data is built
+with open(__file__, "rb") as f:
+    SOURCE_KEY = hashlib.sha256(f.read()).hexdigest()[:16]
+# devices with more automorphisms than this are treated as having none (but the identity)
+MAX_AUTOMORPHISMS = 5000
+
+
+class Device:
+    '''
+        A coupling map together with the structures derived from it, each computed only once
+    '''
+
+    def __init__(self, cm):
+        self.cm = cm.toarray() if scipy.sparse.issparse(cm) else np.asarray(cm)
+        self.physNum = len(self.cm)
+        self.edges = np.argwhere(self.cm > 0)
+        # edgeIndex[u, v] is the position of (u, v) in edges, -1 if it is not an edge
+        self.edgeIndex = np.full((self.physNum, self.physNum), -1)
+        self.edgeIndex[self.edges[:, 0], self.edges[:, 1]] = np.arange(len(self.edges))
+        self.neighbors = [np.flatnonzero(row > 0) for row in self.cm]
+
+    def __len__(self):
+        return self.physNum
+
+    def isEdge(self, u, v):
+        return self.edgeIndex[u, v] >= 0
+
+    @functools.cached_property
+    def fingerprint(self):
+        '''
+            Identifies the coupling graph, e.g. in cache keys
+        '''
+        return (self.physNum, self.edges.tobytes())
+
+    @functools.cached_property
+    def automorphisms(self):
+        '''
+            The automorphism group of the coupling graph (see automorphisms), computed once per graph and kept in CACHE_DIR
+        '''
+        key = hashlib.sha256(str(self.physNum).encode() + self.edges.tobytes()).hexdigest()[:16]
+        return diskCached("automorphisms_" + key, lambda: automorphisms(self))
+
+    def symmetries(self, weights=None):
+        '''
+            The automorphisms that also keep weights (one per edge, e.g. error rates) in place
+        '''
+        if weights is None:
+            return self.automorphisms
+        weights = np.asarray(weights)[:len(self.edges)]
+        moved = self.edgeIndex[self.automorphisms[:, self.edges[:, 0]], self.automorphisms[:, self.edges[:, 1]]]
+        return self.automorphisms[(weights[moved] == weights).all(axis=1)]
+
+    @functools.cached_property
+    def csr(self):
+        return scipy.sparse.csr_matrix(self.cm)
+
+    @functools.cached_property
+    def distance(self):
+        '''
+            All-pairs shortest path lengths
+        '''
+        return scipy.sparse.csgraph.shortest_path(self.csr)
+
+    @functools.cached_property
+    def undirectedDistance(self):
+        '''
+            Shortest path lengths ignoring the direction of the edges, e.g. the swaps a pair of qubits is apart plus one
+        '''
+        return scipy.sparse.csgraph.shortest_path(self.csr, directed=False)
+
+def asDevice(cm):
+    return cm if isinstance(cm, Device) else Device(cm)
+
+def automorphisms(cm, limit=MAX_AUTOMORPHISMS):
+    '''
+        The permutations of the physical qubits that map the coupling graph onto itself, edges to edges in the same
+        direction, as the rows of an array in lexicographic order (the identity first). Found by backtracking over
+        the qubits in breadth-first order, each placed next to the image of an earlier neighbor, among the qubits
+        with the same distances to the others. If there are more than limit, only the identity is returned.
+    '''
+    device = asDevice(cm)
+    n = device.physNum
+    adjacency = device.cm > 0
+    undirected = adjacency | adjacency.T
+    signatures = [(tuple(np.sort(device.distance[p])), tuple(np.sort(device.distance[:, p]))) for p in range(n)]
+    # order[i] is placed i-th, next to the image of anchor[order[i]] (if it is not the first of its component)
+    (order, anchor) = ([], np.full(n, -1))
+    for root in range(n):
+        if root in order:
+            continue
+        frontier = [root]
+        order.append(root)
+        while frontier:
+            p = frontier.pop(0)
+            for q in np.flatnonzero(undirected[p]).tolist():
+                if q not in order:
+                    anchor[q] = p
+                    order.append(q)
+                    frontier.append(q)
+    image = np.full(n, -1)
+    used = np.zeros(n, dtype=bool)
+    found = []
+
+    def extend(depth):
+        if len(found) > limit:
+            return
+        if depth == n:
+            found.append(image.copy())
+            return
+        p = order[depth]
+        placed = np.array(order[:depth], dtype=int)
+        candidates = np.flatnonzero(undirected[image[anchor[p]]]) if anchor[p] >= 0 else range(n)
+        for c in candidates:
+            if used[c] or signatures[c] != signatures[p]:
+                continue
+            if (adjacency[p, placed] != adjacency[c, image[placed]]).any() or (adjacency[placed, p] != adjacency[image[placed], c]).any():
+                continue
+            (image[p], used[c]) = (c, True)
+            extend(depth + 1)
+            (image[p], used[c]) = (-1, False)
+
+    extend(0)
+    if len(found) > limit:
+        return np.arange(n)[None, :]
+    return np.unique(np.array(found, dtype=int).reshape(-1, n), axis=0)
+
 
 triangle = np.array([[0,1,0], [0,0,1], [1,0,0]])
 ibmqx4 = np.array([[0,0,0,0,0],[1,0,0,0,0], [1,1,0,0,0], [0,0,1,0,1],[0,0,1,0,0]])
@@ -76,17 +209,23 @@ aspen_11_edges = [
         ]
 
 def gridArch(n):
+    import networkx as nx
+    from networkx.linalg.graphmatrix import adjacency_matrix
     graph = nx.grid_2d_graph(n, n)
     graph = nx.convert_node_labels_to_integers(graph)
     adj_mat = adjacency_matrix(graph)
     return adj_mat
 
 def circleArch(n):
+    import networkx as nx
+    from networkx.linalg.graphmatrix import adjacency_matrix
     graph = nx.cycle_graph(n)
     adj_mat = adjacency_matrix(graph)
     return adj_mat
 
 def rigettiAspen11Arch():
+    import networkx as nx
+    from networkx.linalg.graphmatrix import adjacency_matrix
     graph = nx.Graph()
     graph.add_edges_from(aspen_11_edges)
     adj_mat = adjacency_matrix(graph)
@@ -212,15 +351,20 @@ def tokyo_error_list():
     return list(tokyo_error_map().values())
 
 def tokyo_error_map():
+    rows = diskCached("tokyo_error_map", build_tokyo_error_rows)
+    return {(int(u), int(v)) : err for (u, v, err) in rows.tolist()}
+
+def build_tokyo_error_rows():
+    from qiskit.test.mock import FakeTokyo
     AVG = 0.03130722830688227
-    errs = {}
+    rows = []
     backend = FakeTokyo()
     props = backend.properties()
     for edge in np.argwhere(ibmTokyo > 0):
         if list(edge) in backend.configuration().coupling_map:
-            errs[tuple(edge)]= props.gate_error('cx', edge)
-        else:errs[tuple(edge)]= AVG
-    return errs
+            rows.append((edge[0], edge[1], props.gate_error('cx', edge)))
+        else:rows.append((edge[0], edge[1], AVG))
+    return rows
 
 def fake_linear_error_map():
     vals = [ 0.0120651070, 0.0120651070, 0.0219138264,0.0219138264, 0.0353320709,0.0353320709, 0.0434709196,0.0434709196, 0.0446780968, 0.0446780968]
@@ -244,3 +388,70 @@ def write_triq_files(error_map):
         f.write("20\n")
         for i in range(20):
             f.write(str(i) + " 1.0" + "\n")
+
+
+## Registry of named architectures ##
+#
+# Only the requested architecture is built, once per process and once per
+# cache directory: later runs load it from CACHE_DIR.
+
+ARCHITECTURES = {
+    "tokyo" : lambda: ibmTokyo,
+    "toronto" : lambda: ibmToronto,
+    "4x4_mesh" : lambda: meshArch(4,4),
+    'small_linear' : lambda: linearArch(6),
+    "16_linear" : lambda: linearArch(16),
+    "tokyo_full_diags" : tokyo_all_diags,
+    "tokyo_no_diags" : tokyo_no_diags,
+    'tokyo_drop_2' : lambda: tokyo_drop_worst_n(2, tokyo_error_map()),
+    'tokyo_drop_6' : lambda: tokyo_drop_worst_n(6, tokyo_error_map()),
+    'tokyo_drop_10' : lambda: tokyo_drop_worst_n(10, tokyo_error_map()),
+    'tokyo_drop_14' : lambda: tokyo_drop_worst_n(14, tokyo_error_map()),
+    'grid_16' : lambda: gridArch(4).toarray(),
+    'grid_25' : lambda: gridArch(5).toarray(),
+    'grid_36' : lambda: gridArch(6).toarray(),
+    'circle_16': lambda: circleArch(16).toarray(),
+    'circle_25': lambda: circleArch(25).toarray(),
+    'circle_36': lambda: circleArch(36).toarray(),
+    'aspen_11_38': lambda: rigettiAspen11Arch().toarray()
+}
+
+ERROR_RATES = {
+    'fake_tokyo' : tokyo_error_list,
+    'fake_linear' : fake_linear_error_list
+}
+
+_built = {}
+
+def diskCached(key, build):
+    '''
+        The array build() returns, built once and then read from memory or CACHE_DIR (best effort, e.g. on a read-only home).
+        The file is only read by the same version of this file, so a changed architecture or builder is built again.
+    '''
+    if key not in _built:
+        path = os.path.join(CACHE_DIR, "{}-{}.npy".format(key, SOURCE_KEY))
+        try:
+            _built[key] = np.load(path)
+        except (OSError, ValueError):
+            _built[key] = np.asarray(build())
+            try:
+                os.makedirs(CACHE_DIR, exist_ok=True)
+                partial = "{}.{}.tmp".format(path, os.getpid())
+                with open(partial, "wb") as f:
+                    np.save(f, _built[key])
+                os.replace(partial, path)
+            except OSError:
+                pass
+    return _built[key]
+
+def named(name):
+    '''
+        The coupling map of a named architecture (a key of ARCHITECTURES)
+    '''
+    return diskCached(name, ARCHITECTURES[name])
+
+def errorRates(name):
+    '''
+        The two-qubit gate error rates (a key of ERROR_RATES), in the order of the device's edges
+    '''
+    return diskCached("errors_" + name, ERROR_RATES[name]).tolist()
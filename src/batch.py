@@ -0,0 +1,200 @@
+'''
+    Maps many circuits onto several architectures in one process: the imports and the
+    architectures are loaded once, and every job runs in a forked worker with its own
+    workspace and a wall-clock limit.
+
+    $ python3 src/satmap.py batch examples/jku_constraint_based --arch tokyo toronto --jobs 4 --results results/results.csv
+
+    The input is a directory (searched recursively for .qasm files) or a manifest listing
+    one .qasm path per line, relative to the manifest. Results are appended to a CSV or,
+    for a .jsonl path, a JSON lines file as each job finishes; jobs already in it are
+    skipped, so an interrupted batch resumes by running the same command again.
+'''
+import argparse
+import contextlib
+import csv
+import json
+import multiprocessing
+import multiprocessing.connection
+import os
+import re
+import signal
+import sys
+import time
+
+import circuit_filter
+import program
+import satmap
+from workspace import Workspace
+
+FIELDS = ["circuit", "arch", "num_swaps", "runtime", "status", "error"]
+
+
+## Jobs ##
+
+def findCircuits(source):
+    '''
+        The .qasm files of a directory (recursively, sorted) or listed in a manifest file
+    '''
+    if os.path.isdir(source):
+        return sorted(os.path.join(root, name) for (root, _, names) in os.walk(source) for name in names if name.endswith(".qasm"))
+    with open(source) as f:
+        lines = [line.strip() for line in f]
+    return [os.path.join(os.path.dirname(source), line) for line in lines if line and not line.startswith("#")]
+
+def withinLimits(path, maxQubits, maxGates):
+    '''
+        Whether a circuit is small enough to map, counting its qubits and two-qubit gates
+    '''
+    if maxQubits is None and maxGates is None:
+        return True
+    try:
+        prog = program.load(path)
+    except Exception:
+        # let the job fail and record why
+        return True
+    return ((maxQubits is None or prog.qubitNum <= maxQubits) and
+            (maxGates is None or circuit_filter.get_num_gates_by_operands(prog, 2) <= maxGates))
+
+def workspaceFor(workdir, circuit, arch):
+    return os.path.join(workdir, re.sub(r"[^\w.-]", "_", arch), re.sub(r"[^\w.-]", "_", os.path.normpath(circuit)))
+
+
+## Results ##
+
+def readResults(path):
+    '''
+        The (circuit, arch) pairs already recorded in a results file
+    '''
+    if not os.path.exists(path):
+        return set()
+    with open(path) as f:
+        if path.endswith(".jsonl"):
+            rows = [json.loads(line) for line in f if line.strip()]
+        else:
+            rows = list(csv.DictReader(f))
+    return set((row["circuit"], row["arch"]) for row in rows)
+
+class ResultWriter:
+    '''
+        Appends one row per finished job to a CSV or JSON lines file, flushing each
+    '''
+
+    def __init__(self, path):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.jsonl = path.endswith(".jsonl")
+        fresh = not os.path.exists(path) or os.path.getsize(path) == 0
+        self.f = open(path, "a", newline="")
+        if not self.jsonl:
+            self.writer = csv.DictWriter(self.f, FIELDS)
+            if fresh:
+                self.writer.writeheader()
+
+    def write(self, row):
+        if self.jsonl:
+            self.f.write(json.dumps(row) + "\n")
+        else:
+            self.writer.writerow(row)
+        self.f.flush()
+
+    def close(self):
+        self.f.close()
+
+
+## Workers ##
+
+def runJob(circuit, arch, cm, workspace, options, conn):
+    '''
+        Maps one circuit in a forked worker, keeping its scratch files, log and result in the workspace directory,
+        and sends back the result
+    '''
+    # the worker and its solver processes form one group, killed together on timeout
+    os.setpgrp()
+    workspace = Workspace(workspace)
+    log = os.open(workspace.path("satmap.log"), os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    os.dup2(log, sys.stdout.fileno())
+    os.dup2(log, sys.stderr.fileno())
+    base = os.path.splitext(os.path.basename(circuit))[0]
+    try:
+        (stats, _) = satmap.transpile(circuit, cm, 1, "prob_"+base, "sol_"+base, workspace=workspace,
+                                      output=workspace.path("mapped_" + os.path.basename(circuit)), **satmap.transpileOptions(options))
+        conn.send({"status" : "ok", "num_swaps" : stats["cost"]})
+    except Exception as e:
+        conn.send({"status" : "error", "error" : repr(e)})
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+
+def runBatch(jobs, archs, options, writer):
+    '''
+        Runs the (circuit, arch) jobs on options.jobs forked workers, killing those that outlive options.timeout plus options.grace
+    '''
+    context = multiprocessing.get_context("fork")
+    pending = list(reversed(jobs))
+    running = {}
+    try:
+        runWorkers(context, pending, running, archs, options, writer)
+    finally:
+        # interrupted: stop the unfinished jobs too, they are run again on resume
+        for (_, _, worker, _, _) in running.values():
+            with contextlib.suppress(ProcessLookupError):
+                os.killpg(worker.pid, signal.SIGKILL)
+            worker.join()
+
+def runWorkers(context, pending, running, archs, options, writer):
+    while pending or running:
+        while pending and len(running) < options.jobs:
+            (circuit, arch) = pending.pop()
+            (receiver, sender) = context.Pipe(duplex=False)
+            worker = context.Process(target=runJob, args=(circuit, arch, archs[arch], workspaceFor(options.workdir, circuit, arch), options, sender))
+            worker.start()
+            sender.close()
+            running[worker.sentinel] = (circuit, arch, worker, receiver, time.monotonic())
+        deadline = min(started for (_, _, _, _, started) in running.values()) + options.timeout + options.grace
+        ready = multiprocessing.connection.wait(list(running), timeout=max(0, deadline - time.monotonic()))
+        for sentinel in list(running):
+            (circuit, arch, worker, receiver, started) = running[sentinel]
+            runtime = time.monotonic() - started
+            if sentinel in ready:
+                worker.join()
+                result = receiver.recv() if receiver.poll() else {"status" : "error", "error" : "worker exited with code {}".format(worker.exitcode)}
+            elif runtime >= options.timeout + options.grace:
+                os.killpg(worker.pid, signal.SIGKILL)
+                worker.join()
+                result = {"status" : "timeout"}
+            else:
+                continue
+            receiver.close()
+            del running[sentinel]
+            row = {"circuit" : circuit, "arch" : arch, "num_swaps" : result.get("num_swaps"), "runtime" : round(runtime, 3),
+                   "status" : result["status"], "error" : result.get("error")}
+            writer.write(row)
+            print("{} on {}: {} ({:.1f}s{})".format(circuit, arch, row["status"], runtime, "" if row["num_swaps"] is None else ", {} swaps".format(row["num_swaps"])))
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog="satmap.py batch")
+    parser.add_argument("source", help="directory of .qasm files or manifest listing them")
+    parser.add_argument("-a", "--arch", nargs="+", required=True, help="names of qc architectures (or adjacency matrix files)")
+    parser.add_argument("-to", "--timeout", type=int, default=600, help="solver budget of each job in seconds")
+    parser.add_argument("--grace", type=float, default=60, help="seconds past --timeout after which a job is killed")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="number of jobs run at once")
+    parser.add_argument("--max_qubits", type=int, help="skip circuits with more qubits")
+    parser.add_argument("--max_gates", type=int, help="skip circuits with more two-qubit gates")
+    parser.add_argument("--results", default="results/results.csv", help="CSV (or .jsonl) file the results are appended to")
+    parser.add_argument("--workdir", default="tmp/batch", help="where each job's workspace (log, solver files, mapped circuit) is made")
+    # the same mapping options as a single run
+    satmap.addTranspileOptions(parser)
+    args = parser.parse_args(argv)
+
+    archs = {arch : satmap.loadArchitecture(arch) for arch in args.arch}
+    done = readResults(args.results)
+    circuits = [circuit for circuit in findCircuits(args.source) if withinLimits(circuit, args.max_qubits, args.max_gates)]
+    jobs = [(circuit, arch) for arch in args.arch for circuit in circuits if (circuit, arch) not in done]
+    print("{} jobs, {} already done".format(len(jobs), len(circuits) * len(args.arch) - len(jobs)))
+    writer = ResultWriter(args.results)
+    try:
+        runBatch(jobs, archs, args, writer)
+    finally:
+        writer.close()
+    return 0
@@ -0,0 +1,48 @@
+import functools
+
+import numpy as np
+from pysat.card import CardEnc, EncType
+
+## At-most-one / exactly-one encodings ##
+#
+# pairwise is generated directly; the other encodings come from pysat.card. Each is
+# built once per group size (and bound) as a template over the literals 1..n (and
+# auxiliary variables n+1, ...), which is then instantiated for every group at once.
+
+ENCODINGS = ["pairwise", "seqcounter", "ladder", "bitwise", "totalizer"]
+
+
+@functools.lru_cache(maxsize=None)
+def template(encoding, n, bound=1):
+    '''
+        Returns the clauses of an at-most-bound (pairwise only for one) over literals 1..n as arrays of equal-width
+        clauses, and the number of auxiliary variables they use
+    '''
+    if bound >= n:
+        return ((), 0)
+    if bound == 1 and (encoding == "pairwise" or n < 2):
+        (i, i2) = np.tril_indices(n, -1)
+        return ((-np.stack((i2 + 1, i + 1), axis=-1),), 0)
+    cnf = CardEnc.atmost(lits=list(range(1, n + 1)), bound=bound, top_id=n, encoding=getattr(EncType, encoding))
+    byWidth = {}
+    for clause in cnf.clauses:
+        byWidth.setdefault(len(clause), []).append(clause)
+    return (tuple(np.array(clauses) for clauses in byWidth.values()), max(cnf.nv, n) - n)
+
+def auxCount(encoding, n, bound=1):
+    return template(encoding, n, bound)[1]
+
+def atMost(encoding, lits, aux, bound):
+    '''
+        lits holds one group of literals per row and aux the auxCount ids reserved for each group.
+        Returns blocks of clauses shaped (groups, rows, width), as taken by satmap.writeClauseGroups
+    '''
+    (blocks, _) = template(encoding, lits.shape[1], bound)
+    table = np.concatenate((lits, aux), axis=1)
+    return [np.sign(block) * table[:, np.abs(block) - 1] for block in blocks]
+
+def atMostOne(encoding, lits, aux):
+    return atMost(encoding, lits, aux, 1)
+
+def exactlyOne(encoding, lits, aux):
+    return atMostOne(encoding, lits, aux) + [lits[:, None, :]]
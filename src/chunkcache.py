@@ -0,0 +1,156 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+import numpy as np
+
+import architectures
+from model import solutionOutput
+
+## Solved chunks, kept across runs ##
+#
+# Circuits like QAOA, QFT or Hamiltonian simulation repeat the same slices of
+# CNOTs, which come to the solver again and again with the same boundary
+# mapping. A chunk's instance only depends on its CNOTs up to a renaming of the
+# logical qubits, so a solution is stored under a key in which they are renamed
+# canonically: those of the CNOTs in order of first use, then the idle ones (in
+# order of their physical qubit at the boundary, if there is one). Boundary
+# mappings that differ by a symmetry of the device share a key as well: the
+# physical qubits are renamed by the automorphism that makes the boundary
+# mapping smallest, and solutions are stored in the renamed qubits.
+
+MODES = ["disk", "memory", "off"]
+CACHE_VERSION = 1
+
+
+class ChunkInstance:
+    '''
+        A chunk's instance in canonical form: its CNOTs and the boundary mapping (logical to physical qubit, None
+        for the first chunk) with the logical qubits renamed, and the physical ones by one of symmetries (automorphisms
+        of the device that keep the instance's weights, one per row), together with everything else the instance depends on
+    '''
+
+    def __init__(self, cnots, logNum, boundary, device, swapNum, mode, symmetries=None):
+        order = list(dict.fromkeys(q for cnot in cnots for q in cnot))
+        used = set(order)
+        idle = [q for q in range(logNum) if q not in used]
+        if boundary is not None:
+            idle.sort(key=lambda q: boundary[q])
+        # order[label] is the logical qubit renamed to label
+        self.order = np.array(order + idle, dtype=int)
+        self.labels = np.empty(logNum, dtype=int)
+        self.labels[self.order] = np.arange(logNum)
+        # symmetry[p] is the physical qubit p is renamed to, inverse the way back
+        self.symmetry = np.arange(device.physNum)
+        if boundary is not None:
+            boundary = np.asarray(boundary)[self.order]
+            if symmetries is not None and len(symmetries) > 1:
+                images = symmetries[:, boundary]
+                self.symmetry = symmetries[np.lexsort(images.T[::-1])[0]]
+            boundary = self.symmetry[boundary]
+        self.inverse = np.argsort(self.symmetry)
+        fields = [CACHE_VERSION, hashlib.sha256(device.edges.tobytes()).hexdigest(), device.physNum, logNum, swapNum, mode,
+                  self.labels[np.asarray(cnots, dtype=int).reshape(-1, 2)].tolist(),
+                  None if boundary is None else boundary.tolist()]
+        self.key = hashlib.sha256(json.dumps(fields).encode()).hexdigest()
+
+    def entry(self, model, cost):
+        '''
+            What is stored of a solved chunk: the mapping of each step (by label) and the swaps before it, in the
+            renamed physical qubits
+        '''
+        registry = model.registry
+        mappings = model.mappings()[:, self.order]
+        return {"cost" : cost, "mappings" : np.where(mappings >= 0, self.symmetry[mappings], -1).tolist(),
+                "swaps" : [self.symmetry[model.swaps_at(k)].tolist() for k in range(registry.numSteps)]}
+
+    def output(self, registry, entry):
+        '''
+            The stored solution as the lines of a solver's output, over the variables of registry
+        '''
+        mappings = np.array(entry["mappings"], dtype=int).reshape(registry.numSteps, -1)[:, self.labels]
+        mappings = np.where(mappings >= 0, self.inverse[mappings], -1)
+        swaps = [self.inverse[np.array(stepSwaps, dtype=int).reshape(-1, 2)].tolist() for stepSwaps in entry["swaps"]]
+        return solutionOutput(registry, mappings, swaps, entry["cost"])
+
+
+class ChunkCache:
+    '''
+        Solutions of chunks by key, in an SQLite database at path (":memory:" for one run only) holding at most
+        maxSize of them, the least recently used going first. Each process opens its own connection (batch
+        workers are forked), and a database that cannot be opened or written to is replaced by an in-memory one.
+    '''
+
+    def __init__(self, path, maxSize=10000):
+        self.path = path
+        self.maxSize = maxSize
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.conn = None
+        self.pid = None
+
+    def connection(self):
+        if self.conn is None or self.pid != os.getpid():
+            try:
+                if self.path != ":memory:":
+                    os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                self.conn = self.connect(self.path)
+            except (OSError, sqlite3.Error):
+                self.path = ":memory:"
+                self.conn = self.connect(self.path)
+            self.pid = os.getpid()
+        return self.conn
+
+    @staticmethod
+    def connect(path):
+        conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        conn.execute("CREATE TABLE IF NOT EXISTS chunks (key TEXT PRIMARY KEY, entry TEXT, used REAL)")
+        return conn
+
+    def get(self, key):
+        '''
+            The entry stored under key, None if there is none
+        '''
+        conn = self.connection()
+        try:
+            row = conn.execute("SELECT entry FROM chunks WHERE key = ?", (key,)).fetchone()
+            if row:
+                conn.execute("UPDATE chunks SET used = ? WHERE key = ?", (time.time(), key))
+        except sqlite3.Error:
+            row = None
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key, entry):
+        conn = self.connection()
+        try:
+            conn.execute("INSERT OR REPLACE INTO chunks VALUES (?, ?, ?)", (key, json.dumps(entry), time.time()))
+            (size,) = conn.execute("SELECT COUNT(*) FROM chunks").fetchone()
+            if size > self.maxSize:
+                conn.execute("DELETE FROM chunks WHERE key IN (SELECT key FROM chunks ORDER BY used LIMIT ?)", (size - self.maxSize,))
+                self.evictions += size - self.maxSize
+            self.stores += 1
+        except sqlite3.Error:
+            pass
+
+    def stats(self):
+        return {"hits" : self.hits, "misses" : self.misses, "stores" : self.stores, "evictions" : self.evictions}
+
+    def report(self):
+        print("chunk cache: {hits} hits, {misses} misses, {stores} stored, {evictions} evicted".format(**self.stats()))
+
+def create(mode="off", maxSize=10000):
+    '''
+        The chunk cache of a mode (one of MODES): kept in architectures.CACHE_DIR, for this run only, or none
+    '''
+    if mode == "off":
+        return None
+    path = os.path.join(architectures.CACHE_DIR, "chunks-v{}.sqlite".format(CACHE_VERSION)) if mode == "disk" else ":memory:"
+    return ChunkCache(path, maxSize)
@@ -0,0 +1,100 @@
+import numpy as np
+
+import architectures
+
+## Adaptive chunk sizes ##
+#
+# The circuit is cut into chunks of consecutive CNOTs, one MaxSat instance each.
+# With a fixed size, chunks that are solved at once and chunks that time out get
+# the same share of the budget. Adaptively, the first size is picked from the
+# device and the circuit, a chunk that times out without a model is split in
+# half, and the two chunks after one that is solved to optimality in a small
+# part of its time are merged into one.
+
+# the slice size without adaptive chunks
+DEFAULT_SIZE = 25
+# the slice size the other sizes are relative to: 25 CNOTs of a 16-qubit circuit on a 20-qubit device
+REFERENCE = (25, 20 * 16)
+# smallest chunk that is split, largest a merge makes (as a multiple of the first size)
+MIN_SIZE = 4
+MAX_GROWTH = 4
+# fraction of its planned time below which a chunk counts as solved well under budget
+MERGE_BELOW = 0.1
+
+
+def initialSliceSize(program, cm):
+    '''
+        A slice size for program on the device cm: smaller as the instances get more mapping variables per CNOT
+        (physical times logical qubits), and when the circuit's qubits interact with more distinct partners than
+        the device's qubits have neighbors, so that more swaps are needed
+    '''
+    device = architectures.asDevice(cm)
+    pairs = np.unique(np.sort(program.interactions, axis=1), axis=0)
+    used = len(np.unique(pairs))
+    interactionDegree = 2 * len(pairs) / used if used else 0
+    undirected = (device.cm > 0) | (device.cm.T > 0)
+    deviceDegree = undirected.sum() / device.physNum
+    (size, variables) = REFERENCE
+    scale = (variables / (device.physNum * max(program.logNum, 1))) ** 0.5
+    if interactionDegree > deviceDegree:
+        scale *= deviceDegree / interactionDegree
+    return int(np.clip(round(size * scale), MIN_SIZE, size * MAX_GROWTH))
+
+def sliceSize(program, cm, adaptive=False):
+    '''
+        The slice size for program on the device cm when none is given: initialSliceSize's with adaptive, otherwise DEFAULT_SIZE
+    '''
+    return initialSliceSize(program, cm) if adaptive else DEFAULT_SIZE
+
+class Chunker:
+    '''
+        The chunks of numCnots CNOTs, as the CNOT each starts at (bounds, ending with numCnots), first of equal size
+        but the last. Unless adaptive, they stay that way; otherwise they are split and merged by solve, and each
+        decision is logged.
+    '''
+
+    def __init__(self, numCnots, chunks, adaptive=False):
+        chunkSize = numCnots // chunks
+        self.bounds = [chunkSize * i for i in range(chunks)] + [numCnots]
+        self.adaptive = adaptive
+        self.maxSize = MAX_GROWTH * max(chunkSize, 1)
+        self.decisions = []
+
+    def __len__(self):
+        return len(self.bounds) - 1
+
+    def span(self, i):
+        return (self.bounds[i], self.bounds[i + 1])
+
+    def canSplit(self, i):
+        (start, end) = self.span(i)
+        return self.adaptive and end - start >= 2 * MIN_SIZE
+
+    def split(self, i, reason):
+        '''
+            Halves chunk i, which becomes chunks i and i+1
+        '''
+        (start, end) = self.span(i)
+        self.bounds.insert(i + 1, (start + end) // 2)
+        self.log("split", i, reason)
+
+    def canMerge(self, i):
+        return self.adaptive and i + 1 < len(self) and self.bounds[i + 2] - self.bounds[i] <= self.maxSize
+
+    def merge(self, i, reason):
+        '''
+            Joins chunks i and i+1 into chunk i
+        '''
+        del self.bounds[i + 1]
+        self.log("merge", i, reason)
+
+    def log(self, decision, i, reason):
+        self.decisions.append((decision, i, self.span(i), reason))
+        print("{} chunk {}, now CNOTs {}-{} ({}), {} chunks".format(decision, i, *self.span(i), reason, len(self)))
+
+    def report(self):
+        if not self.adaptive:
+            return
+        sizes = np.diff(self.bounds).tolist()
+        print("{} chunks of {} to {} CNOTs after {} splits and {} merges".format(len(self), min(sizes, default=0), max(sizes, default=0),
+              sum(decision == "split" for (decision, _, _, _) in self.decisions), sum(decision == "merge" for (decision, _, _, _) in self.decisions)))
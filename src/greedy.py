@@ -0,0 +1,97 @@
+import numpy as np
+
+import architectures
+
+## Greedy router ##
+#
+# A fast heuristic for one chunk, under the same rules as its MaxSat instance:
+# the CNOTs of each step are on adjacent qubits in the step's mapping, and at
+# most swapNum swaps happen before each step but the first. The swaps before a
+# step are picked one at a time, each the one that most lowers the distances of
+# the step's CNOTs and, with decaying weights, of the CNOTs after it. Its swap
+# count bounds the chunk's optimum, and its solution stands in for the solver's
+# if that finds none in time. Once the time budget is spent, chunks are routed
+# with as many swaps as they take instead, before their first step too.
+
+# CNOTs after the current step that the swaps look ahead to, and the weight of each next one
+LOOKAHEAD = 20
+DECAY = 0.7
+# weight of the current step's CNOTs, which must end up adjacent
+URGENT = 1000.0
+
+
+def initialMapping(device, cnots, logNum, partial=None):
+    '''
+        Places the logical qubits in order of first use (the idle ones last), each on the free physical qubit closest
+        to those of its partners placed already, the first on the most central qubit. Given a partial mapping (-1 for
+        the qubits not placed), only the qubits of cnots it leaves out are placed.
+    '''
+    distance = device.undirectedDistance
+    order = list(dict.fromkeys([q for cnot in cnots for q in cnot] + ([] if partial is not None else list(range(logNum)))))
+    partners = {q : [] for q in range(logNum)}
+    for (c, t) in cnots:
+        partners[c].append(t)
+        partners[t].append(c)
+    mapping = np.full(logNum, -1) if partial is None else np.array(partial, dtype=int)
+    free = np.ones(device.physNum, dtype=bool)
+    free[mapping[mapping >= 0]] = False
+    centrality = np.where(np.isfinite(distance), distance, device.physNum).sum(axis=1)
+    for log in order:
+        if mapping[log] >= 0:
+            continue
+        placed = [mapping[q] for q in partners[log] if mapping[q] >= 0]
+        if not placed:
+            # next to what is placed already, or in the middle of the device
+            placed = mapping[mapping >= 0]
+        closeness = distance[:, placed].sum(axis=1) if len(placed) else centrality
+        mapping[log] = np.flatnonzero(free)[np.argmin(closeness[free])]
+        free[mapping[log]] = False
+    return mapping
+
+def route(cm, cnots, stepOf, logNum, swapNum, boundary=None, lookahead=(), leading=False):
+    '''
+        Routes a chunk's cnots (with stepOf, the step of each) from the boundary mapping (logical to physical qubit,
+        completed or chosen by initialMapping), also moving towards the lookahead CNOTs that follow the chunk.
+        Returns the mapping of each step, shaped (numSteps, logNum), and the swaps (u, v) before each step, or
+        None if some step's CNOTs cannot be brought together with swapNum swaps (any number if None). With leading,
+        there are swaps before the first step as well, which no instance allows.
+    '''
+    device = architectures.asDevice(cm)
+    distance = device.undirectedDistance
+    cnots = np.asarray(cnots, dtype=int).reshape(-1, 2)
+    following = np.concatenate((cnots, np.asarray(lookahead, dtype=int).reshape(-1, 2)))
+    stepOf = np.asarray(stepOf, dtype=int)
+    numSteps = int(stepOf[-1]) + 1 if len(stepOf) else 0
+    # the qubits first used in this chunk are not on the boundary yet
+    mapping = initialMapping(device, cnots.tolist(), logNum, boundary)
+    (u, v) = device.edges.T
+    mappings = []
+    swaps = []
+    firsts = np.searchsorted(stepOf, np.arange(numSteps + 1))
+    limit = np.inf if swapNum is None else swapNum
+    for k in range(numSteps):
+        (first, last) = (firsts[k], firsts[k + 1])
+        pairs = following[first:last + LOOKAHEAD]
+        weights = np.concatenate((np.full(last - first, URGENT), DECAY ** np.arange(1, len(pairs) - (last - first) + 1)))
+        stepSwaps = []
+        while len(stepSwaps) < (limit if k > 0 or leading else 0):
+            (c, t) = mapping[cnots[first:last]].T
+            if swapNum is None and (distance[c, t] == 1).all():
+                # without a limit, only as many as the step needs
+                break
+            # the positions of the pairs' qubits after each candidate swap, one row per edge
+            positions = mapping[pairs]
+            moved = np.where(positions[None] == u[:, None, None], v[:, None, None],
+                             np.where(positions[None] == v[:, None, None], u[:, None, None], positions[None]))
+            costs = (distance[moved[..., 0], moved[..., 1]] - 1) @ weights
+            best = int(np.argmin(costs))
+            if costs[best] >= (distance[positions[:, 0], positions[:, 1]] - 1) @ weights:
+                break
+            stepSwaps.append((int(u[best]), int(v[best])))
+            mapping = np.where(mapping == u[best], v[best], np.where(mapping == v[best], u[best], mapping))
+        (c, t) = mapping[cnots[first:last]].T
+        if (distance[c, t] != 1).any():
+            return None
+        mappings.append(mapping)
+        swaps.append(stepSwaps)
+    return (np.array(mappings, dtype=int).reshape(numSteps, logNum), swaps)
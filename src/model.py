@@ -0,0 +1,104 @@
+import numpy as np
+
+## Decoded solver models ##
+#
+# A model is read once into a boolean array indexed by variable id; the
+# mapping and swap variables are then read off as slices of their families'
+# blocks rather than by decoding every literal.
+
+
+class Model:
+    '''
+        The truth assignment a solver found for one instance, over the variables of its registry
+    '''
+
+    def __init__(self, registry, lits):
+        self.registry = registry
+        self.found = lits is not None
+        self.values = np.zeros(registry.numVars + 1, dtype=bool)
+        if lits is not None:
+            lits = np.asarray(lits, dtype=int)
+            lits = lits[(lits > 0) & (lits <= registry.numVars)]
+            self.values[lits] = True
+        self._mappings = None
+
+    @classmethod
+    def fromOutput(cls, registry, lines):
+        '''
+            Parses the "v" line of open-wbo's output (given as lines)
+        '''
+        for line in lines:
+            if line.startswith("v"):
+                return cls(registry, np.array(line.split()[1:], dtype=int))
+        return cls(registry, None)
+
+    @classmethod
+    def fromSolver(cls, registry, solver):
+        '''
+            Reads the model of a PySat solver (None if its last call was unsatisfiable)
+        '''
+        return cls(registry, solver.get_model())
+
+    def __bool__(self):
+        return self.found
+
+    def family(self, kind):
+        '''
+            The values of one family of variables, in its shape
+        '''
+        (offset, shape) = self.registry.families[kind]
+        return self.values[offset + 1:offset + 1 + int(np.prod(shape))].reshape(shape)
+
+    def mappings(self):
+        '''
+            The physical qubit of each logical qubit at each step, shaped (numSteps, logNum), -1 where unmapped
+        '''
+        if self._mappings is None:
+            x = self.family("x")
+            mappings = np.full((self.registry.numSteps, self.registry.logNum), -1)
+            mapped = x.any(axis=0).T
+            mappings[:, self.registry.live] = np.where(mapped, np.argmax(x, axis=0).T, -1)
+            mappings.flags.writeable = False
+            self._mappings = mappings
+        return self._mappings
+
+    def mapping_at(self, step):
+        '''
+            The logical to physical mapping of one step (the CNOTs of a layer with layering), -1 for unmapped logical qubits
+        '''
+        return self.mappings()[step]
+
+    def assignments(self, step):
+        '''
+            The true mapping variables of one step as (phys, log, step) tuples, ordered by physical qubit
+        '''
+        mapping = self.mapping_at(step)
+        logs = np.flatnonzero(mapping >= 0)
+        order = np.argsort(mapping[logs])
+        return [(int(mapping[log]), int(log), step) for log in logs[order]]
+
+    def swaps_at(self, step):
+        '''
+            The swaps (u, v) made before step in the order they are applied, "no swap" choices left out
+        '''
+        if "s" not in self.registry.families:
+            return np.zeros((0, 2), dtype=int)
+        (_, chosen) = np.nonzero(self.family("s")[:, :, step].T)
+        chosen = chosen[chosen < len(self.registry.edges)]
+        return self.registry.swaps[chosen]
+
+def solutionOutput(registry, mappings, swaps, cost, status="OPTIMUM FOUND"):
+    '''
+        The lines open-wbo prints for a solution known otherwise, given by the mapping of each step (logical to physical
+        qubit, -1 where unmapped) and the swaps (u, v) before each step: its cost, status and a model of the mapping
+        and swap variables
+    '''
+    mappings = np.asarray(mappings, dtype=int).reshape(registry.numSteps, -1)
+    (steps, logs) = np.nonzero(mappings >= 0)
+    lits = [registry.ids("x", (mappings[steps, logs], logs, steps))]
+    for (k, stepSwaps) in enumerate(swaps):
+        # the swaps first, then "no swap" for the rest of the step's choices
+        chosen = np.array(list(stepSwaps) + [[0, 0]] * (registry.swapNum - len(stepSwaps)), dtype=int).reshape(-1, 2)
+        lits.append(registry.ids("s", (chosen[:, 0], chosen[:, 1], np.arange(registry.swapNum), k)))
+    values = np.sort(np.concatenate(lits))
+    return ["o {}\n".format(cost), "s {}\n".format(status), "v " + " ".join(map(str, values.tolist())) + "\n"]
@@ -0,0 +1,204 @@
+import re
+
+import numpy as np
+
+## OpenQASM 2 front end ##
+#
+# A program is read in one pass into flat arrays: an opcode per gate (indexing
+# the gate names, parameters included), and the gates' qubit operands one after
+# the other, delimited by offsets. The qubits of all registers are numbered in
+# one sequence, in order of declaration.
+
+COMMENT = re.compile(r"//[^\n]*")
+# the common case, a gate on one or two indexed qubits (operands may also be separated by whitespace only)
+SIMPLE = re.compile(r"\s*([A-Za-z_]\w*)\s+([A-Za-z_]\w*)\s*\[\s*(\d+)\s*\](?:\s*,?\s*([A-Za-z_]\w*)\s*\[\s*(\d+)\s*\])?\s*")
+STRAY_QUOTE = re.compile(r'^\s*"(?=OPENQASM)')
+STATEMENT = re.compile(r"\s*([A-Za-z_]\w*)\s*(.*)", re.S)
+OPERAND = re.compile(r"([A-Za-z_]\w*)\s*(?:\[\s*(\d+)\s*\])?")
+
+
+class Program:
+    '''
+        A parsed OpenQASM program. Gate i is names[ops[i]] applied to qubits[offsets[i]:offsets[i+1]],
+        measurements writing to clbits[i] (-1 for other gates).
+    '''
+
+    def __init__(self, qubitNum, clbitNum, names, ops, offsets, qubits, clbits):
+        self.qubitNum = qubitNum
+        self.clbitNum = clbitNum
+        self.names = names
+        self.ops = ops
+        self.offsets = offsets
+        self.qubits = qubits
+        self.clbits = clbits
+        self.arity = np.diff(offsets)
+        opcodes = {name : op for (op, name) in enumerate(names)}
+        self.barrier = opcodes.get("barrier", -1)
+        self.measure = opcodes.get("measure", -1)
+        # the gates that need their qubits next to each other
+        self.interacting = (self.arity == 2) & (ops != self.barrier)
+        starts = offsets[:-1][self.interacting]
+        self.interactions = np.stack((qubits[starts], qubits[starts + 1]), axis=-1)
+        placed = np.repeat(ops != self.barrier, self.arity)
+        # qubits up to the highest one a (non-barrier) gate uses are mapped
+        self.logNum = int(qubits[placed].max()) + 1 if placed.any() else 0
+
+    def __len__(self):
+        return len(self.ops)
+
+    def operands(self, i):
+        return self.qubits[self.offsets[i]:self.offsets[i+1]]
+
+    def statement(self, i):
+        '''
+            Gate i as OpenQASM, on register q
+        '''
+        operands = ",".join("q[{}]".format(q) for q in self.operands(i))
+        return "{} {}{};".format(self.names[self.ops[i]], operands, "" if self.clbits[i] < 0 else " -> c[{}]".format(self.clbits[i]))
+
+    def cnots(self):
+        '''
+            The (control, target) pairs of the two-qubit gates, in program order
+        '''
+        return [tuple(pair) for pair in self.interactions.tolist()]
+
+    def qasm(self):
+        '''
+            The program as OpenQASM, its qubits in one register q (and classical bits in c)
+        '''
+        lines = ["OPENQASM 2.0;", "include \"qelib1.inc\";", "qreg q[{}];".format(self.qubitNum)]
+        if (self.clbits >= 0).any():
+            lines.append("creg c[{}];".format(self.clbitNum))
+        qubits = self.qubits.tolist()
+        offsets = self.offsets.tolist()
+        for (i, (op, clbit)) in enumerate(zip(self.ops.tolist(), self.clbits.tolist())):
+            operands = ",".join("q[{}]".format(q) for q in qubits[offsets[i]:offsets[i+1]])
+            lines.append("{} {}{};".format(self.names[op], operands, "" if clbit < 0 else " -> c[{}]".format(clbit)))
+        return "\n".join(lines) + "\n"
+
+def asProgram(prog):
+    return prog if isinstance(prog, Program) else load(prog)
+
+def load(path, keepFinalMeasurements=False):
+    with open(path) as f:
+        return parse(f.read(), keepFinalMeasurements=keepFinalMeasurements)
+
+def parse(text, keepFinalMeasurements=False):
+    '''
+        Parses OpenQASM 2 source. Measurements and barriers at the end of the program are left out unless keepFinalMeasurements.
+    '''
+    qregs = {}
+    cregs = {}
+    opcodes = {}
+    (ops, counts, qubits, clbits) = ([], [], [], [])
+
+    def register(regs, name):
+        if name not in regs:
+            raise ValueError("undeclared register " + name)
+        return regs[name]
+
+    def expand(regs, operandText):
+        # an operand without an index stands for every bit of its register
+        expanded = []
+        for (name, index) in OPERAND.findall(operandText):
+            (offset, size) = register(regs, name)
+            expanded.append([offset + int(index)] if index else list(range(offset, offset + size)))
+        return expanded
+
+    def add(name, operands, clbit=-1):
+        ops.append(opcodes.setdefault(name, len(opcodes)))
+        counts.append(len(operands))
+        qubits.extend(operands)
+        clbits.append(clbit)
+
+    # the QUEKO benchmark files (examples/queko) open with a stray quote, as "OPENQASM 2.0;
+    text = STRAY_QUOTE.sub("", COMMENT.sub("", text), count=1)
+    for statement in text.split(";"):
+        simple = SIMPLE.fullmatch(statement)
+        if simple:
+            (name, reg, index, reg2, index2) = simple.groups()
+            if name in ("qreg", "creg"):
+                regs = qregs if name == "qreg" else cregs
+                regs[reg] = (sum(size for (_, size) in regs.values()), int(index))
+            elif reg2 is None:
+                add(name, [register(qregs, reg)[0] + int(index)])
+            else:
+                add(name, [register(qregs, reg)[0] + int(index), register(qregs, reg2)[0] + int(index2)])
+            continue
+        if not statement.strip():
+            continue
+        matched = STATEMENT.fullmatch(statement)
+        if matched is None:
+            raise ValueError("unsupported OpenQASM statement: " + statement.strip())
+        (name, operandText) = matched.groups()
+        (params, operandText) = splitParameters(operandText)
+        if name in ("OPENQASM", "include"):
+            continue
+        if name in ("gate", "opaque", "if") or "{" in statement:
+            raise ValueError("unsupported OpenQASM statement: " + statement.strip())
+        if name == "measure":
+            (quantum, _, classical) = operandText.partition("->")
+            pairs = zip(sum(expand(qregs, quantum), []), sum(expand(cregs, classical), []))
+            for (qubit, clbit) in pairs:
+                add(name, [qubit], clbit)
+            continue
+        if name in ("qreg", "creg"):
+            raise ValueError("bad register declaration: " + statement.strip())
+        if params:
+            name += re.sub(r"\s+", "", params)
+        operands = expand(qregs, operandText)
+        if len(operands) > 2 and name != "barrier":
+            raise ValueError("gates on more than two qubits are not supported: " + statement.strip())
+        if name == "barrier":
+            add(name, sum(operands, []))
+        else:
+            # gates on whole registers apply to their bits pairwise
+            for bits in zip(*(bits * (max(map(len, operands)) if len(bits) == 1 else 1) for bits in operands)):
+                add(name, list(bits))
+
+    names = list(opcodes)
+    program = Program(sum(size for (_, size) in qregs.values()), sum(size for (_, size) in cregs.values()), names,
+                      np.array(ops, dtype=np.int32), np.concatenate(([0], np.cumsum(counts, dtype=np.int64))),
+                      np.array(qubits, dtype=np.int32), np.array(clbits, dtype=np.int32))
+    return program if keepFinalMeasurements else withoutFinalMeasurements(program)
+
+def splitParameters(text):
+    '''
+        Splits the parenthesized parameters (which may nest parentheses, e.g. 15/(7*pi)) off the start of text
+    '''
+    if not text.startswith("("):
+        return ("", text)
+    depth = 0
+    for (i, char) in enumerate(text):
+        depth += (char == "(") - (char == ")")
+        if depth == 0:
+            return (text[:i+1], text[i+1:])
+    raise ValueError("unbalanced parentheses: " + text)
+
+def withoutFinalMeasurements(program):
+    '''
+        The program without the measurements and barriers that no other gate follows on their qubits (as qiskit's
+        QuantumCircuit.remove_final_measurements)
+    '''
+    removable = np.isin(program.ops, [program.measure, program.barrier])
+    if not removable.any():
+        return program
+    # only gates after every qubit's last other gate can be final
+    gateOf = np.repeat(np.arange(len(program)), program.arity)
+    other = ~removable[gateOf]
+    lastOther = np.full(program.qubitNum, -1)
+    np.maximum.at(lastOther, program.qubits[other], gateOf[other])
+    final = np.zeros(len(program), dtype=bool)
+    blocked = np.zeros(program.qubitNum, dtype=bool)
+    for i in reversed(range(int(lastOther[program.qubits].min()) + 1, len(program))):
+        operands = program.operands(i)
+        if removable[i] and not blocked[operands].any():
+            final[i] = True
+        else:
+            blocked[operands] = True
+    if not final.any():
+        return program
+    kept = ~final
+    return Program(program.qubitNum, program.clbitNum, program.names, program.ops[kept],
+                   np.concatenate(([0], np.cumsum(program.arity[kept]))), program.qubits[np.repeat(kept, program.arity)],
+                   program.clbits[kept])
@@ -0,0 +1,144 @@
+import math
+
+import numpy as np
+
+import architectures
+
+## Regions of large devices ##
+#
+# Every instance has a mapping variable per physical and logical qubit at each
+# step, so on a device much larger than the circuit most of them are wasted.
+# The circuit is mapped onto a region instead: a connected set of physical
+# qubits, not many more than the circuit has, on which the instances are built
+# as if it were the device. A region is grown from a seed one qubit at a time,
+# each the one most tightly linked to it (by its least erroneous links if there
+# are error rates). A region's qubits are numbered in the order they were added,
+# so growing it keeps the numbers of those it has, and the chunks solved already
+# stay valid in the larger one.
+
+# qubits of a region beyond the circuit's, as a fraction of them and at least
+SLACK = 0.5
+MIN_SLACK = 2
+# devices on which a region is used by default: at least this large, and at least twice the region's size
+LARGE_DEVICE = 50
+
+
+def regionSize(logNum, physNum):
+    '''
+        The qubits of the first region for a circuit on logNum qubits, at most the device's physNum
+    '''
+    return min(physNum, max(logNum + MIN_SLACK, math.ceil(logNum * (1 + SLACK))))
+
+def autoRegionSize(logNum, physNum):
+    '''
+        regionSize's on a LARGE_DEVICE at least twice that size, None (the whole device) on any other
+    '''
+    size = regionSize(logNum, physNum)
+    return size if physNum >= LARGE_DEVICE and 2 * size <= physNum else None
+
+def regionFor(cm, logNum, setting, calibrationData=None):
+    '''
+        The Region a circuit on logNum qubits is mapped onto for setting ("off", "auto" or a number of qubits), None
+        (the whole device) for "off", with "auto" off a large device (see autoRegionSize), or when it is all of cm
+    '''
+    device = architectures.asDevice(cm)
+    size = None if setting == "off" else autoRegionSize(logNum, device.physNum) if setting == "auto" else int(setting)
+    return Region(device, logNum, size, calibrationData) if size is not None and size < device.physNum else None
+
+def linkErrors(device, calibrationData=None):
+    '''
+        The error of each link between two physical qubits (the lower one if both directions are edges), inf where
+        there is none, and 0 on every link without calibrationData (one error rate per edge)
+    '''
+    errors = np.full((device.physNum, device.physNum), np.inf)
+    weights = np.zeros(len(device.edges)) if not calibrationData else np.asarray(calibrationData, dtype=float)[:len(device.edges)]
+    errors[device.edges[:, 0], device.edges[:, 1]] = weights
+    return np.fmin(errors, errors.T)
+
+def grow(device, qubits, size, errors):
+    '''
+        Extends qubits (a connected region, in the order its qubits were added) to size qubits, adding one neighbor at
+        a time: the one with the most links into the region, of those the one with the least error on them, then the
+        one closest to the region's first qubit
+    '''
+    qubits = list(qubits)
+    linked = np.isfinite(errors)
+    inside = np.zeros(device.physNum, dtype=bool)
+    inside[qubits] = True
+    seedDistance = device.undirectedDistance[qubits[0]]
+    while len(qubits) < size:
+        links = linked[:, inside].sum(axis=1)
+        candidates = np.flatnonzero((links > 0) & ~inside)
+        if not len(candidates):
+            break
+        error = np.where(linked[np.ix_(candidates, inside)], errors[np.ix_(candidates, inside)], 0).sum(axis=1)
+        best = candidates[np.lexsort((seedDistance[candidates], error, -links[candidates]))[0]]
+        qubits.append(int(best))
+        inside[best] = True
+    return qubits
+
+def choose(device, size, calibrationData=None):
+    '''
+        A connected region of size qubits: of those grown (see grow) from each physical qubit, the one with the most
+        links, then the least mean error on them
+    '''
+    errors = linkErrors(device, calibrationData)
+    best = None
+    for seed in range(device.physNum):
+        qubits = grow(device, [seed], size, errors)
+        inner = errors[np.ix_(qubits, qubits)]
+        links = np.isfinite(inner)
+        score = (len(qubits) >= size, links.sum(), -inner[links].mean() if links.any() else 0)
+        if best is None or score > best[0]:
+            best = (score, qubits)
+    # on a device without a connected part that large, the whole device
+    return best[1] if best[0][0] else everything(device, best[1])
+
+def everything(device, qubits):
+    '''
+        All physical qubits, those of qubits first
+    '''
+    return list(qubits) + sorted(set(range(device.physNum)) - set(qubits))
+
+
+class Region:
+    '''
+        The region of the device cm a circuit on logNum qubits is mapped onto, of size qubits (by default
+        regionSize's), with the coupling map and calibrationData (one error rate per edge) restricted to it
+    '''
+
+    def __init__(self, cm, logNum, size=None, calibrationData=None):
+        self.full = architectures.asDevice(cm)
+        self.fullCalibration = calibrationData
+        self.errors = linkErrors(self.full, calibrationData)
+        size = regionSize(logNum, self.full.physNum) if size is None else min(max(size, logNum), self.full.physNum)
+        self.restrict(choose(self.full, size, calibrationData))
+        self.growths = []
+
+    def restrict(self, qubits):
+        # qubits[p] is the device's qubit that the region's qubit p stands for
+        self.qubits = np.array(qubits, dtype=int)
+        self.device = architectures.Device(self.full.cm[np.ix_(self.qubits, self.qubits)])
+        self.calibrationData = None
+        if self.fullCalibration:
+            (u, v) = self.qubits[self.device.edges.T]
+            self.calibrationData = np.asarray(self.fullCalibration)[self.full.edgeIndex[u, v]].tolist()
+
+    def __len__(self):
+        return len(self.qubits)
+
+    def canGrow(self):
+        return len(self) < self.full.physNum
+
+    def grow(self, reason):
+        '''
+            Adds half as many qubits again (at least MIN_SLACK), keeping the numbers of those in the region
+        '''
+        size = min(self.full.physNum, len(self) + max(MIN_SLACK, len(self) // 2))
+        qubits = grow(self.full, self.qubits, size, self.errors)
+        self.restrict(qubits if len(qubits) == size else everything(self.full, qubits))
+        self.growths.append((len(self), reason))
+        print("region grown to {} qubits ({})".format(len(self), reason))
+
+    def report(self):
+        print("region: {} of {} qubits {}".format(len(self), self.full.physNum, self.qubits.tolist()))
@@ -1,249 +1,340 @@
 import argparse
 import ast
+import collections
+import contextlib
+import functools
+import io
 import itertools
 import math
 import os
-import re
+import queue
 import subprocess
+import sys
+import threading
 import time
 from asyncio.subprocess import PIPE
 
 import numpy as np
-import qiskit
-import qiskit.circuit
-import qiskit.dagcircuit
-import scipy.sparse.csgraph
 from pysat.solvers import Solver
 
 import architectures
+import chunkcache
+from cardinality import ENCODINGS, atMost, atMostOne, auxCount, exactlyOne
+from chunking import MERGE_BELOW, Chunker, sliceSize
+import greedy
+from model import Model, solutionOutput
+from program import asProgram, load, parse
+from region import regionFor
+from scheduling import DeadlineScheduler
+from variables import VariableRegistry
+import verifier
+from workspace import Workspace
 
 # Controls whether debug is output (overwritten by Local if True)
 DEBUG_GLOBAL = True
 
+MAXSAT_SOLVER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lib", "Open-WBO-Inc", "open-wbo-inc_release")
 
-## OpenQASM parsing  ##
-
-
-def extractCNOTs(fname):
-    cnots = []
-    with open(fname) as f:
-        for line in f:
-            match = re.match(r'cx\s+q\[(\d+)\],\s*q\[(\d+)\];', line)
-            if match:
-                cnots.append((int(match.group(1)), int(match.group(2))))
-    return cnots
-
-
-def extractQbits(fname):
-    # Returns highest-value register used
-    highest_register_value = 0
-    with open(fname) as f:
-        for line in f:
-            if 'qreg' in line or 'creg' in line:  # these are not actual instructions
-                continue  # skip adding qbits to the set
-            match = re.findall(r'\[(\d+)\]', line)
-            for num in match:
-                num = int(num)
-                if num > highest_register_value:
-                    highest_register_value = num
-    return highest_register_value + 1  # <--register values start at 0
 
 ## Topological layering ##
 
 def getLayers(cnots):
+    '''
+        The first CNOT of each layer, a layer being a run of consecutive CNOTs on distinct qubits. Each CNOT goes
+        into the current layer unless one of its qubits is already used there, in one pass that keeps the last
+        layer of every qubit.
+    '''
     layers = [0]
-    for i in range(len(cnots)):
-        if inconsistent(cnots[:i], cnots[i]) and len(layers) == 1:
-            layers.append(i)
-        elif len(layers) >1 and  inconsistent(cnots[layers[-1]:i], cnots[i]):
+    lastLayer = {}
+    for (i, (c, t)) in enumerate(cnots):
+        if lastLayer.get(c) == len(layers) - 1 or lastLayer.get(t) == len(layers) - 1:
             layers.append(i)
+        lastLayer[c] = lastLayer[t] = len(layers) - 1
     return layers
 
-
-def inconsistent(cnots, cnot):
-    relevantQubits = [c for (c, _) in cnots] + [t for (_, t) in cnots]
-    return (cnot[0] in relevantQubits or cnot[1] in relevantQubits)
-
-def sortCnots(logNum, cnots):
-    qc = qiskit.QuantumCircuit(logNum,0)
-    for (c, t) in cnots:
-        qc.cx(c,t)
-    dag = qiskit.converters.circuit_to_dag(qc)
-    sorted_cnots = []
-    for layer in dag.layers():
-       pairs = layer["partition"]
-       sorted_cnots = sorted_cnots + list(map(lambda p: tuple(map(lambda q: q.index, p)), pairs))
-    return sorted_cnots
+def stepsOf(cnots, layering=False):
+    '''
+        The step of each CNOT: its layer with layering, its own otherwise
+    '''
+    if not layering:
+        return np.arange(len(cnots))
+    starts = np.zeros(len(cnots), dtype=int)
+    starts[getLayers(cnots)[1:]] = 1
+    return np.cumsum(starts)
 
 ## Constraint Generation ##
 
 
-def generateAndWriteClauses(logNum, liveCnots, cnots, cm, swapNum, ffClauses, path, routing=True, weighted=False, boundedAbove=False, layering=False, calibrationData=None):
+class TemplateCache:
     '''
-        Writes the constraints corresponding to a particular MaxSat Instance to the given path as a wcnf file
+        Keeps the circuit-independent part of recent instances (see encodingTemplate), least recently used first out
     '''
 
-    physNum = len(cm)
-    numCnots = len(cnots)
-    if layering:
-        layers = getLayers(cnots)
-    else: layers = list(range(len(cnots)))
+    def __init__(self, maxSize=8):
+        self.maxSize = maxSize
+        self.templates = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, build):
+        if key in self.templates:
+            self.hits += 1
+            self.templates.move_to_end(key)
+        else:
+            self.misses += 1
+            self.templates[key] = build()
+            if len(self.templates) > self.maxSize:
+                self.templates.popitem(last=False)
+        return self.templates[key]
+
+    def clear(self):
+        self.templates.clear()
+
+templateCache = TemplateCache()
+
+def encodingTemplate(device, logNum, numCnots, swapNum, stepOf, routing, weighted, boundedAbove, calibrationData, swapEncoding, cardinality, mirror=True):
+    '''
+        Encodes everything in an instance that does not depend on the circuit (beyond the step of each CNOT):
+        the variable numbering, the hard clauses other than the CNOT placements and swap cap, and the soft clauses.
+        Returns (registry, top, hard, soft, blocks), blocks being the hard clauses as arrays for the mirror solver
+        (None without a mirror).
+    '''
     # liveLog = set([c for (c,_) in liveCnots] + [t for (_,t) in liveCnots])
     liveLog = range(logNum)
-    numP = physNum * physNum * numCnots
-    numR = numP
-    numS = numCnots * physNum * physNum * swapNum
-    top = numS + numR + 1
-    s = Solver(name='cd')
-    with open(path, "w") as f:
-        f.write("p wcnf " + str(42) + " " + str(42) + " " + str(top) + "\n")
-        writeFunConConstraint(numCnots, liveLog, physNum, logNum, swapNum, top, f, satSolver=s)
-        writeInjectivityConstraint(numCnots, liveLog, physNum, logNum, swapNum, top, f, satSolver=s)
-        writeCnotConstraint(cnots, cm, physNum, logNum, swapNum, top, f, satSolver=s)
+    registry = VariableRegistry(device, logNum, numCnots, swapNum, liveLog=liveLog, stepOf=stepOf).declare("p", "r", "x")
+    layers = list(range(registry.numSteps))
+    registry.declareAux("fun_aux", (registry.numSteps * len(registry.live), auxCount(cardinality, registry.physNum)))
+    registry.declareAux("inj_aux", (registry.physNum * registry.numSteps, auxCount(cardinality, len(registry.live))))
+    if routing:
+        registry.declare("s")
+        registry.declareAux("swap_aux", (len(layers) * swapNum, auxCount(cardinality, len(registry.swaps))))
+        if swapEncoding == "stepwise":
+            registry.declare("y")
+    elif weighted:
+        registry.declare("w")
+    elif boundedAbove:
+        registry.declare("d")
+    (softWeights, softClauses) = optimizationConstraints(registry, device, routing, weighted, calibrationData)
+    top = int(np.sum(np.broadcast_to(softWeights, len(softClauses)))) + 1
+    s = MirrorSolver() if mirror else None
+    with io.StringIO() as f:
+        writeFunConConstraint(registry, top, f, satSolver=s, cardinality=cardinality)
+        writeInjectivityConstraint(registry, top, f, satSolver=s, cardinality=cardinality)
         if routing:
-            writeSwapChoiceConstraint(swapNum, layers, cm, physNum, logNum, numCnots, top, f, satSolver=s)
-            writeSwapEffectConstraint(swapNum, layers, liveLog, physNum, cm, logNum, numCnots, top, f, satSolver=s)
+            writeSwapChoiceConstraint(layers, registry, top, f, satSolver=s, cardinality=cardinality)
+            if swapEncoding == "stepwise":
+                writeStepwiseSwapEffectConstraint(layers, registry, top, f, satSolver=s)
+            else:
+                writeSwapEffectConstraint(layers, registry, top, f, satSolver=s)
         elif weighted:
-            writeDistanceConstraint(swapNum, physNum, logNum, numCnots, top, f, satSolver=s)
+            writeDistanceConstraint(registry, top, f, satSolver=s)
         elif boundedAbove:
-            writeMaxDisplacedConstraint(5, physNum, logNum, swapNum, numCnots, top, f, satSolver=s)
+            writeMaxDisplacedConstraint(5, registry, top, f, satSolver=s)
+        hard = f.getvalue()
+    with io.StringIO() as f:
+        writeClauses(f, softWeights, softClauses)
+        soft = f.getvalue()
+    return (registry, top, hard, soft, s.blocks if s else None)
+
+def generateAndWriteClauses(logNum, liveCnots, cnots, cm, swapNum, ffClauses, path, routing=True, weighted=False, boundedAbove=False, layering=False, calibrationData=None, mirror="lazy", swapEncoding="sequence", cardinality="pairwise", swapCap=None, templates=templateCache):
+    '''
+        Writes the constraints corresponding to a particular MaxSat Instance to the given path (or open stream) as a wcnf file.
+        swapEncoding is "sequence" (one clause set per sequence of swapNum swaps) or "stepwise" (linear in swapNum).
+        cardinality is the at-most-one encoding of the mapping and swap choice constraints, one of cardinality.ENCODINGS.
+        With layering, the CNOTs of each layer (see getLayers) share one mapping, and swaps happen between layers.
+        When routing, a swapCap limits the number of swaps (e.g. to those of a known solution).
+        The circuit-independent part of the instance is reused from templates (a TemplateCache, None to always rebuild it).
+        Returns the mirror SAT solver of the hard clauses (built eagerly, lazily or not at all, see MirrorSolver)
+        and the registry that numbers the instance's variables.
+    '''
+
+    device = architectures.asDevice(cm)
+    numCnots = len(cnots)
+    stepOf = stepsOf(cnots, layering)
+    build = lambda: encodingTemplate(device, logNum, numCnots, swapNum, stepOf, routing, weighted, boundedAbove, calibrationData, swapEncoding, cardinality, mirror != "off")
+    if templates is None:
+        (registry, top, hard, soft, blocks) = build()
+    else:
+        key = (device.fingerprint, logNum, numCnots, swapNum, stepOf.tobytes(), routing, weighted, boundedAbove,
+               None if calibrationData is None else tuple(calibrationData), swapEncoding, cardinality, mirror != "off")
+        (registry, top, hard, soft, blocks) = templates.get(key, build)
+    if routing and swapCap is not None:
+        # numbered after the template's variables, in a copy of its registry
+        registry = registry.copy().declareAux("cap_aux", (1, auxCount("seqcounter", registry.numSteps * swapNum, swapCap)))
+    s = MirrorSolver(eager=(mirror == "eager")) if mirror != "off" else None
+    if s:
+        for block in blocks:
+            s.append_formula(block)
+    with (open(path, "w") if type(path) is str else contextlib.nullcontext(path)) as f:
+        f.write("p wcnf " + str(registry.numVars) + " " + str(42) + " " + str(top) + "\n")
+        f.write(hard)
+        writeCnotConstraint(cnots, registry, top, f, satSolver=s)
+        if routing and swapCap is not None:
+            writeSwapCapConstraint(registry, swapCap, top, f, satSolver=s)
         for clause in ffClauses:
-            writeHardClause(f, top, clause, physNum, logNum, numCnots, swapNum)
-        writeOptimizationConstraints(swapNum, physNum, numCnots, cm, logNum, routing, weighted, calibrationData, f)
-    return s
+            writeHardClause(f, top, clause, registry)
+        f.write(soft)
+    return (s, registry)
 # Mapping Constraints #
+#
+# Each constraint family is built as integer arrays of flattened literals
+# (one row per clause) and serialized in bulk by writeClauseGroups, in the
+# same order as the nested loops it replaces.
 
 
 # Every logical qubit is mapped to exactly one physical qubit
-def writeFunConConstraint(numCnots, liveLog, physNum, logNum, swapNum, top, path, satSolver=None):
-    for k in range(numCnots):
-        for j in liveLog:
-            atLeastOneJ = []
-            for i in range(physNum):
-                atLeastOneJ.append((False,"x", i,j,k))
-                for i2 in range(i):
-                    clause=[(True, "x", i2, j, k), (True,"x", i,j,k)]
-                    writeHardClause(path, top, clause, physNum, logNum, numCnots, swapNum, satSolver=satSolver)
-            writeHardClause(path, top, atLeastOneJ, physNum, logNum, numCnots, swapNum, satSolver=satSolver)
+def writeFunConConstraint(registry, top, path, satSolver=None, cardinality="pairwise"):
+    (k, j) = np.meshgrid(np.arange(registry.numSteps), registry.live, indexing="ij")
+    (k, j) = (k.reshape(-1, 1), j.reshape(-1, 1))
+    lits = registry.ids("x", (np.arange(registry.physNum), j, k))
+    writeClauseGroups(path, top, exactlyOne(cardinality, lits, registry.block("fun_aux")), satSolver=satSolver)
 
 # No two logical qubits are mapped to the same physical qubit
-def writeInjectivityConstraint(numCnots, liveLog, physNum, logNum,  swapNum, top, path,  satSolver=None):
-    for i in range(physNum):
-        for j in liveLog:
-            for k in range(numCnots):
-                for j2 in range(j):
-                   writeHardClause(path, top, [(True, "x", i, j2, k), (True,"x",i,j,k)], physNum, logNum, numCnots, swapNum, satSolver=satSolver)
+def writeInjectivityConstraint(registry, top, path,  satSolver=None, cardinality="pairwise"):
+    (i, k) = np.meshgrid(np.arange(registry.physNum), np.arange(registry.numSteps), indexing="ij")
+    (i, k) = (i.reshape(-1, 1), k.reshape(-1, 1))
+    lits = registry.ids("x", (i, registry.live, k))
+    writeClauseGroups(path, top, atMostOne(cardinality, lits, registry.block("inj_aux")), satSolver=satSolver)
 
 
-# Control and target are mapped to adjacent physical qubits
-def writeCnotConstraint(cnots, cm, physNum, logNum, swapNum, top, path, satSolver=None):
+# Control and target are mapped to adjacent physical qubits (in the mapping of the CNOT's step)
+def writeCnotConstraint(cnots, registry, top, path, satSolver=None):
     numCnots = len(cnots)
-    for k in range(len(cnots)):
-        (c,t) = cnots[k]
-        edgeUsed = []
-        nonzeroIndices = np.argwhere(cm>0)
-        for edge in nonzeroIndices:
-            [u,v] = edge
-            edgeUsed.append((False, "p", u, v, k))
-            edgeUsed.append((False, "r",  u, v, k))
-            clauses =  [[(False, "x", u, c, k), (True, "p", u, v, k)],
-                        [(False, "x", v, t, k), (True, "p", u, v, k)],
-                        [(False, "x", u, t, k), (True, "r", u, v, k)],
-                        [(False, "x", v, c, k), (True, "r", u, v, k)]]
-            for clause in clauses:
-                writeHardClause(path, top, clause, physNum, logNum, numCnots, swapNum, satSolver=satSolver)
-        writeHardClause(path, top, edgeUsed, physNum, logNum, numCnots, swapNum, satSolver=satSolver)
+    (u, v) = registry.edges.T
+    k = np.arange(numCnots)[:, None]
+    step = registry.stepOf[:, None]
+    (c, t) = np.asarray(cnots, dtype=int).reshape(-1, 2).T[:, :, None]
+    p = registry.ids("p", (u, v, k))
+    r = registry.ids("r", (u, v, k))
+    placements = np.stack((registry.ids("x", (u, c, step)), -p,
+                           registry.ids("x", (v, t, step)), -p,
+                           registry.ids("x", (u, t, step)), -r,
+                           registry.ids("x", (v, c, step)), -r), axis=-1)
+    edgeUsed = np.stack((p, r), axis=-1)
+    writeClauseGroups(path, top, [placements.reshape(numCnots, 4 * len(u), 2), edgeUsed.reshape(numCnots, 1, 2 * len(u))], satSolver=satSolver)
 
 
 # Routing Constraints #
 
 
-def writeDistanceConstraint(swapNum, physNum, logNum, numCnots, top, path, satSolver=None):
-    for k in range(1, numCnots):
-        for i in range(physNum):
-            for i2 in range(physNum):
-                if i2 != i:
-                    for j in range(logNum):
-                        writeHardClause(path, top, [(True, "x", i, j, k-1),(True, "x", i2, j, k), (False, "w", i, i2, k)], physNum, logNum, numCnots, swapNum, satSolver=satSolver)
+def writeDistanceConstraint(registry, top, path, satSolver=None):
+    (physNum, numSteps) = (registry.physNum, registry.numSteps)
+    moved = (np.arange(numSteps) > 0)[:, None, None, None] & ~np.eye(physNum, dtype=bool)[None, :, :, None]
+    (k, i, i2, j) = np.nonzero(np.broadcast_to(moved, (numSteps, physNum, physNum, len(registry.live))))
+    j = registry.live[j]
+    clauses = np.stack((registry.ids("x", (i, j, k-1), negated=True),
+                        registry.ids("x", (i2, j, k), negated=True),
+                        registry.ids("w", (i, i2, k))), axis=-1)
+    writeClauses(path, top, clauses, satSolver=satSolver)
 
 # Exactly one swap sequence is chosen
-def writeSwapChoiceConstraint(swapNum, layers, cm, physNum, logNum, numCnots,top, path, satSolver=None):
-    allowedSwaps = np.append(np.argwhere(cm>0), [[0,0]], axis=0)
-    for k in layers:
-        for t in range(swapNum):
-            atLeastOne = []
-            for (u,v) in allowedSwaps:
-                i = 0
-                atLeastOne.append((False, "s", u, v, t, k))
-                if i != 0:
-                    writeHardClause(path, top, [(True, "s", u, v, t, k), (False,"b", i-1, t, k)], physNum, logNum, numCnots, swapNum, satSolver=satSolver)
-                    writeHardClause(path, top, [(True, "s", u, v, t, k), (True, "b", i, t, k)], physNum, logNum, numCnots, swapNum, satSolver=satSolver)
-                    writeHardClause(path, top, [(True,"b", i-1, t, k), (False, "b", i, t, k), (False, "s", u, v, t, k)], physNum, logNum, numCnots, swapNum, satSolver=satSolver)
-                writeHardClause(path, top, [(False, "b", i, t, k), (True,"b", i+1, t, k)], physNum, logNum, numCnots, swapNum, satSolver=satSolver)
-                i += 1
-            writeHardClause(path, top, atLeastOne, physNum, logNum, numCnots, swapNum, satSolver=satSolver)
+def writeSwapChoiceConstraint(layers, registry, top, path, satSolver=None, cardinality="pairwise"):
+    allowedSwaps = registry.swaps
+    (k, t) = np.meshgrid(np.asarray(layers, dtype=int), np.arange(registry.swapNum), indexing="ij")
+    (k, t) = (k.reshape(-1, 1), t.reshape(-1, 1))
+    lits = registry.ids("s", (allowedSwaps[:, 0], allowedSwaps[:, 1], t, k))
+    writeClauseGroups(path, top, exactlyOne(cardinality, lits, registry.block("swap_aux")), satSolver=satSolver)
 
 
+def swapTransitions(layers, registry):
+    '''
+        Returns (step, prev, current, i, j) arrays, one entry per transition between gates and
+        mapped pair of physical and logical qubit, ordered by step, physical qubit and logical qubit
+    '''
+    (physNum, live) = (registry.physNum, registry.live)
+    transitions = []
+    for k in range(1, len(layers)):
+        if k == len(layers)-1: currentRange = [layers[k]]
+        else: currentRange = range(layers[k], layers[k+1])
+        transitions.extend((layers[k], prev, current) for prev in range(layers[k-1], layers[k]) for current in currentRange)
+    (step, prev, current) = np.array(transitions, dtype=int).reshape(-1, 3).T
+    (n, i, j) = (a.ravel() for a in np.indices((len(step), physNum, len(live))))
+    order = np.lexsort((n, j, i, step[n]))
+    (n, i, j) = (n[order], i[order], live[j[order]])
+    return (step[n], prev[n], current[n], i, j)
+
+# At most swapCap swaps are made in all, "no swap" being the only choice that is not one
+def writeSwapCapConstraint(registry, swapCap, top, path, satSolver=None):
+    (k, t) = (a.ravel() for a in np.indices((registry.numSteps, registry.swapNum)))
+    swapped = registry.ids("s", (np.zeros_like(t), np.zeros_like(t), t, k), negated=True)[None, :]
+    writeClauseGroups(path, top, atMost("seqcounter", swapped, registry.block("cap_aux"), swapCap), satSolver=satSolver)
+
 # The chosen swap sequence determines the next mapping
-def writeSwapEffectConstraint(swapNum, layers, liveLog, physNum, cm, logNum, numCnots, top, path, satSolver=None):
-    allowedSwaps = np.append(np.argwhere(cm>0), [[0,0]], axis=0)
-    swapSeqs = itertools.product(allowedSwaps, repeat=swapNum)
-    for swapSeq in swapSeqs:
-        indexed_swaps = list(enumerate(swapSeq))
-        for k in range(1, len(layers)):
-            swapLits = [(True, "s", u, v, t, layers[k]) for (t, [u,v]) in indexed_swaps]
-            for i in range(physNum):
-                for j in liveLog:
-                    for prev in range(layers[k-1], layers[k]):
-                        if k == len(layers)-1: currentRange = [layers[k]]
-                        else: currentRange = range(layers[k], layers[ k+1])
-                        for current in currentRange:
-                            writeHardClause(path, top, swapLits + [(False, "x", i, j, prev), (True, "x", composeSwaps(swapSeq, physNum)[i], j, current)], physNum, logNum, numCnots, swapNum, satSolver=satSolver)
-                            writeHardClause(path, top, swapLits + [(True, "x", i, j, prev), (False, "x", composeSwaps(swapSeq, physNum)[i], j, current)], physNum, logNum, numCnots, swapNum, satSolver=satSolver)
-
-def writeMaxDisplacedConstraint(maxDisplaced, physNum, logNum, swapNum, numCnots, top, path, satSolver=None):
-    for k in range(1,numCnots):
-        for i in range(physNum):
-            for j in range(logNum):
-             writeHardClause(path, top, [(True, "x", i, j, k-1), (False, "x", i, j, k), (False, "d", j, k)],  physNum, logNum, numCnots, swapNum, satSolver=satSolver)
-    displacementSets = itertools.combinations([(True, "d", j, k) for j in range(logNum) for k in range(numCnots)], maxDisplaced)
+def writeSwapEffectConstraint(layers, registry, top, path, satSolver=None):
+    (physNum, swapNum) = (registry.physNum, registry.swapNum)
+    (step, prev, current, i, j) = swapTransitions(layers, registry)
+    before = registry.ids("x", (i, j, prev))
+    for swapSeq in itertools.product(registry.swaps, repeat=swapNum):
+        perm = composeSwapPermutations(swapSeq, physNum)
+        swapLits = [registry.ids("s", (u, v, t, step), negated=True) for (t, [u, v]) in enumerate(swapSeq)]
+        after = registry.ids("x", (perm[i], j, current))
+        clauses = np.stack((np.column_stack(swapLits + [before, -after]),
+                            np.column_stack(swapLits + [-before, after])), axis=1)
+        writeClauses(path, top, clauses.reshape(-1, swapNum+2), satSolver=satSolver)
+
+# Each swap takes the mapping one step further, through the intermediate mappings y
+def writeStepwiseSwapEffectConstraint(layers, registry, top, path, satSolver=None):
+    swapNum = registry.swapNum
+    (step, prev, current, i, j) = swapTransitions(layers, registry)
+    for t in range(swapNum):
+        before = registry.ids("x", (i, j, prev)) if t == 0 else registry.ids("y", (i, j, t-1, current))
+        for (u, v) in registry.swaps:
+            perm = swapPermutation(int(u), int(v), registry.physNum)
+            after = registry.ids("x", (perm[i], j, current)) if t == swapNum-1 else registry.ids("y", (perm[i], j, t, current))
+            swapLit = registry.ids("s", (u, v, t, step), negated=True)
+            clauses = np.stack((np.column_stack((swapLit, before, -after)),
+                                np.column_stack((swapLit, -before, after))), axis=1)
+            writeClauses(path, top, clauses.reshape(-1, 3), satSolver=satSolver)
+
+def writeMaxDisplacedConstraint(maxDisplaced, registry, top, path, satSolver=None):
+    for k in range(1,registry.numSteps):
+        for i in range(registry.physNum):
+            for j in registry.live:
+             writeHardClause(path, top, [(True, "x", i, j, k-1), (False, "x", i, j, k), (False, "d", j, k)], registry, satSolver=satSolver)
+    displacementSets = itertools.combinations([(True, "d", j, k) for j in range(registry.logNum) for k in range(registry.numSteps)], maxDisplaced)
     for displacementSet in displacementSets:
-            writeHardClause(path, top, displacementSet, physNum, logNum, numCnots, swapNum, satSolver=satSolver)
+            writeHardClause(path, top, displacementSet, registry, satSolver=satSolver)
 
 # Soft Constraints #
 
-def writeOptimizationConstraints(swapNum, physNum, numCnots, cm, logNum, routing, weighted, calibrationData, path):
+def optimizationConstraints(registry, device, routing, weighted, calibrationData):
+    '''
+        Returns the soft clauses as (weights, clauses), weights being shared or one per clause
+    '''
+    (physNum, numCnots, numSteps, swapNum) = (registry.physNum, registry.numCnots, registry.numSteps, registry.swapNum)
     if routing:
+        (u, v) = registry.edges.T
         if calibrationData:
-            edges = np.argwhere(cm>0)
-            for k in range(numCnots):
-                    for i in range(len(edges)):
-                        [u, v] = edges[i]
-                        success_rate = 1-calibrationData[i]
-
-                        writeSoftClause(path, (-1000*math.log(success_rate), [(True, "p", u, v, k)]), physNum, logNum, numCnots, swapNum)
-                        writeSoftClause(path, (-1000*math.log(success_rate), [(True, "r", u, v, k)]), physNum, logNum, numCnots, swapNum)
-                        for t in range(swapNum):
-                            writeSoftClause(path, (-3000*math.log(success_rate), [(True, "s", u, v, t, k)]), physNum, logNum, numCnots, swapNum)
+            logSuccess = np.array([math.log(1-err) for err in calibrationData[:len(u)]])
+            if numSteps == numCnots:
+                k = np.arange(numCnots)[:, None]
+                lits = np.stack([registry.ids("p", (u, v, k), negated=True),
+                                 registry.ids("r", (u, v, k), negated=True)] +
+                                [registry.ids("s", (u, v, t, k), negated=True) for t in range(swapNum)], axis=-1)
+                weights = np.broadcast_to(np.stack([-1000*logSuccess, -1000*logSuccess] + [-3000*logSuccess]*swapNum, axis=-1), lits.shape)
+                return (weights.astype(np.int64).ravel(), lits.reshape(-1, 1))
+            # with layering the placements are per CNOT and the swaps per layer
+            (k, step) = (np.arange(numCnots)[:, None], np.arange(numSteps)[:, None, None])
+            placements = np.stack((registry.ids("p", (u, v, k), negated=True), registry.ids("r", (u, v, k), negated=True)), axis=-1)
+            swaps = registry.ids("s", (u[:, None], v[:, None], np.arange(swapNum), step), negated=True)
+            weights = np.concatenate((np.broadcast_to(-1000*logSuccess[:, None], placements.shape).ravel(),
+                                      np.broadcast_to(-3000*logSuccess[:, None], swaps.shape).ravel()))
+            return (weights.astype(np.int64), np.concatenate((placements.ravel(), swaps.ravel()))[:, None])
 
         else:
-            for k in range(numCnots):
-                for t in range(swapNum):
-                    for (u,v) in itertools.product(range(physNum), repeat=2):
-                        if u != v:
-                            writeSoftClause(path, (1, [(True, "s", u, v, t, k)]), physNum, logNum, numCnots, swapNum)
+            (k, t, e) = (a.ravel() for a in np.indices((numSteps, swapNum, len(u))))
+            return (1, registry.ids("s", (u[e], v[e], t, k), negated=True)[:, None])
     elif weighted:
-            for k in range(1, numCnots):
-                for i in range(physNum):
-                    for i2 in range(physNum):
-                        if i != i2:
-                            writeSoftClause(path, (scipy.sparse.csgraph.shortest_path(cm)[i][i2], [(True, "w", i, i2, k)]), physNum, logNum, numCnots, swapNum)
+            dist = device.distance
+            moved = (np.arange(numSteps) > 0)[:, None, None] & ~np.eye(physNum, dtype=bool)
+            (k, i, i2) = np.nonzero(moved)
+            return (dist[i, i2].astype(np.int64), registry.ids("w", (i, i2, k), negated=True)[:, None])
     else:
-        for k in range(1, numCnots):
-                for i in range(physNum):
-                    for j in range(logNum):
-                        writeSoftClause(path, (1, [(True, "x", i, j, k-1), (False, "x", i, j, k)]), physNum, logNum, numCnots, swapNum)
-                        #writeSoftClause(path, (1, [(False, "x", i, j, k-1), (True, "x", i, j, k)]), physNum, logNum, numCnots, swapNum)
+        (k, i, j) = np.nonzero(np.broadcast_to((np.arange(numSteps) > 0)[:, None, None], (numSteps, physNum, len(registry.live))))
+        j = registry.live[j]
+        return (1, np.stack((registry.ids("x", (i, j, k-1)),
+                             registry.ids("x", (i, j, k), negated=True)), axis=-1))
+        #writeSoftClause(path, (1, [(False, "x", i, j, k-1), (True, "x", i, j, k)]), physNum, logNum, numCnots, swapNum)
 
 
 
@@ -263,48 +354,28 @@ def composeSwaps(swapSeq, physNum):
         applySwap(swap, current)
     return current
 
+@functools.lru_cache(maxsize=None)
+def swapPermutation(u, v, physNum):
+    '''
+        Where each physical qubit's state ends up after swapping u and v (read-only)
+    '''
+    perm = np.arange(physNum)
+    (perm[u], perm[v]) = (v, u)
+    perm.flags.writeable = False
+    return perm
+
+def composeSwapPermutations(swapSeq, physNum):
+    perm = np.arange(physNum)
+    for (u, v) in swapSeq:
+        perm = swapPermutation(int(u), int(v), physNum)[perm]
+    return perm
+
 ## Conversion to MaxSat solver input format ##
 
-def flattenedIndex(lit, physNum, logNum, numCnots, swapNum):
-    '''
-        Converts the tuple representation of literals into integers
-    '''
-    numX = numCnots * logNum * physNum
-    numP = physNum * physNum * numCnots
-    numR = numP
-    numS = numCnots * physNum * physNum * swapNum
-    numB = numS
-    numW = physNum * physNum * numCnots
-    indices = lit[2:]
-    if lit[1] == "p":
-        pos = np.ravel_multi_index(indices, (physNum, physNum, numCnots))
-    elif lit[1] == "r":
-        pos = (np.ravel_multi_index(indices, (physNum, physNum, numCnots)) + numP)
-    elif lit[1] == "x":
-        pos = (np.ravel_multi_index(
-            indices, (physNum, logNum, numCnots)) + numP + numR)
-    elif lit[1] == "s":
-        pos = (np.ravel_multi_index(
-            indices, (physNum, physNum, swapNum, numCnots)) + numP + numR + numX)
-    elif lit[1] == "b":
-        pos = (np.ravel_multi_index(indices, (physNum * physNum,
-               swapNum, numCnots)) + numP + numR + numX+numS)
-    elif lit[1] == "w":
-        pos = (np.ravel_multi_index(indices, (physNum, physNum, numCnots)) + numP + numR + numX+numS + numB)
-    elif lit[1] == "d":
-        pos = (np.ravel_multi_index(indices, (logNum, numCnots)) + numP + numR + numX+numS + numB + numW)
-    pos = pos + 1
-    if lit[0]:
-        pos = -pos
-    return pos
-
-def flattenedWeightedClause(clause, physNum, logNum, numCnots, swapNum): return (clause[0], [flattenedIndex(lit, physNum, logNum, numCnots, swapNum) for lit in clause[1]])
-def flattenedClause(clause, physNum, logNum, numCnots, swapNum): return [flattenedIndex(lit, physNum, logNum, numCnots, swapNum) for lit in clause]
-
-def writeHardClause(f, top, clause, physNum, logNum, numCnots, swapNum, satSolver=None):
-        flatClause = flattenedClause(clause, physNum, logNum, numCnots, swapNum)
+def writeHardClause(f, top, clause, registry, satSolver=None):
+        flatClause = registry.flattenedClause(clause)
         if satSolver:
-            satSolver.add_clause([int(lit) for lit in flatClause])
+            satSolver.add_clause(flatClause)
         f.write(str(top))
         f.write(" ")
         for lit in flatClause:
@@ -312,76 +383,135 @@ def writeHardClause(f, top, clause, physNum, logNum, numCnots, swapNum, satSolve
             f.write(" ")
         f.write("0\n")
 
-def writeSoftClause(f, clause, physNum, logNum, numCnots, swapNum):
-    flattenedClause = flattenedWeightedClause(clause, physNum, logNum, numCnots, swapNum)
+def writeSoftClause(f, clause, registry):
+    flattenedClause = registry.flattenedClause(clause[1])
     f.write(str(int(clause[0])))
     f.write(" ")
-    for lit in flattenedClause[1]:
+    for lit in flattenedClause:
         f.write(str(lit))
         f.write(" ")
     f.write("0\n")
 
+def writeClauses(f, weights, clauses, satSolver=None):
+    '''
+        Writes a 2D array of flattened literals, one clause per row, with a shared or per-row weight
+    '''
+    writeClauseGroups(f, np.reshape(weights, (1, -1)) if np.ndim(weights) else weights, [clauses[None]], satSolver=satSolver)
+
+def writeClauseGroups(f, weight, blocks, satSolver=None):
+    '''
+        Writes blocks of flattened literals shaped (groups, rows, width) in bulk.
+        Group by group, the rows of every block are written one block after the other.
+    '''
+    # e.g. an at-most-one over a single literal, or an empty slice
+    if not blocks or not len(blocks[0]):
+        return
+    numGroups = len(blocks[0])
+    rowFormat = ""
+    columns = []
+    for block in blocks:
+        (_, rows, width) = block.shape
+        rowFormat += ("%d " * (width + 1) + "0\n") * rows
+        weights = np.broadcast_to(np.asarray(weight)[..., None], (numGroups, rows, 1))
+        columns.append(np.concatenate((weights, block), axis=2).reshape(numGroups, -1))
+        if satSolver and rows:
+            satSolver.append_formula(block.reshape(-1, width))
+    values = np.concatenate(columns, axis=1)
+    step = max(1, 2**20 // max(1, values.shape[1]))
+    for g in range(0, numGroups, step):
+        f.write(rowFormat * len(values[g:g+step]) % tuple(values[g:g+step].ravel().tolist()))
+
+class MirrorSolver:
+    '''
+        The hard clauses of an instance, kept as compact int32 blocks. The CaDiCaL solver that
+        backtracking queries is only built from them the first time it is used.
+    '''
+
+    def __init__(self, eager=False):
+        self.blocks = []
+        self.solver = None
+        self.eager = eager
+
+    def add_clause(self, clause):
+        self.append_formula(np.asarray([clause]))
+
+    def append_formula(self, clauses):
+        if self.solver:
+            self.solver.append_formula(np.asarray(clauses).tolist())
+        else:
+            self.blocks.append(np.asarray(clauses, dtype=np.int32))
+            if self.eager:
+                self.build()
+
+    def build(self):
+        if not self.solver:
+            self.solver = Solver(name='cd')
+            for block in self.blocks:
+                self.solver.append_formula(block.tolist())
+            self.blocks = []
+        return self.solver
+
+    def delete(self):
+        if self.solver:
+            self.solver.delete()
+        self.solver = None
+        self.blocks = []
+
+    def __getattr__(self, name):
+        # anything else (solve, get_model, ...) goes to the built solver
+        return getattr(self.build(), name)
+
 ## Reading MaxSat solver output ##
 
-def unravel(flatLit, physNum, logNum, numCnots, swapNum):
-    numX = numCnots * logNum * physNum
-    numP = physNum * physNum * numCnots
-    numR = numP
-    numS = numCnots * swapNum * physNum * physNum
-    numB = numS
-    numW = physNum * physNum * numCnots
-    flipped = flatLit < 0
-    shifted = abs(flatLit) - 1
-    if shifted < numP:
-        return (flipped, "p", np.unravel_index(shifted, (physNum, physNum, numCnots)))
-    elif shifted < (numP + numR):
-        return (flipped, "r", np.unravel_index(shifted-numP, (physNum, physNum, numCnots)))
-    elif shifted < (numX + numP + numR):
-        return (flipped, "x", np.unravel_index(shifted-(numP+numR), (physNum, logNum, numCnots)))
-    elif shifted < (numP+numR+numX+numS):
-        return (flipped, "s", np.unravel_index(shifted-(numP+numR+numX), (physNum, physNum, swapNum, numCnots)))
-    elif shifted < (numP+numR+numX+numS+numB):
-        return (flipped, "b", np.unravel_index(shifted-(numP+numR+numX+numS), (physNum*physNum, swapNum, numCnots)))
-    elif shifted < (numP+numR+numX+numS+numB+numW):
-        return (flipped, "w", np.unravel_index(shifted-(numP+numR+numX+numS+numB), (physNum, physNum,numCnots)))
-    else:
-        return (flipped, "d", np.unravel_index(shifted-(numP+numR+numX+numS+numB+numW), (logNum, numCnots)))
+def solverOutputLines(source):
+    '''
+        The lines of a MaxSat solver's output, kept either in a file (source is its path) or in memory
+    '''
+    if type(source) is str:
+        with open(source) as f:
+            return f.readlines()
+    return source
 
+def solutionRegistry(device, logNum, swapNum, stepOf):
+    '''
+        The mapping and swap variables of a chunk, for a solution the solver did not find (see model.solutionOutput)
+    '''
+    return VariableRegistry(device, logNum, len(stepOf), swapNum, stepOf=stepOf).declare("p", "r", "x", "s")
 
-def readMaxSatOutput(physNum, logNum, numCnots, swapNum, fname):
-    with open(fname) as f:
-        for line in f:
-            if line.startswith("v"):
-                lits = line.split()[1:]
-                return [unravel(int(lit), physNum, logNum, numCnots, swapNum) for lit in lits]
-    return []
+def readModel(registry, source):
+    '''
+        Decodes the model in a MaxSat solver's output (a path or lines) or held by a PySat solver, once per chunk
+    '''
+    if type(source) in (str, list):
+        return Model.fromOutput(registry, solverOutputLines(source))
+    return Model.fromSolver(registry, source)
 
-def readPySatOutput(physNum, logNum, numCnots, swapNum, solver):
-    lits = solver.get_model()
-    return [unravel(int(lit), physNum, logNum, numCnots, swapNum) for lit in lits]
 
 
 
+def solverStatus(source):
+    '''
+        The status open-wbo reported on its "s" line (e.g. OPTIMUM FOUND), None if it has not reported any
+    '''
+    for line in solverOutputLines(source):
+        if line.startswith("s "):
+            return line[2:].strip()
+    return None
 
-def readCost(fname):
+def readCost(source):
     best = math.inf
-    with open(fname) as f:
-        for line in f:
-            if line.startswith("o") and int(line.split()[1]) < best:
-                best = int(line.split()[1])
+    for line in solverOutputLines(source):
+        if line.startswith("o") and int(line.split()[1]) < best:
+            best = int(line.split()[1])
     return best
 
 
-def mappingVars(parseFun, physNum, logNum, numCnots, permNum, source):
-    return map(lambda x: x[2], filter(lambda x: not x[0] and x[1] == "x", parseFun(physNum, logNum, numCnots, permNum, source)))
-
-
 ## Interface with Haskell for no route version
 
 def writeForRouting(initial, final, cm, fname="toHaskell.txt"):
     init_no_k = [(y,x) for (x,y, _) in initial]
     final_no_k = [(y,x) for (x,y, _) in final]
-    a = scipy.sparse.csgraph.shortest_path(cm)
+    a = architectures.asDevice(cm).distance
     d = [((i,j), int(a[i][j])) for i in range(len(cm)) for j in range(len(cm))]
     with open(fname, "w") as f:
         print( init_no_k, file=f)
@@ -404,32 +534,159 @@ def swapsFromMaps(initial, final, mapStr):
 
 ## Solving ##
 
-def extractMappingCore(solver, initialMapping, logNum, physNum, numCnots, swapNum):
-    i = 1
-    for i in range(1,len(initialMapping)):
-        submaps = list(itertools.combinations(initialMapping, i))
-        for submap in submaps:
-            assump = []
-            for clause in submap:
-                flatClause = flattenedClause(clause, physNum, logNum, numCnots, swapNum)
-                assump.append(int(flatClause[0]))
-            if not solver.solve(assumptions = assump):
-                return submap
-
+class TeeWriter:
+    def __init__(self, *streams):
+        self.streams = streams
 
+    def write(self, data):
+        for stream in self.streams:
+            stream.write(data)
 
-def solve_bounded_above(progName, cm, swapNum, chunks, pname="test", sname="out"):
+def runMaxSat(writeInstance, cnfPath, outPath, timeout, iterations=100, stream=False, keepArtifacts=False, portfolio=None, lowerBound=None, stall=None):
+    '''
+        Encodes an instance with writeInstance(f) and runs open-wbo-inc on it, in parallel once per configuration
+        (a string of solver arguments) of the portfolio, by default only with -iterations. The instance goes through
+        cnfPath, or with stream straight into the solvers' stdin, in which case the output is kept in memory
+        and the files are only written with keepArtifacts.
+        The first solver to prove its answer wins, otherwise the one with the best model when the timeout
+        (in wall-clock seconds from the call, encoding included, None for no limit) is up. The solvers' costs are
+        followed as they improve, and they are stopped early once a cost reaches lowerBound, or when it has not
+        improved for stall seconds.
+        Returns what writeInstance returned, the winner's output (its path or its lines), the encoding time
+        and the winning configuration.
+    '''
+    configs = portfolio or ["-iterations="+str(iterations)]
+    gen_write_s = time.monotonic()
+    deadline = None if timeout is None else gen_write_s + timeout
+    if not stream:
+        result = writeInstance(cnfPath)
+        gen_write_f = time.monotonic()
+    (procs, readers) = ([], [])
+    outputs = [[] for _ in configs]
+    # (solver, cost) for every "o" line, (solver, None) when a solver is done
+    events = queue.Queue()
+    def collect(n):
+        for line in procs[n].stdout:
+            outputs[n].append(line)
+            if line.startswith("o "):
+                events.put((n, int(line.split()[1])))
+        events.put((n, None))
+    (winner, finished) = (None, False)
+    try:
+        for config in configs:
+            procs.append(subprocess.Popen([MAXSAT_SOLVER] + config.split() + ([] if stream else [cnfPath]),
+                                          stdin=subprocess.PIPE if stream else None, stdout=subprocess.PIPE, text=True))
+        for n in range(len(procs)):
+            readers.append(threading.Thread(target=collect, args=(n,)))
+            readers[n].start()
+        if stream:
+            with contextlib.ExitStack() as artifacts:
+                sinks = [p.stdin for p in procs] + ([artifacts.enter_context(open(cnfPath, "w"))] if keepArtifacts else [])
+                try:
+                    result = writeInstance(TeeWriter(*sinks))
+                    for p in procs:
+                        p.stdin.close()
+                except BrokenPipeError:
+                    raise RuntimeError("open-wbo exited while reading the instance")
+            gen_write_f = time.monotonic()
+        running = len(procs)
+        (best, improved) = (math.inf, time.monotonic())
+        while running:
+            stalled = improved + stall if stall is not None and best < math.inf else None
+            until = min([t for t in (deadline, stalled) if t is not None], default=None)
+            try:
+                (n, cost) = events.get(timeout=None if until is None else max(0, until - time.monotonic()))
+            except queue.Empty:
+                if until == deadline:
+                    print("exiting open-wbo because of solve time alloted...")
+                else:
+                    print("exiting open-wbo, no improvement on cost", best, "for", stall, "seconds")
+                break
+            if cost is None:
+                running -= 1
+                if solverStatus(outputs[n]) in ("OPTIMUM FOUND", "UNSATISFIABLE"):
+                    winner = n
+                    break
+            elif cost < best:
+                (best, improved) = (cost, time.monotonic())
+                if lowerBound is not None and best <= lowerBound:
+                    print("exiting open-wbo, cost", best, "matches the lower bound")
+                    break
+        finished = True
+    finally:
+        # every solver is stopped and its reader joined, also when encoding or solving failed
+        for p in procs:
+            if p.poll() is None:
+                # on SIGTERM open-wbo still prints its best model, which only matters without a winner
+                p.terminate() if winner is None and finished else p.kill()
+        for p in procs:
+            # wait for the solver to write out its model and exit, but not forever
+            try:
+                p.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                p.kill()
+                p.wait()
+            if p.stdin and not p.stdin.closed:
+                try:
+                    p.stdin.close()
+                except BrokenPipeError:
+                    pass
+        for reader in readers:
+            reader.join()
+    if winner is None:
+        winner = min(range(len(procs)), key=lambda n: (not any(line.startswith("v") for line in outputs[n]), readCost(outputs[n])))
+    if not stream or keepArtifacts:
+        with open(outPath, "w") as f:
+            f.writelines(outputs[winner])
+    return (result, outputs[winner] if stream else outPath, gen_write_f - gen_write_s, configs[winner])
+
+def extractMappingCore(solver, initialMapping, registry, timeout=None):
+    '''
+        A part of the boundary mapping initialMapping (unit clauses) under which the chunk's hard clauses are unsatisfiable.
+        Takes the core of one solver call assuming the whole mapping and shrinks it by deletion, so the result is
+        minimal unless timeout (seconds) runs out first. Returns the core and the size of the first core found; the core
+        is empty when the hard clauses are unsatisfiable under any boundary mapping.
+    '''
+    deadline = None if timeout is None else time.monotonic() + timeout
+    lits = [registry.flattenedIndex(clause[0]) for clause in initialMapping]
+    byLit = dict(zip(lits, initialMapping))
+    if solver.solve(assumptions=lits):
+        # the mapping is not to blame on its own (e.g. the chunk timed out), rule out all of it
+        return (list(initialMapping), len(initialMapping))
+    inCore = set(solver.get_core())
+    core = [lit for lit in lits if lit in inCore]
+    found = len(core)
+    i = 0
+    # down to no literal at all, when the hard clauses are unsatisfiable on their own
+    while i < len(core) and (deadline is None or time.monotonic() < deadline):
+        rest = core[:i] + core[i+1:]
+        if solver.solve(assumptions=rest):
+            i += 1
+        else:
+            inCore = set(solver.get_core() or [])
+            core = [lit for lit in rest if lit in inCore]
+    return ([byLit[lit] for lit in core], found)
+
+def reportBacktracks(backtracks):
+    if not backtracks:
+        return
+    print("chunk  first core  minimized  core time")
+    for (chunk, found, size, seconds) in backtracks:
+        print("{:5d} {:11d} {:10d} {:9.2f}s".format(chunk, found, size, seconds))
+    print("{} backtracks, {:.2f}s extracting cores".format(len(backtracks), sum(seconds for (_, _, _, seconds) in backtracks)))
+
+def solve_bounded_above(progName, cm, swapNum, chunks, pname="test", sname="out", core_timeout=10, workspace=None):
+    ''' progName is a path or a parsed Program. Scratch files go to workspace (a Workspace, tmp/ if None) '''
+    cm = architectures.asDevice(cm)
+    workspace = workspace or Workspace("tmp")
     return_results = {}
     cost = 0  # <-- number of SWAPs added
     time_elapsed_wbo = 0
     physNum = len(cm)
-    logNum = extractQbits(progName)
+    program = asProgram(progName)
+    logNum = program.logNum
     return_results = {}
-    hack = qiskit.QuantumCircuit.from_qasm_file(progName)
-    (head, tail) = os.path.split(progName)
-    with open(os.path.join('tmp', "tmpqiskit-" + tail), "w") as f:
-        f.write(hack.qasm())
-    cnots = extractCNOTs(os.path.join('tmp', "tmpqiskit-" + tail))
+    cnots = program.cnots()
     numCnots = len(cnots)
 
     layers= range(len(cnots))
@@ -438,6 +695,9 @@ def solve_bounded_above(progName, cm, swapNum, chunks, pname="test", sname="out"
     addedSwaps = [0 for _ in range(chunks)]
     negatedModels = [[] for i in range(chunks)]
     solvers = [None for i in range(chunks)]
+    registries = [None for i in range(chunks)]
+    models = [None for i in range(chunks)]
+    backtracks = []
     while currentChunk < chunks:
         # print("current chunk is", currentChunk)
         # print("negated", len(negatedModels[currentChunk]), "models")
@@ -448,7 +708,7 @@ def solve_bounded_above(progName, cm, swapNum, chunks, pname="test", sname="out"
         if currentChunk == 0:
             swapBack = []
             gen_write_s = time.process_time()
-            solvers[currentChunk] = generateAndWriteClauses(logNum, cnots[:end], cnots[:end], cm, swapNum+addedSwaps[0], negatedModels[0] + swapBack, "tmp/"+pname+"-chnk"+str(currentChunk)+".cnf", boundedAbove=True, routing=False)
+            (solvers[currentChunk], registries[currentChunk]) = generateAndWriteClauses(logNum, cnots[:end], cnots[:end], cm, swapNum+addedSwaps[0], negatedModels[0] + swapBack, workspace.path(pname+"-chnk"+str(currentChunk)+".cnf"), boundedAbove=True, routing=False)
             gen_write_f = time.process_time()
             # print("generation and write time:", gen_write_f - gen_write_s)
             t_s = time.process_time()
@@ -456,28 +716,31 @@ def solve_bounded_above(progName, cm, swapNum, chunks, pname="test", sname="out"
             t_f = time.process_time()
         else:
             prevSize = layers[chunkSize*currentChunk] - layers[chunkSize*(currentChunk-1)]
-            prevAssignments = filter(lambda x : x[2] == prevSize-1, mappingVars(readPySatOutput, physNum, logNum, prevSize, swapNum+addedSwaps[currentChunk-1], solvers[currentChunk-1]))
+            prevAssignments = models[currentChunk-1].assignments(prevSize-1)
             consistencyClauses = [[(False, "x", phys, log, 0)] for (phys, log, _) in prevAssignments]
             swapBack = []
             gen_write_s = time.process_time()
             print("start:", layers[chunkSize*(currentChunk)])
             print("end:", end)
-            solvers[currentChunk] = generateAndWriteClauses(logNum, cnots[:end], cnots[layers[chunkSize*(currentChunk)]:end], cm, swapNum+addedSwaps[currentChunk], consistencyClauses+negatedModels[currentChunk]+swapBack,  "tmp/"+pname+"-chnk"+str(currentChunk)+".cnf", boundedAbove=True, routing=False)
+            (solvers[currentChunk], registries[currentChunk]) = generateAndWriteClauses(logNum, cnots[:end], cnots[layers[chunkSize*(currentChunk)]:end], cm, swapNum+addedSwaps[currentChunk], consistencyClauses+negatedModels[currentChunk]+swapBack,  workspace.path(pname+"-chnk"+str(currentChunk)+".cnf"), boundedAbove=True, routing=False)
             gen_write_f = time.process_time()
             print("generation and write time:", gen_write_f - gen_write_s)
             t_s = time.process_time()
             solvers[currentChunk].solve()
             t_f = time.process_time()
-        if solvers[currentChunk].solve():
+        models[currentChunk] = readModel(registries[currentChunk], solvers[currentChunk])
+        if models[currentChunk]:
             print("chunk", currentChunk, "solved")
             currentChunk = currentChunk+1
         else:
                 if len(negatedModels[currentChunk-1]) < 50*(addedSwaps[currentChunk]+1):
                     print("got stuck on chunk", currentChunk, "backtracking to chunk", currentChunk-1)
-                    prevAssignments = filter(lambda x : x[2] == prevSize-1, mappingVars(readPySatOutput, physNum, logNum, prevSize, swapNum+addedSwaps[currentChunk-1], solvers[currentChunk-1]))
+                    prevAssignments = models[currentChunk-1].assignments(prevSize-1)
                     negatedModel =  [(True, "x", phys, log, lastGate) for (phys, log, lastGate) in prevAssignments]
                     print(negatedModel)
-                    core = extractMappingCore(solvers[currentChunk], consistencyClauses,  logNum, len(cm), currentSize, swapNum+addedSwaps[currentChunk])
+                    core_start = time.monotonic()
+                    (core, found) = extractMappingCore(solvers[currentChunk], consistencyClauses, registries[currentChunk], timeout=core_timeout)
+                    backtracks.append((currentChunk, found, len(core), time.monotonic() - core_start))
                     negatedSubmap = [(True, x, phys, log, prevSize-1) for [(_, x, phys, log, _)] in  core]
                     print(negatedSubmap)
                     negatedModels[currentChunk-1].append(negatedSubmap)
@@ -494,11 +757,11 @@ def solve_bounded_above(progName, cm, swapNum, chunks, pname="test", sname="out"
         else: end = layers[chunkSize*(i+1)]
         size = end - layers[chunkSize*(i)]
         for k in range(1,size):
-            initial = list(filter(lambda x : x[2] == k-1, mappingVars(readPySatOutput, physNum, logNum, size, swapNum+addedSwaps[i], solvers[i])))
-            final = list(filter(lambda x : x[2] == k, mappingVars(readPySatOutput, physNum, logNum, size, swapNum+addedSwaps[i], solvers[i])))
-            writeForRouting(initial, final, cm)
+            initial = models[i].assignments(k-1)
+            final = models[i].assignments(k)
+            writeForRouting(initial, final, cm, fname=workspace.path("toHaskell.txt"))
             a_star_start = time.process_time()
-            p = subprocess.run(["./route","toHaskell.txt"], stdout=PIPE )
+            p = subprocess.run(["./route", workspace.path("toHaskell.txt")], stdout=PIPE )
             a_star_end = time.process_time()
             a_star_time += a_star_end - a_star_start
             out = p.stdout.decode()
@@ -507,26 +770,94 @@ def solve_bounded_above(progName, cm, swapNum, chunks, pname="test", sname="out"
     return_results["cost"] = cost
     return_results['a_star_time'] = a_star_time
     return_results["swaps"] = swaps
+    reportBacktracks(backtracks)
+    return_results['backtracks'] = backtracks
     return_results['solvers'] = solvers
+    return_results['registries'] = registries
+    return_results['models'] = models
     return return_results
 
-def solve(progName, cm, swapNum, chunks, iterations=100, time_wbo_max = 600, qaoa=False, _routing=True, _weighted=False, _calibrationData=None,  pname="test", sname="out"):
-    ''' The SAT-solving loop. Parses the program, generates corresponding MaxSat instances, and calls the MaxSat Solver '''
+def symmetryBreakingClauses(symmetries, logs):
+    '''
+        Lex-leader clauses on the initial mapping (step 0) under symmetries, a group of automorphisms of the device
+        (one permutation per row), ordering mappings by the physical qubits of logs in turn: the first logical
+        qubit goes to the smallest qubit of its orbit, the next to the smallest of its orbit under the automorphisms
+        that keep the first in place, and so on while any remain. Every mapping has an image that satisfies them.
+    '''
+    physNum = symmetries.shape[1]
+    clauses = []
+    def extend(prefix, group, depth):
+        if depth == len(logs) or len(group) <= 1:
+            return
+        smallest = group.min(axis=0)
+        placed = [(True, "x", phys, log, 0) for (phys, log) in prefix]
+        clauses.extend(placed + [(True, "x", phys, logs[depth], 0)] for phys in np.flatnonzero(smallest < np.arange(physNum)).tolist())
+        for phys in np.flatnonzero(smallest == np.arange(physNum)).tolist():
+            extend(prefix + [(phys, logs[depth])], group[group[:, phys] == phys], depth + 1)
+    extend([], symmetries, 0)
+    return clauses
+
+def swapLowerBound(device, boundary, cnots):
+    '''
+        A lower bound on the swaps needed by a chunk of cnots starting from the boundary mapping (logical to physical qubit).
+        A swap brings the qubits of a CNOT at most one step closer, so one at distance d needs d-1 swaps before it.
+        Distances are those of the undirected coupling graph, as swaps and CNOTs may use an edge either way; qubits
+        with no path between them (a chunk with no solution at all) are left out.
+    '''
+    distances = [device.undirectedDistance[boundary[c], boundary[t]] - 1 for (c, t) in cnots if c in boundary and t in boundary]
+    return int(max((d for d in distances if np.isfinite(d)), default=0))
+
+class Options:
+    '''
+        The options of solve and transpile beyond the original mapper's, given by name (see addTranspileOptions)
+    '''
+    # how instances reach the solvers, and which solvers run
+    stream = False
+    keepArtifacts = False
+    portfolio = None
+    stall = None
+    # the encoding (see generateAndWriteClauses)
+    mirror = "lazy"
+    swapEncoding = "sequence"
+    cardinality = "pairwise"
+    layering = False
+    # backtracking's share of the time budget, and each backtrack's core extraction time
+    backtrackReserve = 0.1
+    coreTimeout = 10
+    # chunks: split and merged (see chunking.Chunker), taken from a chunkcache.ChunkCache, routed greedily first
+    adaptive = False
+    chunkCache = None
+    greedyRouter = True
+    # the part of the device mapped onto: "off", "auto" or a number of qubits (see region.regionFor)
+    region = "off"
+    # transpile's check of the mapped circuit, one of verifier.MODES
+    verify = "full"
+
+    def __init__(self, **options):
+        for (name, value) in options.items():
+            if not hasattr(Options, name):
+                raise TypeError("unknown option " + name)
+            setattr(self, name, value)
+
+def solve(progName, cm, swapNum, chunks, iterations=100, time_wbo_max = 600, qaoa=False, _routing=True, _weighted=False, _calibrationData=None,  pname="test", sname="out", options=None, workspace=None):
+    ''' The SAT-solving loop. Parses the program, generates corresponding MaxSat instances, and calls the MaxSat Solver (see Options) '''
     # Controls whether this function's debug is printed (overwrites DEBUG_GLOBAL)
     DEBUG_LOCAL = False
+    options = options or Options()
+    cm = architectures.asDevice(cm)
+    program = asProgram(progName)
+    # with a region, the instances are built on its qubits, and the models' physical qubits are the region's
+    region = regionFor(cm, program.logNum, options.region, _calibrationData) if _routing else None
+    if region is not None:
+        (cm, _calibrationData) = (region.device, region.calibrationData)
+    workspace = workspace or Workspace("tmp")
     return_results = {}
     cost = 0  # <-- number of SWAPs added
     time_elapsed_wbo = 0
     physNum = len(cm)
-    logNum = extractQbits(progName)
+    logNum = program.logNum
     return_results = {}
-    hack = qiskit.QuantumCircuit.from_qasm_file(progName)
-    hack.remove_final_measurements()
-    (head, tail) = os.path.split(progName)
-    with open(os.path.join('tmp', "tmpqiskit-" + tail), "w") as f:
-        f.write(hack.qasm())
-    cnots = extractCNOTs(os.path.join('tmp', "tmpqiskit-" + tail))
-    sorted_cnots = sortCnots(logNum, cnots)
+    cnots = program.cnots()
     numCnots = len(cnots)
 
     layers= range(len(cnots))
@@ -541,107 +872,203 @@ def solve(progName, cm, swapNum, chunks, iterations=100, time_wbo_max = 600, qao
     currentChunk = 0
     addedSwaps = [0 for _ in range(chunks)]
     negatedModels = [[] for i in range(chunks)]
-    time_elapsed_wbo = 0
-    while currentChunk < chunks:
+    registries = [None for i in range(chunks)]
+    outputs = [None for i in range(chunks)]
+    models = [None for i in range(chunks)]
+    portfolio_wins = collections.Counter()
+    backtracks = []
+    scheduler = DeadlineScheduler(time_wbo_max or None, chunks, reserve=options.backtrackReserve)
+    chunker = Chunker(numCnots, chunks, adaptive=options.adaptive)
+    # the cost is a number of swaps only when routing without calibration data
+    boundSwaps = _routing and not _calibrationData
+    # what else an instance depends on, for the chunk cache
+    cacheMode = [options.swapEncoding, options.layering, _calibrationData and list(_calibrationData)]
+    # the first chunk's initial mapping is only searched up to the device's symmetries
+    symmetries = cm.symmetries(_calibrationData)
+    symmetryClauses = symmetryBreakingClauses(symmetries, list(dict.fromkeys(q for cnot in cnots[:chunkSize] for q in cnot)))
+    while currentChunk < len(chunker):
         # print("current chunk is", currentChunk)
         # print("negated", len(negatedModels[currentChunk]), "models")
-        if currentChunk == chunks - 1: end = numCnots
-        else: end = layers[chunkSize*(currentChunk+1)]
-        currentSize = end - layers[chunkSize*(currentChunk)]
+        (start, end) = chunker.span(currentChunk)
+        currentSize = end - start
         # print("current size:", currentSize)
         if negatedModels[currentChunk]:
             if(DEBUG_LOCAL and DEBUG_GLOBAL):
                 print(set.intersection(*[set(l)
                       for l in negatedModels[currentChunk]]))
-        if currentChunk == 0:
+        stepOf = stepsOf(cnots[start:end], options.layering)
+        boundary = models[currentChunk-1].mapping_at(registries[currentChunk-1].numSteps - 1) if currentChunk else None
+        lowerBound = (0 if boundary is None else swapLowerBound(cm, dict(enumerate(boundary.tolist())), cnots[start:end])) if boundSwaps else None
+        # only chunks without added constraints (from backtracking or qaoa) are looked up and stored, and routed greedily
+        unconstrained = _routing and not negatedModels[currentChunk] and not (qaoa and currentChunk == len(chunker)-1)
+        (instance, entry, heuristic, swapCap, planned) = (None, None, None, None, None)
+        overdue = scheduler.overdue()
+        if options.chunkCache is not None and unconstrained:
+            instance = chunkcache.ChunkInstance(cnots[start:end], logNum, boundary, cm, swapNum+addedSwaps[currentChunk], cacheMode, symmetries)
+            entry = options.chunkCache.get(instance.key)
+        if options.greedyRouter and boundSwaps and unconstrained and not entry:
+            heuristic = greedy.route(cm, cnots[start:end], stepOf, logNum, swapNum+addedSwaps[currentChunk], boundary=boundary, lookahead=cnots[end:end+greedy.LOOKAHEAD])
+            # the solver only looks for solutions at least as good
+            swapCap = sum(len(stepSwaps) for stepSwaps in heuristic[1]) if heuristic else None
+        if overdue and boundSwaps and not entry and not heuristic:
+            # out of time: whatever it takes, leaving the constraints from backtracking aside
+            heuristic = greedy.route(cm, cnots[start:end], stepOf, logNum, None, boundary=boundary, lookahead=cnots[end:end+greedy.LOOKAHEAD], leading=True)
+            swapCap = sum(len(stepSwaps) for stepSwaps in heuristic[1]) if heuristic else None
+        if entry:
+            s = None
+            registries[currentChunk] = solutionRegistry(cm, logNum, swapNum+addedSwaps[currentChunk], stepOf)
+            outputs[currentChunk] = instance.output(registries[currentChunk], entry)
+            print("chunk", currentChunk, "taken from the chunk cache")
+        elif heuristic and (swapCap <= lowerBound or overdue):
+            s = None
+            mostSwaps = max([swapNum+addedSwaps[currentChunk]] + [len(stepSwaps) for stepSwaps in heuristic[1]])
+            registries[currentChunk] = solutionRegistry(cm, logNum, mostSwaps, stepOf)
+            outputs[currentChunk] = solutionOutput(registries[currentChunk], *heuristic, swapCap, status="OPTIMUM FOUND" if swapCap <= lowerBound else "SATISFIABLE")
+            print("chunk", currentChunk, "routed greedily", "with the fewest swaps possible" if swapCap <= lowerBound else "as the time budget is spent")
+        elif currentChunk == 0:
             swapBack = []
-            if qaoa and currentChunk == chunks-1:
-                swapBack = [[(False, "x", phys, log, currentSize-1), (True, "x", phys, log, 0) ] for phys in range(physNum) for log in range(logNum)] +  [[(True, "x", phys, log, currentSize-1), (False, "x", phys, log, 0) ] for phys in range(physNum) for log in range(logNum)]
-            gen_write_s = time.process_time()
-            s= generateAndWriteClauses(logNum, cnots[:end], cnots[:end], cm, swapNum+addedSwaps[0], negatedModels[0] + swapBack, "tmp/"+pname+"-chnk"+str(currentChunk)+".cnf", routing=_routing, weighted =_weighted, calibrationData=_calibrationData)
-            gen_write_f = time.process_time()
-            # print("generation and write time:", gen_write_f - gen_write_s)
-            t_s = time.process_time()
-            if time_wbo_max:
-                solve_time_rem = time_wbo_max-time_elapsed_wbo
-            try:
-               p = subprocess.Popen(["lib/Open-WBO-Inc/open-wbo-inc_release",   "-iterations="+str(iterations), "tmp/"+pname+"-chnk"+str(currentChunk)+".cnf"],  stdout=open( "tmp/"+sname + "-chnk0" + ".txt", "w"))
-               p.wait(timeout=solve_time_rem/(chunks-currentChunk))
-            except subprocess.TimeoutExpired:
-                print("exiting open-wbo because of solve time alloted...")
-                p.terminate()
-                time.sleep(10)
-            t_f = time.process_time()
-            time_elapsed_wbo += t_f - t_s
+            if qaoa and currentChunk == len(chunker)-1:
+                lastStep = stepsOf(cnots[:end], options.layering)[-1]
+                swapBack = [[(False, "x", phys, log, lastStep), (True, "x", phys, log, 0) ] for phys in range(physNum) for log in range(logNum)] +  [[(True, "x", phys, log, lastStep), (False, "x", phys, log, 0) ] for phys in range(physNum) for log in range(logNum)]
+            planned = scheduler.plan(currentChunk)
+            t_s = time.monotonic()
+            ((s, registries[currentChunk]), outputs[currentChunk], gen_write_time, config) = runMaxSat(
+                lambda f: generateAndWriteClauses(logNum, cnots[:end], cnots[:end], cm, swapNum+addedSwaps[0], negatedModels[0] + swapBack + ([] if negatedModels[0] else symmetryClauses), f, routing=_routing, weighted =_weighted, layering=options.layering, calibrationData=_calibrationData, mirror=options.mirror, swapEncoding=options.swapEncoding, cardinality=options.cardinality, swapCap=swapCap),
+                workspace.path(pname+"-chnk"+str(currentChunk)+".cnf"), workspace.path(sname + "-chnk0" + ".txt"), planned, iterations=iterations, stream=options.stream, keepArtifacts=options.keepArtifacts, portfolio=options.portfolio, lowerBound=lowerBound, stall=options.stall)
+            portfolio_wins[config] += 1
+            # print("generation and write time:", gen_write_time)
+            scheduler.record(currentChunk, planned, t_s, gen_write_time)
         else:
-            prevSize = layers[chunkSize*currentChunk] - layers[chunkSize*(currentChunk-1)]
-            prevAssignments = filter(lambda x : x[2] == prevSize-1, mappingVars(readMaxSatOutput, physNum, logNum, prevSize, swapNum+addedSwaps[currentChunk-1], "tmp/"+sname + "-chnk" + str(currentChunk-1) + ".txt"))
+            # the last step of the previous chunk
+            prevStep = registries[currentChunk-1].numSteps - 1
+            prevAssignments = models[currentChunk-1].assignments(prevStep)
             consistencyClauses = [[(False, "x", phys, log, 0)] for (phys, log, _) in prevAssignments]
             swapBack = []
-            if qaoa and currentChunk == chunks-1:
-                initialSize = layers[chunkSize] - layers[0]
-                initialMapping =  filter(lambda x : x[2] == 0, mappingVars(readMaxSatOutput, physNum, logNum, initialSize, swapNum+addedSwaps[0], "tmp/"+ sname + "-chnk" + str(0) + ".txt"))
-                swapBack = [[(False, "x", phys, log, currentSize-1)] for (phys, log, _) in initialMapping]
-            gen_write_s = time.process_time()
-            print("start:", layers[chunkSize*(currentChunk)])
+            if qaoa and currentChunk == len(chunker)-1:
+                initialMapping = models[0].assignments(0)
+                lastStep = stepOf[-1]
+                swapBack = [[(False, "x", phys, log, lastStep)] for (phys, log, _) in initialMapping]
+            print("start:", start)
             print("end:", end)
-            s = generateAndWriteClauses(logNum, cnots[:end], cnots[layers[chunkSize*(currentChunk)]:end], cm, swapNum+addedSwaps[currentChunk], consistencyClauses+negatedModels[currentChunk]+swapBack,  "tmp/"+pname+"-chnk"+str(currentChunk)+".cnf", routing=_routing, weighted=_weighted, calibrationData=_calibrationData)
-            gen_write_f = time.process_time()
-            print("generation and write time:", gen_write_f - gen_write_s)
-            t_s = time.process_time()
-            if time_wbo_max:
-                solve_time_rem = time_wbo_max- time_elapsed_wbo
-            try:
-                p = subprocess.Popen(["lib/Open-WBO-Inc/open-wbo-inc_release", "-iterations="+str(iterations), "tmp/"+pname+"-chnk"+str(currentChunk)+".cnf"], stdout=open("tmp/"+sname + "-chnk" + str(currentChunk) + ".txt", "w"))
-                p.wait(timeout=solve_time_rem/(chunks-currentChunk))
-            except subprocess.TimeoutExpired:
-                print("exiting open-wbo because of solve time alloted...")
-                p.terminate()
-                time.sleep(10)
-            t_f = time.process_time()
-            time_elapsed_wbo += t_f - t_s
-        assignments = filter(lambda x : x[2] == currentSize-1, mappingVars(readMaxSatOutput, physNum, logNum, currentSize, swapNum+addedSwaps[currentChunk], "tmp/"+sname + "-chnk" + str(currentChunk) + ".txt"))
-        if list(assignments):
+            planned = scheduler.plan(currentChunk)
+            t_s = time.monotonic()
+            ((s, registries[currentChunk]), outputs[currentChunk], gen_write_time, config) = runMaxSat(
+                lambda f: generateAndWriteClauses(logNum, cnots[:end], cnots[start:end], cm, swapNum+addedSwaps[currentChunk], consistencyClauses+negatedModels[currentChunk]+swapBack, f, routing=_routing, weighted=_weighted, layering=options.layering, calibrationData=_calibrationData, mirror=options.mirror, swapEncoding=options.swapEncoding, cardinality=options.cardinality, swapCap=swapCap),
+                workspace.path(pname+"-chnk"+str(currentChunk)+".cnf"), workspace.path(sname + "-chnk" + str(currentChunk) + ".txt"), planned, iterations=iterations, stream=options.stream, keepArtifacts=options.keepArtifacts, portfolio=options.portfolio, lowerBound=lowerBound, stall=options.stall)
+            portfolio_wins[config] += 1
+            print("generation and write time:", gen_write_time)
+            scheduler.record(currentChunk, planned, t_s, gen_write_time)
+        models[currentChunk] = readModel(registries[currentChunk], outputs[currentChunk])
+        # a chunk that timed out on its own (not for what backtracking ruled out), with time to spare, is tried again in halves
+        if (not models[currentChunk] and not negatedModels[currentChunk] and planned is not None and planned > scheduler.minimum
+                and not scheduler.overdue() and solverStatus(outputs[currentChunk]) != "UNSATISFIABLE" and chunker.canSplit(currentChunk)):
+            chunker.split(currentChunk, "timed out without a model after {:.1f}s".format(planned))
+            for chunkList in (addedSwaps, negatedModels, registries, outputs, models):
+                chunkList.insert(currentChunk+1, [] if chunkList is negatedModels else 0 if chunkList is addedSwaps else None)
+            models[currentChunk] = None
+            scheduler.chunks = len(chunker)
+            continue
+        if not models[currentChunk] and heuristic:
+            print("no model for chunk", currentChunk, "in time, taking the greedy router's")
+            outputs[currentChunk] = solutionOutput(registries[currentChunk], *heuristic, swapCap, status="SATISFIABLE")
+            models[currentChunk] = readModel(registries[currentChunk], outputs[currentChunk])
+        if models[currentChunk]:
             # print("chunk", currentChunk, "solved")
+            if instance and not entry:
+                chunkCost = readCost(outputs[currentChunk])
+                if solverStatus(outputs[currentChunk]) == "OPTIMUM FOUND" or (lowerBound is not None and chunkCost <= lowerBound):
+                    options.chunkCache.put(instance.key, instance.entry(models[currentChunk], chunkCost))
+            optimal = solverStatus(outputs[currentChunk]) == "OPTIMUM FOUND" or (lowerBound is not None and readCost(outputs[currentChunk]) <= lowerBound)
+            following = currentChunk + 1
+            if (planned is not None and optimal and scheduler.runs[-1][2] < MERGE_BELOW * planned and chunker.canMerge(following)
+                    and models[following] is None and models[following+1] is None and not negatedModels[following+1]):
+                # solved well under budget: give the next chunk that of two
+                chunker.merge(following, "chunk {} solved in {:.1f}s of {:.1f}s".format(currentChunk, scheduler.runs[-1][2], planned))
+                for chunkList in (addedSwaps, negatedModels, registries, outputs, models):
+                    del chunkList[following+1]
+                scheduler.chunks = len(chunker)
             currentChunk = currentChunk+1
+        elif scheduler.overdue():
+            # no more backtracking: the next pass routes the chunk greedily, unless this one did already
+            if overdue:
+                raise RuntimeError("no solution for chunk {} within the time budget".format(currentChunk))
         else:
-                if len(negatedModels[currentChunk-1]) < 50*(addedSwaps[currentChunk]+1):
-                    print("got stuck on chunk", currentChunk, "backtracking to chunk", currentChunk-1)
-                    prevAssignments = filter(lambda x : x[2] == prevSize-1, mappingVars(readMaxSatOutput, physNum, logNum, prevSize, swapNum+addedSwaps[currentChunk-1], "tmp/"+sname + "-chnk" + str(currentChunk-1) + ".txt"))
-                    negatedModel =  [(True, "x", phys, log, lastGate) for (phys, log, lastGate) in prevAssignments]
-                    print(negatedModel)
-                    core = extractMappingCore(s, consistencyClauses,  logNum, len(cm), currentSize, swapNum+addedSwaps[currentChunk])
-                    negatedSubmap = [(True, x, phys, log, prevSize-1) for [(_, x, phys, log, _)] in  core]
+            backtrack = currentChunk > 0 and len(negatedModels[currentChunk-1]) < 50*(addedSwaps[currentChunk]+1)
+            core = None
+            if backtrack and s:
+                core_start = time.monotonic()
+                (core, found) = extractMappingCore(s, consistencyClauses, registries[currentChunk], timeout=options.coreTimeout if scheduler.remaining() is None else min(options.coreTimeout, scheduler.remaining()))
+                backtracks.append((currentChunk, found, len(core), time.monotonic() - core_start))
+            # unsolvable whatever the boundary mapping (an empty core), or with none to backtrack to
+            unsolvable = core == [] if currentChunk else solverStatus(outputs[0]) == "UNSATISFIABLE"
+            if unsolvable and region is not None and region.canGrow():
+                # more room to route in, where the boundary mappings ruled out may work again; the chunks before keep
+                # their models, as the region's qubits keep their numbers
+                region.grow("no solution for chunk {}".format(currentChunk))
+                negatedModels = [[] for _ in negatedModels]
+                (cm, _calibrationData) = (region.device, region.calibrationData)
+                physNum = len(cm)
+                cacheMode = [options.swapEncoding, options.layering, _calibrationData and list(_calibrationData)]
+                symmetries = cm.symmetries(_calibrationData)
+                symmetryClauses = symmetryBreakingClauses(symmetries, list(dict.fromkeys(q for cnot in cnots[:chunkSize] for q in cnot)))
+            elif currentChunk == 0:
+                # there is no chunk before the first to backtrack to: with more swaps if it has no solution, otherwise it
+                # is tried again with its share of the time left
+                if unsolvable:
+                    print("got stuck on chunk 0, increasing swap count")
+                    addedSwaps[0] += 1
+                else:
+                    print("no model for chunk 0 in time, trying again")
+            elif backtrack:
+                print("got stuck on chunk", currentChunk, "backtracking to chunk", currentChunk-1)
+                prevAssignments = models[currentChunk-1].assignments(prevStep)
+                negatedModel =  [(True, "x", phys, log, lastGate) for (phys, log, lastGate) in prevAssignments]
+                print(negatedModel)
+                if core:
+                    negatedSubmap = [(True, x, phys, log, prevStep) for [(_, x, phys, log, _)] in  core]
                     print(negatedSubmap)
                     negatedModels[currentChunk-1].append(negatedSubmap)
-                    currentChunk = currentChunk-1
-
-                else:
-                    print("got stuck on chunk", currentChunk, "repeatedly, increasing swap count")
-                    addedSwaps[currentChunk] += 1
+                else:  # without a mirror solver (or a core) there is no part to blame, rule out the whole boundary mapping
+                    negatedModels[currentChunk-1].append(negatedModel)
+                currentChunk = currentChunk-1
+            else:
+                print("got stuck on chunk", currentChunk, "repeatedly, increasing swap count")
+                addedSwaps[currentChunk] += 1
+    chunks = len(chunker)
     cost=0
     for i in range(chunks):
-        with open(os.path.join("tmp/"+sname + "-chnk" + str(i) + ".txt")) as f:
-            for line in f:
-                if line.startswith("o"):
-                    count = int(line.split()[1])
-        cost += count
+        cost += readCost(outputs[i])
+    scheduler.report()
+    chunker.report()
+    reportBacktracks(backtracks)
+    if region is not None:
+        region.report()
+    if options.chunkCache is not None:
+        options.chunkCache.report()
+        return_results['chunk_cache'] = options.chunkCache.stats()
+    time_elapsed_wbo = scheduler.elapsed()
     return_results['cost'] = cost
     return_results['time_wbo'] = time_elapsed_wbo
+    return_results['schedule'] = scheduler.runs
+    return_results['backtracks'] = backtracks
+    return_results['registries'] = registries
+    return_results['outputs'] = outputs
+    return_results['models'] = models
+    return_results['portfolio_wins'] = portfolio_wins
+    return_results['bounds'] = chunker.bounds
+    return_results['chunking'] = chunker.decisions
+    return_results['region'] = None if region is None else region.qubits
     if not _routing:
         a_star_time = 0
         cost = 0
         swaps = [[] for _ in range(chunks)]
         for i in range(chunks):
-            if i == chunks - 1: end = numCnots
-            else: end = layers[chunkSize*(i+1)]
-            size = end - layers[chunkSize*(i)]
-            for k in range(1,size):
-                initial = list(filter(lambda x : x[2] == k-1, mappingVars(readMaxSatOutput, physNum, logNum, size, swapNum+addedSwaps[i], "tmp/"+sname + "-chnk" + str(i) + ".txt")))
-                final = list(filter(lambda x : x[2] == k, mappingVars(readMaxSatOutput, physNum, logNum, size, swapNum+addedSwaps[i], "tmp/"+sname + "-chnk" + str(i) + ".txt")))
-                writeForRouting(initial, final, cm)
+            for k in range(1,registries[i].numSteps):
+                initial = models[i].assignments(k-1)
+                final = models[i].assignments(k)
+                writeForRouting(initial, final, cm, fname=workspace.path("toHaskell.txt"))
                 a_star_start = time.process_time()
-                p = subprocess.run(["./route","toHaskell.txt"], stdout=PIPE )
+                p = subprocess.run(["./route", workspace.path("toHaskell.txt")], stdout=PIPE )
                 a_star_end = time.process_time()
                 a_star_time += a_star_end - a_star_start
                 out = p.stdout.decode()
@@ -650,105 +1077,107 @@ def solve(progName, cm, swapNum, chunks, iterations=100, time_wbo_max = 600, qao
         return_results["cost"] = cost
         return_results['a_star_time'] = a_star_time
         return_results["swaps"] = swaps
+        return_results['time_wbo'] = time_elapsed_wbo
+        return_results['registries'] = registries
+        return_results['outputs'] = outputs
+        return_results['models'] = models
         print(return_results)
         return return_results
     return return_results
 
 
 
-## Converting solutions to circuits, verifying correctness ##
+## Converting solutions to circuits ##
 
-def toQasm(physNum, logNum, numCnots, swapNum, solSource, progPath, cm, prevMap, start=0, append_rest=False, swapList=None):
-    circ = qiskit.QuantumCircuit(physNum, physNum)
-    prog = qiskit.QuantumCircuit.from_qasm_file(progPath)
-    temp =  qiskit.QuantumCircuit(physNum, physNum)
-    temp.compose(prog, inplace=True)
-    edges = np.argwhere(cm > 0)
-    i = start
-    if append_rest:
-     while len(circ)+start < len(temp):
-        circ.append(*temp[i])
-        i += 1
-    else:
-        while circ.num_nonlocal_gates() < numCnots:
-            circ.append(*temp[i])
-            i += 1
-    if type(solSource) is str:
-        lits = readMaxSatOutput(physNum, logNum, numCnots, swapNum, solSource)
-    else:
-        lits = readPySatOutput(physNum, logNum, numCnots, swapNum, solSource)
-    if swapList is not None:
-        swaps = swapList
+def chunkBounds(program, chunks):
+    '''
+        The gates [start, end) of each chunk of program: a chunk ends right after its last two-qubit gate, the
+        last chunk at the end of the program. chunks is a number of chunks of equal size (but the last), or the
+        two-qubit gate each chunk starts at followed by their number (as solve returns them).
+    '''
+    if np.ndim(chunks) == 0:
+        starts = len(program.interactions)//chunks * np.arange(1, chunks)
     else:
-        swaps = [s[2] for s in filter(lambda x : not x[0] and x[1] == "s" and x[2][0] != x[2][1], lits)]
-    mappingVars =  [x[2] for x in filter(lambda x : not x[0] and x[1] == "x", lits)]
-    logToPhys = { (j,k) : i for (i,j,k) in mappingVars}
-    physToLog = { (i,k) : j for (i,j,k) in mappingVars}
-    swapIndices = [s[3] for s in swaps]
-    for k in range(numCnots):
-        mapKLog = list(filter(lambda x: x[0][1] == k, logToPhys.items()))
-        assert(len(list(mapKLog)) == len(set(mapKLog))), "Invalid solution: non-injective"
-        if k == 0 and prevMap: assert mapKLog == prevMap, "Invalid solution: slices aren't consistent"
-        mapKPhys = list(filter(lambda x: x[0][1] == k, physToLog.items()))
-        assert(len(list(mapKPhys)) == len(set(mapKPhys))), "Invalid solution: non-function"
-        swapsK = filter(lambda s: s[3] == k, swaps)
-
-        justPhys = [s[:2] for s in swapsK]
-        for (phys1,phys2) in justPhys:
-            assert([phys1, phys2] in edges.tolist()), "Invalid solution: bad swap"
-        if k>0:
-            for l in range(logNum):
-                if (l,k) in logToPhys.keys():
-                    physPrev = logToPhys[(l,k-1)]
-                    assert(logToPhys[(l,k)] == composeSwaps(justPhys,physNum)[physPrev]), "Invalid solution: unexpected SWAP"
-    mappedCirc = qiskit.QuantumCircuit(circ.num_qubits)
+        starts = np.asarray(chunks[1:-1], dtype=int)
+    cuts = np.flatnonzero(program.interacting)[starts - 1] + 1
+    return list(zip([0] + cuts.tolist(), cuts.tolist() + [len(program)]))
+
+def toQasm(model, program, cm, start, end, swapList=None, qubits=None):
+    '''
+        Maps gates start to end of program, one chunk, returning them with the chunk's swaps as OpenQASM lines.
+        The model's physical qubits stand for qubits of the device (those of a region, see solve) if given.
+        The result is checked by the verifier, not here.
+    '''
+    registry = model.registry
+    (physNum, logNum, numCnots, numSteps) = (registry.physNum, registry.logNum, registry.numCnots, registry.numSteps)
+    if swapList is None:
+        swapList = [(u, v, t, k) for k in range(numSteps) for (t, (u, v)) in enumerate(model.swaps_at(k).tolist())]
+    swaps = np.array(swapList, dtype=int).reshape(-1, 4)
+    swaps = swaps[np.argsort(swaps[:, 3], kind="stable")]
+    mappings = model.mappings()
+
+    # each gate acts on the mapping of the next two-qubit gate's step, whose swaps go right after the previous step
+    interacting = program.interacting[start:end]
+    step = registry.stepOf[np.minimum(np.cumsum(interacting) - interacting, numCnots - 1)]
+    offsets = program.offsets[start:end+1] - program.offsets[start]
+    logs = program.qubits[program.offsets[start]:program.offsets[end]]
+    placed = logs < logNum
+    phys = np.full(len(logs), -1)
+    phys[placed] = mappings[np.repeat(step, np.diff(offsets))[placed], logs[placed]]
+
+    labels = ["q[{}]".format(q) for q in (range(physNum) if qubits is None else qubits[:physNum])]
+    swapLines = ["swap {},{};".format(labels[u], labels[v]) for (u, v) in swaps[:, :2].tolist()]
+    swapEnds = np.searchsorted(swaps[:, 3], np.arange(numSteps + 1), side="right").tolist()
+    # the step of each two-qubit gate and the one after it, whose swaps follow it if it is a different one
+    steps = np.append(registry.stepOf, numSteps).tolist()
+    names = program.names
+    (ops, clbits, interacting) = (program.ops[start:end].tolist(), program.clbits[start:end].tolist(), interacting.tolist())
+    (phys, offsets) = (phys.tolist(), offsets.tolist())
+    lines = swapLines[:swapEnds[0]]
     cnotCount = 0
-    for j in range(len(circ)):
-        qubits = list(map(lambda q : qiskit.circuit.Qubit(q.register, logToPhys[(q.index,min(cnotCount, numCnots-1))]), circ[j][1]))
-        if circ[j][0].name == 'cx':
-            if cnotCount in swapIndices:
-                swapsK = filter(lambda s: s[3] == cnotCount, swaps)
-                for s in swapsK:
-                    mappedCirc.swap(s[0], s[1])
-            [c, t] = circ[j][1]
-            logc, logt = c.index, t.index
-            physc, physt = logToPhys[(logc, cnotCount)
-                                     ], logToPhys[(logt, cnotCount)]
-            assert([physc, physt] in edges.tolist()), "Invalid solution: unsatisfed cnot"
+    for j in range(end - start):
+        # a barrier only spans the qubits that are mapped
+        qubits = ",".join(labels[q] for q in phys[offsets[j]:offsets[j+1]] if q >= 0)
+        if qubits:
+            lines.append("{} {}{};".format(names[ops[j]], qubits, "" if clbits[j] < 0 else " -> c[{}]".format(clbits[j])))
+        if interacting[j]:
             cnotCount += 1
-        mappedCirc.append(circ[j][0],qubits)
-    finalMap = list(filter(lambda x: x[0][1] == numCnots, logToPhys.items()))
-    return (mappedCirc, i, finalMap)
+            lines.extend(swapLines[swapEnds[steps[cnotCount-1]]:swapEnds[steps[cnotCount]]])
+    return lines
 
-def toQasmFF(progName, cm, swapNum, chunks, solSource,  swaps=None):
-    pointer = 0
+def toQasmFF(progName, cm, swapNum, chunks, models, swaps=None, output=None, qubits=None):
+    '''
+        Maps progName (a path or a parsed Program) with each chunk's model, over the device qubits of a region
+        if given. The result is written to the file output chunk by chunk if it is given, and returned as a string otherwise.
+    '''
+    cm = architectures.asDevice(cm)
+    program = asProgram(progName)
+    with (open(output, "w") if output else io.StringIO()) as f:
+        writeMapped(f, program, cm, chunks, models, swaps, qubits)
+        return None if output else f.getvalue()
+
+def writeMapped(f, program, cm, chunks, models, swaps=None, qubits=None):
+    ''' Writes the mapped program to f, each chunk as soon as it is mapped, in one pass over its gates '''
     physNum = len(cm)
-    cnots = extractCNOTs(progName)
-    logNum = extractQbits(progName)
-    numCnots = len(cnots)
-    # layers = getLayers(cnots)
-    layers = range(len(cnots))
-    # chunkSize = len(layers)//chunks if chunks!=0 else len(layers)
-    chunkSize = len(layers)//chunks
-
-    prevMap = None
-    circ = qiskit.QuantumCircuit(len(cm), len(cm))
-    for i in range(chunks):
-        is_last = False
-        if i == chunks - 1:
-            end = numCnots
-            is_last = True
-        else:
-            end = layers[chunkSize*(i+1)]
-        currentSize = end - layers[chunkSize*(i)]
-        if type(solSource) is str:  # i.e we are reading from a file
-            (mapped_circ, gates, finalMap) = toQasm(physNum, logNum, currentSize, swapNum, "tmp/"+solSource + "-chnk" + str(i) + ".txt", progName, cm, prevMap, append_rest=is_last, start=pointer, swapList= swaps[i] if swaps else None)
-        else: # we are reading from solvers
-            (mapped_circ, gates, finalMap) = toQasm(physNum, logNum, currentSize, swapNum, "tmp/"+solSource[i], progName, cm, prevMap, append_rest=is_last, start=pointer, swapList= swaps[i] if swaps else None)
-        pointer = gates
-        prevMap = finalMap
-        circ.compose(mapped_circ, inplace=True)
-    return circ.qasm()
+    f.write("OPENQASM 2.0;\ninclude \"qelib1.inc\";\nqreg q[{}];\ncreg c[{}];\n".format(physNum, max(physNum, program.clbitNum)))
+    if not len(program.interactions):
+        writeUnrouted(f, program, physNum)
+        return
+    for (i, (start, end)) in enumerate(chunkBounds(program, chunks)):
+        # each chunk's model, decoded once by solve
+        mapped = toQasm(models[i], program, cm, start, end, swapList=swaps[i] if swaps else None, qubits=qubits)
+        if mapped:
+            f.write("\n".join(mapped) + "\n")
+
+def writeUnrouted(f, program, physNum):
+    ''' Writes the gates of a program without two-qubit gates, each logical qubit on the physical qubit of its number '''
+    if program.logNum > physNum:
+        raise ValueError("{} qubits do not fit on a {}-qubit device".format(program.logNum, physNum))
+    for i in range(len(program)):
+        # a barrier only spans the qubits that are mapped
+        qubits = ",".join("q[{}]".format(q) for q in program.operands(i).tolist() if q < program.logNum)
+        if qubits:
+            f.write("{} {}{};\n".format(program.names[program.ops[i]], qubits, "" if program.clbits[i] < 0 else " -> c[{}]".format(program.clbits[i])))
 
 def computeFidelity(circ, calibrationData):
     fid=1
@@ -762,72 +1191,111 @@ def computeFidelity(circ, calibrationData):
     return fid
 
 
-def transpile(progname, cm, swapNum=1, cnfname='test', sname='out', slice_size=25, max_sat_time=600, routing=True, weighted=False, calibrationData = None, bounded_above=True):
-    chunks = -(len(extractCNOTs(progname)) // -slice_size)
-    if routing:
-        stats = solve(progname, cm, swapNum, chunks, pname=cnfname, sname=sname, time_wbo_max=max_sat_time, _calibrationData=calibrationData)
-        return (stats, toQasmFF(os.path.join('tmp', "tmpqiskit-"+os.path.split(progname)[1]),  cm, swapNum, chunks, sname))
-    elif bounded_above:
-     results = solve_bounded_above(progname, cm, swapNum, chunks, pname=cnfname, sname=sname)
-     return ((results['cost'], results['a_star_time']), toQasmFF(os.path.join('tmp', "tmpqiskit-"+os.path.split(progname)[1]),  cm, swapNum, chunks, results['solvers'], swaps=results['swaps']))
-    else:
-      results = solve(progname, cm, swapNum, chunks, pname=cnfname, sname=sname, _routing=False, _weighted=weighted)
-      return ((results['cost'], results['time_wbo'], results['a_star_time']), toQasmFF(os.path.join(os.path.split(progname)[0], "tmp/tmpqiskit-"+os.path.split(progname)[1]),  cm, swapNum, chunks, sname, swaps=results['swaps']))
+def transpile(progname, cm, swapNum=1, cnfname='test', sname='out', slice_size=None, max_sat_time=600, routing=True, weighted=False, calibrationData = None, bounded_above=True, options=None, workspace=None, output=None):
+    ''' Maps progname onto cm, returning (stats, the mapped circuit), which is written to output if given (see Options) '''
+    options = options or Options()
+    cm = architectures.asDevice(cm)
+    program = asProgram(progname)
+    if slice_size is None:
+        slice_size = sliceSize(program, cm, options.adaptive)
+        print("slice size:", slice_size)
+    chunks = -(len(program.interactions) // -slice_size)
+    # scratch files go to a temporary directory removed afterwards, unless a workspace is given
+    with (contextlib.nullcontext(workspace) if workspace else Workspace()) as workspace:
+        if not len(program.interactions):
+            # nothing to route: the program is kept as it is (see writeUnrouted)
+            stats = {'cost' : 0, 'time_wbo' : 0, 'portfolio_wins' : collections.Counter(), 'models' : [], 'bounds' : [0], 'region' : None} if routing else (0, 0) if bounded_above else (0, 0, 0)
+            qasm = toQasmFF(program, cm, swapNum, 0, [], output=output)
+        elif routing:
+            stats = solve(program, cm, swapNum, chunks, pname=cnfname, sname=sname, time_wbo_max=max_sat_time, _calibrationData=calibrationData, options=options, workspace=workspace)
+            qasm = toQasmFF(program, cm, swapNum, stats['bounds'], stats['models'], output=output, qubits=stats['region'])
+        elif bounded_above:
+         results = solve_bounded_above(program, cm, swapNum, chunks, pname=cnfname, sname=sname, core_timeout=options.coreTimeout, workspace=workspace)
+         stats = (results['cost'], results['a_star_time'])
+         qasm = toQasmFF(program, cm, swapNum, chunks, results['models'], swaps=results['swaps'], output=output)
+        else:
+          results = solve(program, cm, swapNum, chunks, pname=cnfname, sname=sname, _routing=False, _weighted=weighted, options=options, workspace=workspace)
+          stats = (results['cost'], results['time_wbo'], results['a_star_time'])
+          qasm = toQasmFF(program, cm, swapNum, chunks, results['models'], swaps=results['swaps'], output=output)
+    if options.verify != "off":
+        verifier.check(program, load(output) if output else parse(qasm), cm, options.verify)
+    return (stats, qasm)
 
 
 
+def addTranspileOptions(parser):
+    '''
+        Adds the options that become transpile's arguments (see transpileOptions), shared by the CLI and batch mode
+    '''
+    parser.add_argument("--k", type=int, help="SolveSwapsFF: k-value (by default 25, or chosen for the circuit with --adaptive)")
+    parser.add_argument("--adaptive", action="store_true", help="split chunks that time out without a solution and merge those after a chunk solved well under budget")
+    parser.add_argument("--weighted",  action="store_true", help="SolveSwapsFF weighting on dist")
+    parser.add_argument("--err", choices=list(architectures.ERROR_RATES), help="olsq: 2 qubit gate error rates")
+    parser.add_argument("--stream",  action="store_true", help="pipe instances into the MaxSat solver and keep its output in memory instead of using files")
+    parser.add_argument("--mirror", default="lazy", choices=["eager", "lazy", "off"], help="when to build the SAT solver over each chunk's hard clauses that backtracking uses; off rules out whole boundary mappings instead")
+    parser.add_argument("--swap_encoding", default="sequence", choices=["sequence", "stepwise"], help="encode the effect of each whole swap sequence, or of each swap through intermediate mappings (linear in the swap count)")
+    parser.add_argument("--cardinality", default="pairwise", choices=ENCODINGS, help="at-most-one encoding of the mapping and swap choice constraints")
+    parser.add_argument("--portfolio", action="append", metavar="ARGS", help="open-wbo-inc arguments of one solver of a portfolio run in parallel on every chunk, repeat for each solver (e.g. --portfolio=\"-iterations=100\" --portfolio=\"-iterations=100 -rnd-seed=7\")")
+    parser.add_argument("--backtrack_reserve", type=float, default=0.1, help="fraction of the remaining time each chunk leaves for backtracking")
+    parser.add_argument("--stall", type=float, help="stop a chunk's solver when its cost has not improved for this many seconds")
+    parser.add_argument("--core_timeout", type=float, default=10, help="seconds each backtrack may spend shrinking the part of the boundary mapping it rules out")
+    parser.add_argument("--keep_artifacts",  action="store_true", help="with --stream, still write each chunk's instance and solver output to the workspace")
+    parser.add_argument("--layering", action="store_true", help="give each layer of CNOTs on distinct qubits one mapping, with swaps only between layers, instead of one per CNOT")
+    parser.add_argument("--verify", default="full", choices=verifier.MODES, help="check the mapped circuit against the original: every gate, a random sample of them, or not at all")
+    parser.add_argument("--chunk_cache", default="off", choices=chunkcache.MODES, help="reuse chunks solved to optimality before: kept in ~/.cache/satmap (or $SATMAP_CACHE) across runs, only within this run, or not at all (the default)")
+    parser.add_argument("--chunk_cache_size", type=int, default=10000, help="most chunks the cache keeps, the least recently used are dropped first")
+    parser.add_argument("--greedy", choices=["on", "off"], default="on", help="route each chunk greedily first: its swaps bound the solver's, and it stands in if the solver finds nothing in time")
+    parser.add_argument("--region", default="off", help="map onto a connected region of the device of this many qubits, grown when a chunk has no solution from any starting mapping: auto for one not much larger than the circuit on a large device, off for the whole device")
+
+def transpileOptions(args):
+    '''
+        The keyword arguments of transpile for the options added by addTranspileOptions (and a --timeout)
+    '''
+    options = Options(stream=args.stream, keepArtifacts=args.keep_artifacts, portfolio=args.portfolio, stall=args.stall,
+                      mirror=args.mirror, swapEncoding=args.swap_encoding, cardinality=args.cardinality, layering=args.layering,
+                      backtrackReserve=args.backtrack_reserve, coreTimeout=args.core_timeout, adaptive=args.adaptive,
+                      chunkCache=chunkcache.create(args.chunk_cache, args.chunk_cache_size), greedyRouter=args.greedy == "on",
+                      region=args.region, verify=args.verify)
+    return dict(slice_size=args.k, max_sat_time=args.timeout, weighted=args.weighted,
+                calibrationData=architectures.errorRates(args.err) if args.err else None, options=options)
+
+def loadArchitecture(name):
+    '''
+        A named architecture, or the adjacency matrix in the text file name
+    '''
+    if name in architectures.ARCHITECTURES:
+        return architectures.named(name)
+    with open(name) as f:
+        return np.array(ast.literal_eval(f.read()))
+
 
 if __name__ == "__main__":
+    if sys.argv[1:2] == ["batch"]:
+        import batch
+        sys.exit(batch.main(sys.argv[2:]))
+    if sys.argv[1:2] == ["verify"]:
+        sys.exit(verifier.main(sys.argv[2:]))
     parser = argparse.ArgumentParser()
     parser.add_argument("prog", help="path to input program file")
     parser.add_argument("-o_p", "--output_path", default="./tmp", help="where to write the resulting qasm")
     parser.add_argument("-a", "--arch", help="name of qc architecture")
     parser.add_argument("-to", "--timeout", type=int, default=1800,help="maximum run time for a mapper in seconds")
-    parser.add_argument("--k", type=int, default=25, help="SolveSwapsFF: k-value")
     parser.add_argument("--cyclic", choices=["on", "off"], default="off", help="cyclic mapping")
     parser.add_argument("--no_route",  action="store_true", help="SolveSwapsFF routing")
-    parser.add_argument("--weighted",  action="store_true", help="SolveSwapsFF weighting on dist")
-    parser.add_argument("--err", choices=['fake_tokyo', 'fake_linear'], help="olsq: 2 qubit gate error rates")
-
-    archs =  {
-        "tokyo" : architectures.ibmTokyo,
-        "toronto" : architectures.ibmToronto,
-        "4x4_mesh" : architectures.meshArch(4,4),
-        'small_linear' : architectures.linearArch(6),
-        "16_linear" : architectures.linearArch(16),
-        "tokyo_full_diags" : architectures.tokyo_all_diags(),
-        "tokyo_no_diags" : architectures.tokyo_no_diags(),
-        'tokyo_drop_2' : architectures.tokyo_drop_worst_n(2, architectures.tokyo_error_map()),
-        'tokyo_drop_6' : architectures.tokyo_drop_worst_n(6, architectures.tokyo_error_map()),
-        'tokyo_drop_10' : architectures.tokyo_drop_worst_n(10, architectures.tokyo_error_map()),
-        'tokyo_drop_14' : architectures.tokyo_drop_worst_n(14, architectures.tokyo_error_map()),
-        'grid_16' : architectures.gridArch(4).toarray(),
-        'grid_25' : architectures.gridArch(5).toarray(),
-        'grid_36' : architectures.gridArch(6).toarray(),
-        'circle_16': architectures.circleArch(16).toarray(),
-        'circle_25': architectures.circleArch(25).toarray(),
-        'circle_36': architectures.circleArch(36).toarray(),
-        'aspen_11_38': architectures.rigettiAspen11Arch().toarray()
-    }
-    error_rates = {
-        'fake_tokyo' : architectures.tokyo_error_list(),
-        'fake_linear' : architectures.fake_linear_error_list()
-    }
+    addTranspileOptions(parser)
+    parser.add_argument("--workspace", help="directory for the run's scratch files, kept afterwards (by default a temporary directory that is removed)")
+
     args = parser.parse_args()
     if not os.path.exists(args.output_path):
         os.makedirs(args.output_path)
-    if not os.path.exists("tmp"):
-        os.makedirs("tmp")
-    if args.arch in archs:
-        arch = archs[args.arch]
-    else:
-        with open(args.arch) as f:
-            arch = np.array(ast.literal_eval(f.read()))
+    arch = loadArchitecture(args.arch)
     base, _ = os.path.splitext(os.path.basename(args.prog))
     #print(transpile(args.prog, arch, 1, "prob_"+base, "sol_"+base, slice_size=args.k, max_sat_time=args.timeout, routing= not args.no_route, weighted= args.weighted, calibrationData=error_rates[args.err] if args.err else None, bounded_above=False ))
-    (stats, qasm) = transpile(args.prog, arch, 1, "prob_"+base, "sol_"+base, slice_size=args.k, max_sat_time=args.timeout, routing=True, weighted= args.weighted, calibrationData=error_rates[args.err] if args.err else None, bounded_above=True )
+    out_file = os.path.join(args.output_path, "mapped_"+os.path.basename(args.prog))
+    with Workspace(args.workspace or ("tmp" if args.keep_artifacts else None)) as workspace:
+        (stats, _) = transpile(args.prog, arch, 1, "prob_"+base, "sol_"+base, routing=True, bounded_above=True, workspace=workspace, output=out_file, **transpileOptions(args))
     print("num_swaps={}".format(stats["cost"]))
+    if args.portfolio:
+        for config in args.portfolio:
+            print("portfolio wins {!r}: {}".format(config, stats["portfolio_wins"][config]))
 
-    out_file = os.path.join(args.output_path, "mapped_"+os.path.basename(args.prog))
-    with open(out_file, "w") as f:
-        f.write(qasm)
@@ -0,0 +1,57 @@
+import time
+
+## Wall-clock budget of the chunk solver runs ##
+
+
+class DeadlineScheduler:
+    '''
+        Splits a wall-clock budget between the solver runs of a circuit's chunks. Every run gets an equal share of
+        what is left for the chunks still to be solved, so time a fast chunk does not use goes to the later ones.
+        A fraction of the remaining time is held back for backtracking, which re-solves earlier chunks.
+    '''
+
+    def __init__(self, budget, chunks, reserve=0.1, minimum=1.0):
+        self.start = time.monotonic()
+        self.deadline = None if budget is None else self.start + budget
+        self.chunks = chunks
+        self.reserve = reserve
+        self.minimum = minimum
+        self.runs = []
+
+    def overdue(self):
+        '''
+            Whether the budget is spent, after which nothing should be solved again
+        '''
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
+    def remaining(self):
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def plan(self, chunk):
+        '''
+            Seconds for the next run on chunk, encoding included (None when there is no budget)
+        '''
+        remaining = self.remaining()
+        if remaining is None:
+            return None
+        share = remaining / (self.chunks - chunk)
+        if chunk < self.chunks - 1:
+            share *= 1 - self.reserve
+        return max(self.minimum, share)
+
+    def record(self, chunk, planned, started, encoding):
+        self.runs.append((chunk, planned, time.monotonic() - started, encoding))
+
+    def elapsed(self):
+        '''
+            Wall-clock seconds since the start, including what is done between solver runs (e.g. backtracking)
+        '''
+        return time.monotonic() - self.start
+
+    def report(self):
+        print("chunk  planned    actual  encoding")
+        for (chunk, planned, actual, encoding) in self.runs:
+            print("{:5d} {:8.1f}s {:8.1f}s {:8.1f}s".format(chunk, planned if planned is not None else float("inf"), actual, encoding))
+        print("total {:>9} {:8.1f}s  ({:.1f}s wall-clock)".format("", sum(actual for (_, _, actual, _) in self.runs), self.elapsed()))
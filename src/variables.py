@@ -0,0 +1,143 @@
+import copy
+
+import numpy as np
+
+## Variable numbering for the MaxSat encoding ##
+#
+# Each family of variables gets one contiguous block of ids, and only for indices
+# that can actually be used: p, r and s are indexed by coupling-graph edges (plus
+# the "no swap" option for s) rather than by every pair of physical qubits, and
+# x only covers the live logical qubits. y holds the mappings between the swaps
+# of one step when the swap effect is encoded stepwise.
+#
+# The mapping (x, y), swap (s) and movement (w, d) variables are per step, the
+# placement of each CNOT (p, r) per CNOT. Without layering every CNOT is a step
+# of its own; with it, a step is a layer of CNOTs sharing one mapping.
+
+
+class VariableRegistry:
+    '''
+        Hands out integer ids for the variables of one MaxSat instance and maps them back
+    '''
+
+    def __init__(self, device, logNum, numCnots, swapNum, liveLog=None, stepOf=None):
+        self.physNum = device.physNum
+        self.logNum = logNum
+        self.numCnots = numCnots
+        self.swapNum = swapNum
+        # stepOf[k] is the step of the k-th CNOT
+        self.stepOf = np.arange(numCnots) if stepOf is None else np.asarray(stepOf, dtype=int)
+        self.numSteps = int(self.stepOf[-1]) + 1 if numCnots else 0
+        self.edges = device.edges
+        # swap option len(edges) is the "no swap" choice, written as (0, 0)
+        self.swaps = np.append(self.edges, [[0, 0]], axis=0)
+        self.edgeIndex = device.edgeIndex
+        self.swapIndex = np.copy(self.edgeIndex)
+        if self.swapIndex[0, 0] < 0:
+            self.swapIndex[0, 0] = len(self.edges)
+        self.live = np.asarray(range(logNum) if liveLog is None else sorted(liveLog), dtype=int)
+        self.liveIndex = np.full(logNum, -1)
+        self.liveIndex[self.live] = np.arange(len(self.live))
+        self.families = {}
+        self.auxShapes = {}
+        self.numVars = 0
+
+    def shape(self, kind):
+        if kind in self.auxShapes:
+            return self.auxShapes[kind]
+        numEdges = len(self.edges)
+        return {"p" : (numEdges, self.numCnots),
+                "r" : (numEdges, self.numCnots),
+                "x" : (self.physNum, len(self.live), self.numSteps),
+                "y" : (self.physNum, len(self.live), max(self.swapNum - 1, 0), self.numSteps),
+                "s" : (numEdges + 1, self.swapNum, self.numSteps),
+                "w" : (self.physNum, self.physNum, self.numSteps),
+                "d" : (self.logNum, self.numSteps)}[kind]
+
+    def declare(self, *kinds):
+        '''
+            Allocates a block of ids for each family that is not numbered yet
+        '''
+        for kind in kinds:
+            if kind not in self.families:
+                shape = self.shape(kind)
+                self.families[kind] = (self.numVars, shape)
+                self.numVars += int(np.prod(shape))
+        return self
+
+    def copy(self):
+        '''
+            A registry numbering the same variables, to which more can be declared without changing this one
+        '''
+        other = copy.copy(self)
+        (other.families, other.auxShapes) = (dict(self.families), dict(self.auxShapes))
+        return other
+
+    def declareAux(self, kind, shape):
+        '''
+            Allocates a block of auxiliary variables (e.g. for cardinality encodings) of any shape
+        '''
+        self.auxShapes[kind] = tuple(shape)
+        return self.declare(kind)
+
+    def block(self, kind):
+        '''
+            All ids of one family, in its shape
+        '''
+        (offset, shape) = self.families[kind]
+        return np.arange(offset + 1, offset + 1 + int(np.prod(shape))).reshape(shape)
+
+    def compact(self, kind, indices):
+        if kind in ("p", "r"):
+            (u, v, k) = indices
+            return (self.edgeIndex[u, v], k)
+        elif kind == "s":
+            (u, v, t, k) = indices
+            return (self.swapIndex[u, v], t, k)
+        elif kind in ("x", "y"):
+            (i, j, *rest) = indices
+            return (i, self.liveIndex[j], *rest)
+        return tuple(indices)
+
+    def expand(self, kind, indices):
+        if kind in ("p", "r"):
+            (e, k) = indices
+            return (self.edges[e, 0], self.edges[e, 1], k)
+        elif kind == "s":
+            (o, t, k) = indices
+            return (self.swaps[o, 0], self.swaps[o, 1], t, k)
+        elif kind in ("x", "y"):
+            (i, j, *rest) = indices
+            return (i, self.live[j], *rest)
+        return tuple(indices)
+
+    def ids(self, kind, indices, negated=False):
+        '''
+            Converts (broadcastable arrays of) indices of one family into integer literals
+        '''
+        (offset, shape) = self.families[kind]
+        pos = np.ravel_multi_index(self.compact(kind, indices), shape) + offset + 1
+        return -pos if negated else pos
+
+    def flattenedIndex(self, lit):
+        '''
+            Converts the tuple representation of a literal into an integer
+        '''
+        return int(self.ids(lit[1], lit[2:], negated=lit[0]))
+
+    def flattenedClause(self, clause):
+        return [self.flattenedIndex(lit) for lit in clause]
+
+    def unravel(self, flatLits):
+        '''
+            Converts integer literals back into their tuple representation (flipped, kind, indices)
+        '''
+        flatLits = np.asarray(flatLits, dtype=int)
+        shifted = np.abs(flatLits) - 1
+        decoded = [None] * len(flatLits)
+        for (kind, (offset, shape)) in self.families.items():
+            positions = np.flatnonzero((shifted >= offset) & (shifted < offset + np.prod(shape)))
+            indices = self.expand(kind, np.unravel_index(shifted[positions] - offset, shape))
+            for (n, pos) in enumerate(positions.tolist()):
+                decoded[pos] = (bool(flatLits[pos] < 0), kind, tuple(int(index[n]) for index in indices))
+        return [lit for lit in decoded if lit is not None]
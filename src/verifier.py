@@ -0,0 +1,161 @@
+'''
+    Checks that a mapped circuit implements the original one on a device: every two-qubit gate and swap acts on
+    an edge, and apart from the swaps (and barriers) the mapped circuit is the original's gates in their order,
+    each on the physical qubits its logical qubits are on at that point. The layout is not needed: it is replayed
+    from the swaps as a permutation, and inferred from the gates. A swap in the original is the same operation as a
+    routing swap, so it is compared as one: the original's swaps are folded into the qubits of the gates after them.
+
+    $ python3 src/satmap.py verify examples/jku_constraint_based tmp/batch/tokyo --arch tokyo
+
+    checks every mapped_<name>.qasm under the second directory against <name>.qasm in the first (a directory or
+    a manifest of circuits, as for batch runs).
+'''
+import argparse
+import os
+import sys
+
+import numpy as np
+
+import architectures
+import program
+
+MODES = ["off", "sample", "full"]
+# gates compared in sample mode
+SAMPLE = 1000
+
+
+def operandIndices(prog, gates):
+    '''
+        The positions in prog.qubits of the operands of gates, gate by gate
+    '''
+    counts = prog.arity[gates]
+    firsts = np.repeat(prog.offsets[gates] - np.cumsum(counts) + counts, counts)
+    return firsts + np.arange(counts.sum())
+
+def layoutOrigins(mapped, physNum):
+    '''
+        The physical qubit each operand of mapped started out on (-1 for the swaps' own), undoing the swaps before it
+    '''
+    swapGates = np.flatnonzero(mapped.ops == mapped.names.index("swap")) if "swap" in mapped.names else np.zeros(0, dtype=int)
+    origin = np.full(len(mapped.qubits), -1)
+    # start[p] is the physical qubit whose initial content is now on p
+    start = np.arange(physNum)
+    firsts = mapped.offsets[np.concatenate(([0], swapGates + 1))].tolist()
+    lasts = mapped.offsets[np.concatenate((swapGates, [len(mapped)]))].tolist()
+    for (i, (first, last)) in enumerate(zip(firsts, lasts)):
+        origin[first:last] = start[mapped.qubits[first:last]]
+        if i < len(swapGates):
+            (u, v) = mapped.operands(swapGates[i])
+            start[[u, v]] = start[[v, u]]
+    return origin
+
+def withoutSwaps(prog):
+    '''
+        prog without its swaps, each gate after them on the qubit that holds the state of its own then instead
+    '''
+    if "swap" not in prog.names:
+        return prog
+    swapGates = np.flatnonzero(prog.ops == prog.names.index("swap"))
+    qubits = prog.qubits.copy()
+    # holder[q] is the qubit whose initial state is on q, after the swaps so far
+    holder = np.arange(prog.qubitNum)
+    ends = prog.offsets[np.append(swapGates[1:], len(prog))].tolist()
+    for (gate, end) in zip(swapGates.tolist(), ends):
+        (u, v) = prog.operands(gate)
+        holder[[u, v]] = holder[[v, u]]
+        first = prog.offsets[gate + 1]
+        qubits[first:end] = holder[prog.qubits[first:end]]
+    kept = prog.ops != prog.names.index("swap")
+    return program.Program(prog.qubitNum, prog.clbitNum, prog.names, prog.ops[kept],
+                           np.concatenate(([0], np.cumsum(prog.arity[kept]))), qubits[np.repeat(kept, prog.arity)],
+                           prog.clbits[kept])
+
+def verify(original, mapped, cm, sample=None, seed=None):
+    '''
+        The ways in which mapped fails to implement original on the device cm, none if it does. With sample, only
+        that many randomly chosen gates are compared with the original (adjacency is always checked throughout).
+    '''
+    device = architectures.asDevice(cm)
+    original = withoutSwaps(original)
+    if len(mapped.qubits) and mapped.qubits.max() >= device.physNum:
+        return ["uses qubit {} of a {}-qubit device".format(mapped.qubits.max(), device.physNum)]
+    problems = []
+    isSwap = mapped.ops == (mapped.names.index("swap") if "swap" in mapped.names else -1)
+    pairs = mapped.offsets[:-1][(mapped.arity == 2) & (mapped.ops != mapped.barrier)]
+    offEdge = np.flatnonzero(~device.isEdge(mapped.qubits[pairs], mapped.qubits[pairs + 1]))
+    if len(offEdge):
+        problems.append("{} two-qubit gates or swaps not on an edge, the first ({}, {})".format(len(offEdge), *mapped.qubits[[pairs[offEdge[0]], pairs[offEdge[0]] + 1]]))
+
+    mappedGates = np.flatnonzero(~isSwap & (mapped.ops != mapped.barrier))
+    originalGates = np.flatnonzero(original.ops != original.barrier)
+    if len(mappedGates) != len(originalGates):
+        return problems + ["has {} gates other than swaps and barriers, the original {}".format(len(mappedGates), len(originalGates))]
+    if sample is not None and sample < len(mappedGates):
+        chosen = np.sort(np.random.default_rng(seed).choice(len(mappedGates), sample, replace=False))
+        (mappedGates, originalGates) = (mappedGates[chosen], originalGates[chosen])
+    names = np.array(mapped.names, dtype=object)[mapped.ops[mappedGates]]
+    differ = np.flatnonzero((names != np.array(original.names, dtype=object)[original.ops[originalGates]]) |
+                            (mapped.arity[mappedGates] != original.arity[originalGates]) |
+                            (mapped.clbits[mappedGates] != original.clbits[originalGates]))
+    if len(differ):
+        # the operands no longer line up
+        j = differ[0]
+        return problems + ["{} gates differ from the original, the first is {} where the original has {}".format(
+            len(differ), mapped.statement(mappedGates[j]), original.statement(originalGates[j]))]
+
+    # each initial physical qubit must hold one logical qubit throughout, and each logical qubit start on one
+    slots = layoutOrigins(mapped, device.physNum)[operandIndices(mapped, mappedGates)]
+    logs = original.qubits[operandIndices(original, originalGates)]
+    placements = np.unique(np.stack((slots, logs), axis=-1), axis=0)
+    (slotValues, slotCounts) = np.unique(placements[:, 0], return_counts=True)
+    if (slotCounts > 1).any():
+        slot = slotValues[np.argmax(slotCounts > 1)]
+        problems.append("physical qubit {} (initially) holds logical qubits {} at once".format(slot, placements[placements[:, 0] == slot, 1].tolist()))
+    (logValues, logCounts) = np.unique(placements[:, 1], return_counts=True)
+    if (logCounts > 1).any():
+        log = logValues[np.argmax(logCounts > 1)]
+        problems.append("logical qubit {} moves without a swap, between initial physical qubits {}".format(log, placements[placements[:, 1] == log, 0].tolist()))
+    return problems
+
+def check(original, mapped, cm, mode="full"):
+    '''
+        Raises an AssertionError if mapped does not implement original on cm. mode is one of MODES.
+    '''
+    if mode == "off":
+        return
+    problems = verify(original, mapped, cm, sample=SAMPLE if mode == "sample" else None)
+    assert not problems, "Invalid solution: " + "; ".join(problems)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog="satmap.py verify")
+    parser.add_argument("originals", help="directory of the original .qasm files or manifest listing them")
+    parser.add_argument("results", help="directory searched (recursively) for mapped_<name>.qasm files")
+    parser.add_argument("-a", "--arch", required=True, help="name of qc architecture (or adjacency matrix file)")
+    parser.add_argument("--sample", type=int, help="compare only this many randomly chosen gates of each circuit")
+    args = parser.parse_args(argv)
+
+    import batch
+    import satmap
+    cm = architectures.asDevice(satmap.loadArchitecture(args.arch))
+    originals = {os.path.basename(path) : path for path in batch.findCircuits(args.originals)}
+    failed = 0
+    for (root, _, files) in sorted(os.walk(args.results)):
+        for name in sorted(files):
+            if not (name.startswith("mapped_") and name.endswith(".qasm")):
+                continue
+            (path, original) = (os.path.join(root, name), name[len("mapped_"):])
+            if original not in originals:
+                print("{}: no original {}".format(path, original))
+                failed += 1
+                continue
+            try:
+                problems = verify(program.load(originals[original]), program.load(path), cm, sample=args.sample)
+            except ValueError as e:
+                problems = [str(e)]
+            print("{}: {}".format(path, "; ".join(problems) if problems else "ok"))
+            failed += bool(problems)
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
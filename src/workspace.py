@@ -0,0 +1,31 @@
+import os
+import shutil
+import tempfile
+
+## Scratch files of one run ##
+
+
+class Workspace:
+    '''
+        The directory one run keeps its scratch files in: the rewritten program, the chunks' instances and solver
+        outputs, and the input of the Haskell router. Without a root it is a fresh temporary directory, removed by
+        cleanup (or when leaving a with block); a root that is given is created if needed and kept.
+    '''
+
+    def __init__(self, root=None):
+        self.owned = root is None
+        self.root = tempfile.mkdtemp(prefix="satmap-") if root is None else root
+        os.makedirs(self.root, exist_ok=True)
+
+    def path(self, name):
+        return os.path.join(self.root, name)
+
+    def cleanup(self):
+        if self.owned:
+            shutil.rmtree(self.root, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cleanup()
@@ -0,0 +1,16 @@
+import os
+import sys
+
+import pytest
+
+# the modules in src/ import each other by name, as when satmap.py is run as a script
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import architectures
+
+
+@pytest.fixture(autouse=True)
+def isolated_cache(tmp_path, monkeypatch):
+    # keep the caches tests write (templates, automorphisms, chunks) out of ~/.cache/satmap
+    monkeypatch.setenv("SATMAP_CACHE", str(tmp_path))
+    monkeypatch.setattr(architectures, "CACHE_DIR", str(tmp_path))
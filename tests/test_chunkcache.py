@@ -0,0 +1,57 @@
+import architectures
+import chunkcache
+import satmap
+from model import Model, solutionOutput
+
+
+GRID = architectures.Device(architectures.gridArch(3).toarray())
+MODE = ["sequence", False, None]
+
+
+def instance(cnots, logNum, boundary, symmetries=None):
+    return chunkcache.ChunkInstance(cnots, logNum, boundary, GRID, 1, MODE, symmetries)
+
+
+def test_key_ignores_logical_numbering():
+    first = instance([(0, 1), (1, 2)], 3, [0, 1, 2])
+    # the same chunk with logical qubits 0 and 2 exchanged
+    renamed = instance([(2, 1), (1, 0)], 3, [2, 1, 0])
+    assert first.key == renamed.key
+    assert first.key != instance([(0, 1), (1, 2)], 3, [0, 1, 5]).key
+
+def test_key_up_to_symmetries():
+    # on a 3x3 grid, mirroring the columns maps qubit 0 to 2 and 3 to 5
+    assert instance([(0, 1)], 2, [0, 3], GRID.automorphisms).key == instance([(0, 1)], 2, [2, 5], GRID.automorphisms).key
+    assert instance([(0, 1)], 2, [0, 3]).key != instance([(0, 1)], 2, [2, 5]).key
+
+def test_entry_round_trip():
+    cnots = [(0, 1), (1, 2)]
+    registry = satmap.solutionRegistry(GRID, 3, 1, satmap.stepsOf(cnots, False))
+    # start on 2, 5, 0 (qubits 0 and 2 are not neighbors), swap 0 and 1 before the second CNOT
+    model = Model.fromOutput(registry, solutionOutput(registry, [[2, 5, 0], [2, 5, 1]], [[], [(0, 1)]], 1))
+    entry = instance(cnots, 3, None, GRID.automorphisms).entry(model, 1)
+    # the same chunk with logical qubits 0 and 2 exchanged gets the solution with them exchanged
+    renamed = instance([(2, 1), (1, 0)], 3, None, GRID.automorphisms)
+    restored = Model.fromOutput(registry, renamed.output(registry, entry))
+    assert restored.mappings().tolist() == [[0, 5, 2], [1, 5, 2]]
+    assert restored.swaps_at(1).tolist() == [[0, 1]]
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    cache = chunkcache.ChunkCache(str(tmp_path / "chunks.sqlite"), maxSize=2)
+    for key in "abc":
+        cache.put(key, {"cost" : key})
+        if key == "b":
+            assert cache.get("a") == {"cost" : "a"}
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == ({"cost" : "a"}, {"cost" : "c"})
+    assert cache.stats() == {"hits" : 3, "misses" : 1, "stores" : 3, "evictions" : 1}
+
+def test_create_modes(tmp_path, monkeypatch):
+    monkeypatch.setattr(architectures, "CACHE_DIR", str(tmp_path))
+    assert chunkcache.create() is None
+    memory = chunkcache.create("memory")
+    memory.put("a", {})
+    assert memory.path == ":memory:" and not list(tmp_path.iterdir())
+    disk = chunkcache.create("disk")
+    disk.put("a", {})
+    assert chunkcache.create("disk").get("a") == {}
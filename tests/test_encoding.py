@@ -0,0 +1,143 @@
+import io
+
+import numpy as np
+import pytest
+from pysat.examples.rc2 import RC2
+from pysat.formula import WCNF
+from pysat.solvers import Solver
+
+import architectures
+from cardinality import atMostOne, auxCount, exactlyOne
+import satmap
+
+
+def encode(logNum, cnots, cm, swapNum, **options):
+    f = io.StringIO()
+    (mirror, registry) = satmap.generateAndWriteClauses(logNum, cnots, cnots, cm, swapNum, [], f, mirror="eager", **options)
+    return (f.getvalue(), mirror, registry)
+
+def clauses(wcnf):
+    '''
+        The header's variable count and the literals of every clause (weight left out)
+    '''
+    (header, *lines) = wcnf.splitlines()
+    return (int(header.split()[2]), [np.array(line.split()[1:-1], dtype=int) for line in lines])
+
+
+@pytest.mark.parametrize("swapEncoding", ["sequence", "stepwise"])
+@pytest.mark.parametrize("cardinality", satmap.ENCODINGS)
+@pytest.mark.parametrize("logNum, cnots, swapCap", [
+    (3, [], None),                     # a slice without CNOTs
+    (1, [[0, 0]], None),               # a single logical qubit
+    (2, [[0, 1], [1, 0]], 1),          # a swap cap at least the number of swap slots
+])
+def test_edge_cases_encode(logNum, cnots, swapCap, swapEncoding, cardinality):
+    (wcnf, mirror, registry) = encode(logNum, cnots, architectures.linearArch(4), 1, swapEncoding=swapEncoding, cardinality=cardinality, swapCap=swapCap)
+    mirror.delete()
+    (numVars, lits) = clauses(wcnf)
+    assert numVars == registry.numVars
+    assert all(np.abs(clause).max(initial=0) <= numVars for clause in lits)
+
+def test_swap_cap_keeps_template():
+    cm = architectures.linearArch(4)
+    cnots = [[0, 1], [1, 2], [0, 2]]
+    templates = satmap.TemplateCache()
+    registries = [satmap.generateAndWriteClauses(3, cnots, cnots, cm, 1, [], io.StringIO(), mirror="off", swapCap=cap, templates=templates)[1]
+                  for cap in (None, 1, 2)]
+    assert (templates.hits, templates.misses) == (2, 1)
+    # the cap's variables come after the template's, which the cached registry does not number
+    assert "cap_aux" not in registries[0].families
+    assert registries[1].numVars > registries[0].numVars
+
+def test_template_keeps_mirror_blocks_only_with_a_mirror():
+    cm = architectures.linearArch(4)
+    cnots = [[0, 1], [1, 2], [0, 2]]
+    templates = satmap.TemplateCache()
+    for mirror in ("off", "lazy", "eager", "off"):
+        (solver, _) = satmap.generateAndWriteClauses(3, cnots, cnots, cm, 1, [], io.StringIO(), mirror=mirror, templates=templates)
+        if solver:
+            solver.delete()
+    assert (templates.hits, templates.misses) == (2, 2)
+    assert sorted(template[4] is None for template in templates.templates.values()) == [False, True]
+
+@pytest.mark.parametrize("swapCap, satisfiable", [(1, True), (0, False)])
+def test_swap_cap_limits_swaps(swapCap, satisfiable):
+    # three qubits interacting pairwise cannot all be neighbors on a line without a swap
+    (_, mirror, _) = encode(3, [[0, 1], [0, 2], [1, 2]], architectures.linearArch(3), 1, swapCap=swapCap)
+    assert mirror.solve(assumptions=[]) == satisfiable
+    mirror.delete()
+
+def test_swap_lower_bound_uses_undirected_distance():
+    # 0 -> 1 <- 2, and 3 on its own
+    cm = np.zeros((4, 4), dtype=int)
+    cm[0, 1] = cm[2, 1] = 1
+    device = architectures.Device(cm)
+    assert satmap.swapLowerBound(device, {0 : 0, 1 : 2}, [(0, 1)]) == 1
+    assert satmap.swapLowerBound(device, {0 : 0, 1 : 3}, [(0, 1)]) == 0
+
+def optimum(wcnf):
+    with RC2(WCNF(from_string=wcnf)) as rc2:
+        return rc2.cost if rc2.compute() is not None else None
+
+@pytest.mark.parametrize("cnots", [
+    [[0, 1], [0, 2], [1, 2]],
+    [[0, 1], [2, 3], [0, 3], [1, 2], [0, 2]],
+])
+def test_swap_encodings_agree_on_the_optimum(cnots):
+    costs = []
+    for swapEncoding in ("sequence", "stepwise"):
+        f = io.StringIO()
+        satmap.generateAndWriteClauses(4, cnots, cnots, architectures.linearArch(4), 2, [], f, mirror="off", swapEncoding=swapEncoding)
+        costs.append(optimum(f.getvalue()))
+    assert costs[0] is not None and costs[0] == costs[1]
+
+def projectedModels(clauses, n):
+    '''
+        The assignments of literals 1..n (as tuples of booleans) that some model of clauses extends
+    '''
+    models = set()
+    with Solver(name="cd", bootstrap_with=clauses) as solver:
+        while solver.solve():
+            model = solver.get_model()[:n]
+            models.add(tuple(lit > 0 for lit in model))
+            solver.add_clause([-lit for lit in model])
+    return models
+
+@pytest.mark.parametrize("n", [1, 2, 3, 5])
+@pytest.mark.parametrize("cardinality", satmap.ENCODINGS)
+def test_cardinality_encodings_have_the_same_models(cardinality, n):
+    lits = np.arange(1, n + 1)[None]
+    aux = np.arange(n + 1, n + 1 + auxCount(cardinality, n))[None]
+    # n variables, so that solvers and models number them all
+    declared = [[lit, -lit] for lit in range(1, n + 1 + aux.shape[1])]
+    singles = {tuple(i == j for i in range(n)) for j in range(n)}
+    for (encode, expected) in ((atMostOne, singles | {(False,) * n}), (exactlyOne, singles)):
+        clauses = [clause.tolist() for block in encode(cardinality, lits, aux) for clause in block[0]]
+        assert projectedModels(declared + clauses, n) == expected
+
+def test_swap_lower_bound_is_at_most_the_optimum():
+    cm = architectures.linearArch(4)
+    cnots = [[0, 2], [0, 1], [1, 2], [0, 1]]
+    # logical 0 and 1 start three apart
+    boundary = {0 : 0, 1 : 3, 2 : 1}
+    fixed = [[(False, "x", phys, log, 0)] for (log, phys) in boundary.items()]
+    f = io.StringIO()
+    satmap.generateAndWriteClauses(3, cnots, cnots, cm, 2, fixed, f, mirror="off")
+    lowerBound = satmap.swapLowerBound(architectures.Device(cm), boundary, cnots)
+    assert lowerBound == 2
+    assert lowerBound <= optimum(f.getvalue())
+
+def test_mapping_core_is_unsatisfiable():
+    # logical 0 and 1 start apart, but their CNOT is the first
+    (_, mirror, registry) = encode(3, [[0, 1], [1, 2]], architectures.linearArch(4), 1)
+    initialMapping = [[(False, "x", phys, log, 0)] for (log, phys) in enumerate([0, 3, 1])]
+    (core, found) = satmap.extractMappingCore(mirror, initialMapping, registry)
+    assert core and all(clause in initialMapping for clause in core) and len(core) <= found
+    assert not mirror.solve(assumptions=[registry.flattenedIndex(clause[0]) for clause in core])
+    mirror.delete()
+
+def test_mapping_core_is_empty_without_any_solution():
+    (_, mirror, registry) = encode(3, [[0, 1], [0, 2], [1, 2]], architectures.linearArch(3), 1, swapCap=0)
+    initialMapping = [[(False, "x", phys, log, 0)] for (log, phys) in enumerate([0, 1, 2])]
+    assert satmap.extractMappingCore(mirror, initialMapping, registry)[0] == []
+    mirror.delete()
@@ -0,0 +1,76 @@
+import numpy as np
+
+import architectures
+import greedy
+import program
+import satmap
+
+
+LINE = architectures.Device(architectures.linearArch(5))
+
+
+def check(device, cnots, result, swapNum=None):
+    '''
+        Asserts that result routes cnots (one per step): the mappings are injective, each follows from the one
+        before by its swaps, which are on edges and at most swapNum, and each step's CNOT is on an edge
+    '''
+    (mappings, swaps) = result
+    assert len(mappings) == len(swaps) == len(cnots)
+    for (k, (mapping, (c, t))) in enumerate(zip(mappings, cnots)):
+        assert len(set(mapping.tolist())) == len(mapping)
+        assert device.undirectedDistance[mapping[c], mapping[t]] == 1
+        if k:
+            before = mappings[k-1].copy()
+            for (u, v) in swaps[k]:
+                assert device.undirectedDistance[u, v] == 1
+                before = np.where(before == u, v, np.where(before == v, u, before))
+            assert before.tolist() == mapping.tolist()
+            assert swapNum is None or len(swaps[k]) <= swapNum
+
+
+def test_initial_mapping_places_partners_together():
+    mapping = greedy.initialMapping(LINE, [(0, 1), (1, 2)], 4)
+    assert sorted(mapping.tolist()) == sorted(set(mapping.tolist()))
+    assert LINE.undirectedDistance[mapping[0], mapping[1]] == 1
+    assert LINE.undirectedDistance[mapping[1], mapping[2]] == 1
+
+def test_initial_mapping_completes_a_partial_one():
+    mapping = greedy.initialMapping(LINE, [(0, 2)], 3, partial=[0, 1, -1])
+    assert mapping.tolist()[:2] == [0, 1] and mapping[2] not in (0, 1)
+
+def test_route_within_swap_limit():
+    cnots = [(0, 1), (0, 2), (1, 2), (0, 3)]
+    result = greedy.route(LINE, cnots, np.arange(len(cnots)), 4, 2)
+    check(LINE, cnots, result, swapNum=2)
+
+def test_route_from_boundary():
+    # 0 and 1 at the ends of the line, 2 first used here
+    cnots = [(0, 1), (1, 2)]
+    result = greedy.route(LINE, cnots, np.arange(2), 3, None, boundary=[0, 4, -1], leading=True)
+    check(LINE, cnots, (result[0], [[]] + result[1][1:]))
+    assert len(result[1][0]) == 3
+
+def test_leading_swaps_without_limit():
+    # 0 and 1 at the ends of the line: only swaps before the first step bring them together, as many as it takes
+    assert greedy.route(LINE, [(0, 1)], [0], 2, None, boundary=[0, 4]) is None
+    (mappings, swaps) = greedy.route(LINE, [(0, 1), (0, 1)], [0, 1], 2, None, boundary=[0, 4], leading=True)
+    assert len(swaps[0]) == 3 and swaps[1] == []
+    assert LINE.undirectedDistance[mappings[0][0], mappings[0][1]] == 1
+
+def test_route_fails_without_enough_swaps():
+    # no swaps before the first step, and 0 and 1 start apart
+    assert greedy.route(LINE, [(0, 1)], [0], 2, 1, boundary=[0, 4]) is None
+
+def test_solution_output_is_a_model():
+    cnots = [(0, 1), (0, 2), (1, 2)]
+    stepOf = satmap.stepsOf(cnots, False)
+    (mappings, swaps) = greedy.route(LINE, cnots, stepOf, 3, 1)
+    registry = satmap.solutionRegistry(LINE, 3, 1, stepOf)
+    model = satmap.readModel(registry, satmap.solutionOutput(registry, mappings, swaps, 1))
+    assert model.mappings().tolist() == mappings.tolist()
+
+def test_transpile_without_two_qubit_gates(tmp_path):
+    prog = program.parse('OPENQASM 2.0;\ninclude "qelib1.inc";\nqreg q[3];\nh q[0];\nrz(0.5) q[2];\nx q[1];\n')
+    (stats, qasm) = satmap.transpile(prog, LINE.cm, workspace=None)
+    assert stats["cost"] == 0
+    assert [prog.statement(i) for i in range(len(prog))] == qasm.splitlines()[4:]
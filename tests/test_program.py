@@ -0,0 +1,65 @@
+import pytest
+
+import program
+
+
+HEADER = 'OPENQASM 2.0;\ninclude "qelib1.inc";\n'
+
+
+def parse(body, **options):
+    return program.parse(HEADER + body, **options)
+
+def gates(prog):
+    return [prog.statement(i) for i in range(len(prog))]
+
+
+def test_registers_are_numbered_in_order():
+    prog = parse("qreg a[2];\nqreg b[3];\ncreg c[1];\ncx a[1], b[0];\nh b[2];\n")
+    assert (prog.qubitNum, prog.clbitNum) == (5, 1)
+    assert gates(prog) == ["cx q[1],q[2];", "h q[4];"]
+    assert prog.cnots() == [(1, 2)]
+    assert prog.logNum == 5
+
+def test_parameters_and_comments():
+    prog = parse("qreg q[2];\n// rz(pi) q[0];\nu3(0.1, -pi/2, 15/(7*pi)) q[0];\ncx q[0],q[1]; // done\n")
+    assert gates(prog) == ["u3(0.1,-pi/2,15/(7*pi)) q[0];", "cx q[0],q[1];"]
+
+def test_register_operands_expand():
+    prog = parse("qreg q[2];\nqreg r[2];\ncreg c[2];\nh q;\ncx q, r;\ncx q[0], r;\nmeasure q -> c;\nx r[0];\n", keepFinalMeasurements=True)
+    assert gates(prog) == ["h q[0];", "h q[1];", "cx q[0],q[2];", "cx q[1],q[3];", "cx q[0],q[2];", "cx q[0],q[3];",
+                           "measure q[0] -> c[0];", "measure q[1] -> c[1];", "x q[2];"]
+
+def test_final_measurements_and_barriers_are_dropped():
+    prog = parse("qreg q[3];\ncreg c[3];\ncx q[0], q[1];\nbarrier q;\nmeasure q[0] -> c[0];\nh q[2];\nmeasure q[2] -> c[2];\n")
+    # the barrier comes before h on q[2], so it stays, and so does everything before it
+    assert gates(prog) == ["cx q[0],q[1];", "barrier q[0],q[1],q[2];", "h q[2];"]
+    assert prog.logNum == 3
+
+def test_barriers_are_not_interactions():
+    prog = parse("qreg q[3];\nbarrier q[0], q[2];\ncx q[1], q[2];\nh q[0];\n")
+    assert prog.interacting.tolist() == [False, True, False]
+
+def test_stray_quote_before_header():
+    prog = program.parse('"' + HEADER + "qreg q[2];\ncx q[0], q[1];\n")
+    assert gates(prog) == ["cx q[0],q[1];"]
+
+@pytest.mark.parametrize("body", [
+    "qreg q[2];\ncx q[0], r[1];\n",                   # undeclared register
+    "qreg q[1];\ngate g a { h a; }\n",                 # gate definitions
+    "qreg q[1];\n\"h q[0];\n",                         # a quote anywhere but the start
+    "qreg q[1];\ncreg c[1];\nif(c==1) x q[0];\n",       # classical control
+    "qreg q[1];\nrz(pi q[0];\n",                        # unbalanced parentheses
+])
+def test_unsupported_input_raises(body):
+    with pytest.raises(ValueError):
+        parse(body)
+
+@pytest.mark.parametrize("gate", ["ccx q[0], q[1], q[2];", "cswap q[0], q[1], q[2];", "ccx q, q, q;"])
+def test_gates_on_three_qubits_raise(gate):
+    with pytest.raises(ValueError, match="more than two qubits"):
+        parse("qreg q[3];\n" + gate + "\n")
+
+def test_qasm_round_trip():
+    prog = parse("qreg q[3];\ncreg c[1];\nrx(0.5) q[1];\ncx q[2], q[0];\nmeasure q[1] -> c[0];\ncx q[0], q[1];\n")
+    again = program.parse(prog.qasm())
+    assert gates(again) == gates(prog)
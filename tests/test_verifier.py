@@ -0,0 +1,66 @@
+import pytest
+
+import architectures
+import program
+import verifier
+
+
+HEADER = 'OPENQASM 2.0;\ninclude "qelib1.inc";\n'
+# 0 - 1 - 2 - 3
+LINE = architectures.linearArch(4)
+ORIGINAL = program.parse(HEADER + "qreg q[3];\ncreg c[3];\nh q[0];\ncx q[0], q[1];\ncx q[0], q[2];\nmeasure q[2] -> c[2];\nx q[1];\n")
+
+
+def problems(body, **options):
+    return verifier.verify(ORIGINAL, program.parse(HEADER + "qreg q[4];\ncreg c[4];\n" + body), LINE, **options)
+
+
+def test_valid_mapping():
+    # logical 0, 1, 2 start on physical 1, 0, 2, so that the second CNOT needs no swap
+    assert problems("h q[1];\ncx q[1], q[0];\ncx q[1], q[2];\nmeasure q[2] -> c[2];\nx q[0];\n") == []
+
+def test_valid_mapping_with_swap():
+    # logical 0, 1, 2 start on 0, 1, 2; swapping 1 and 2 brings logical 2 next to logical 0, and logical 1 to 2
+    assert problems("h q[0];\ncx q[0], q[1];\nswap q[1], q[2];\ncx q[0], q[1];\nmeasure q[1] -> c[2];\nx q[2];\n") == []
+
+def test_gate_off_an_edge():
+    (problem,) = problems("h q[0];\ncx q[0], q[1];\ncx q[0], q[2];\nmeasure q[2] -> c[2];\nx q[1];\n")
+    assert "not on an edge" in problem
+
+def test_qubit_moved_without_swap():
+    # logical 1 starts on 1, but the last gate finds it on 3
+    found = problems("h q[0];\ncx q[0], q[1];\nswap q[1], q[2];\ncx q[0], q[1];\nmeasure q[1] -> c[2];\nx q[3];\n")
+    assert any("moves without a swap" in problem for problem in found)
+
+def test_different_gates():
+    (problem,) = problems("h q[0];\ncx q[0], q[1];\nswap q[1], q[2];\ncx q[0], q[1];\nmeasure q[1] -> c[2];\ny q[2];\n")
+    assert "differ from the original" in problem
+
+def test_missing_gate():
+    (problem,) = problems("h q[0];\ncx q[0], q[1];\n")
+    assert "gates other than swaps and barriers" in problem
+
+def test_qubit_beyond_device():
+    found = verifier.verify(ORIGINAL, program.parse(HEADER + "qreg q[5];\nh q[4];\n"), LINE)
+    assert found == ["uses qubit 4 of a 4-qubit device"]
+
+def test_sample_checks_adjacency_throughout():
+    found = problems("h q[0];\ncx q[0], q[1];\ncx q[0], q[2];\nmeasure q[2] -> c[2];\nx q[1];\n", sample=1, seed=0)
+    assert any("not on an edge" in problem for problem in found)
+
+def test_check_raises():
+    mapped = program.parse(HEADER + "qreg q[4];\ncreg c[4];\nh q[0];\n")
+    with pytest.raises(AssertionError):
+        verifier.check(ORIGINAL, mapped, LINE)
+    verifier.check(ORIGINAL, mapped, LINE, mode="off")
+
+def test_original_with_swap():
+    # after the original's swap, q[1] holds what q[0] did and the other way round
+    original = program.parse(HEADER + "qreg q[3];\nh q[0];\nswap q[0], q[1];\ncx q[1], q[2];\ncx q[0], q[1];\n")
+    mapped = lambda body: program.parse(HEADER + "qreg q[4];\n" + body)
+    assert verifier.verify(original, mapped("h q[0];\nswap q[0], q[1];\ncx q[1], q[2];\ncx q[0], q[1];\n"), LINE) == []
+    # a routing swap next to it still counts as one
+    assert verifier.verify(original, mapped("h q[0];\nswap q[0], q[1];\ncx q[1], q[2];\nswap q[2], q[3];\ncx q[0], q[1];\n"), LINE) == []
+    # without the swap, the CNOTs are on the wrong qubits
+    problems = verifier.verify(original, mapped("h q[0];\ncx q[1], q[2];\ncx q[0], q[1];\n"), LINE)
+    assert any("moves without a swap" in problem for problem in problems)